@@ -1,39 +1,32 @@
 import requests
+import contextvars
 import json
 import os
 import re
-from dotenv import load_dotenv
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import governor, json_repair, llm_cache, llm_recorder
+from .llm_client import get_client, get_config
+from .chunking import split_text, merge_graphs, stable_node_id
+from .streaming import current_sink, IncrementalNodeParser
 
 import urllib3
 urllib3.disable_warnings()
 
-# Load env in service as well to be safe, though settings loads it
-load_dotenv()
-
-# API Keys and Endpoints
+# API Keys and Endpoints (Ark config is loaded once by llm_client from settings)
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
-ARK_API_KEY = os.environ.get("ARK_API_KEY", "")
-DOUBAO_ENDPOINT_ID = os.environ.get("DOUBAO_ENDPOINT_ID", "doubao-seed-1-6-flash-250828")
 
-DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
+# Long syllabi are chunked rather than truncated; this only guards against absurd inputs
+SYLLABUS_MAX_CHARS = getattr(settings, 'SYLLABUS_MAX_CHARS', 200000)
+REFINE_CHUNK_MAX_TOKENS = getattr(settings, 'REFINE_CHUNK_MAX_TOKENS', 8000)
+_chunk_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'CHUNK_WORKERS', 8), thread_name_prefix='piggy-chunk')
 
-def refine_syllabus_with_doubao(raw_text):
-    """
-    Uses Doubao (Ark) Agent to refine raw syllabus text into a clean, structured Markdown.
-    """
-    print(f"--- Calling Doubao Refiner Agent ---")
-    if not ARK_API_KEY:
-        print("ERROR: No Ark API Key found. Skipping refinement.")
-        return raw_text
-
-    try:
-        client = OpenAI(
-            api_key=ARK_API_KEY,
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
-        )
+DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
 
-        system_prompt = """
+REFINER_SYSTEM_PROMPT = """
         You are a Curriculum Data Specialist. Your task is to "dehydrate" and "structure" a messy course syllabus.
         
         ## Input
@@ -52,93 +45,157 @@ def refine_syllabus_with_doubao(raw_text):
         - Only give the output mentioned above 
         """
 
-        completion = client.chat.completions.create(
-            model=DOUBAO_ENDPOINT_ID,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Please refine this syllabus content:\n\n{raw_text[:30000]}"}
-            ],
-        )
+def refine_syllabus_with_doubao(raw_text, use_cache=True):
+    """
+    Uses Doubao (Ark) Agent to refine raw syllabus text into a clean, structured Markdown.
+    Long syllabi are split into parts that are refined in parallel and joined in order.
+    Identical inputs are answered from the LLM response cache.
+    """
+    print(f"--- Calling Doubao Refiner Agent ---")
+    config = get_config()
+    if not config.api_key:
+        print("ERROR: No Ark API Key found. Skipping refinement.")
+        return raw_text
 
-        refined_content = completion.choices[0].message.content
-        print(f"Refinement Success! Length: {len(refined_content)}")
-        return refined_content
-    except Exception as e:
-        print(f"Doubao Refinement Exception: {e}")
+    chunks = split_text(raw_text[:SYLLABUS_MAX_CHARS], REFINE_CHUNK_MAX_TOKENS)
+    if len(chunks) > 1:
+        print(f"Refining {len(chunks)} parts in parallel")
+
+    def refine_part(index_chunk):
+        index, chunk = index_chunk
+        if len(chunks) == 1:
+            user_prompt = f"Please refine this syllabus content:\n\n{chunk}"
+        else:
+            user_prompt = (
+                f"This is part {index + 1} of {len(chunks)} of one syllabus. "
+                f"Refine only this part and omit sections it does not contain:\n\n{chunk}"
+            )
+        return _refine_once(config, user_prompt, use_cache, index)
+
+    parts = map_parallel(refine_part, list(enumerate(chunks)))
+    if all(p is None for p in parts):
         return raw_text
+    # A failed part falls back to its raw text so no weeks are lost
+    return "\n\n".join(p if p is not None else chunks[i] for i, p in enumerate(parts))
 
-def call_doubao(system_prompt, user_prompt):
+def _refine_once(config, user_prompt, use_cache, part=0):
+    sink = current_sink()
+    on_delta = (lambda text: sink.refined_delta(part, text)) if sink else None
+
+    def produce():
+        try:
+            refined_content = _complete(config, [
+                {"role": "system", "content": REFINER_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ], on_delta, stage='refine')
+            print(f"Refinement Success! Length: {len(refined_content)}")
+            return refined_content
+        except Exception as e:
+            print(f"Doubao Refinement Exception: {e}")
+            return None
+
+    with llm_cache.bypass(not use_cache):
+        refined_content = llm_cache.cached_call(config.model, REFINER_SYSTEM_PROMPT, user_prompt, 'text', produce)
+    if sink and refined_content is not None:
+        # Cache hits never streamed, hand over the whole text at once
+        sink.refined_delta(part, refined_content)
+    return refined_content
+
+def _complete(config, messages, on_delta=None, stage='default'):
+    """
+    Runs a streaming chat completion under the stage's upstream limits and
+    returns the full content. on_delta(text_so_far) is called as chunks arrive.
+    Raises governor.UpstreamUnavailable when Ark is unhealthy or saturated.
+    """
+    return governor.call(stage, lambda timeout: _stream_completion(config, messages, on_delta, timeout))
+
+def _stream_completion(config, messages, on_delta, timeout):
+    stream = get_client().with_options(timeout=timeout).chat.completions.create(
+        model=config.model,
+        messages=messages,
+        stream=True,
+    )
+    pieces = []
+    last_emit = 0.0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            pieces.append(delta)
+            # Joining on every token is quadratic, so report progress at most every 100ms
+            if on_delta and time.monotonic() - last_emit >= 0.1:
+                last_emit = time.monotonic()
+                on_delta(''.join(pieces))
+    content = ''.join(pieces)
+    if on_delta:
+        on_delta(content)
+    llm_recorder.record(config.model, messages, content)
+    return content
+
+def map_parallel(func, items):
+    """
+    Runs func over items on the shared chunk pool and returns results in input order.
+    Exceptions become None so one failing chunk does not sink the rest.
+    """
+    if len(items) <= 1:
+        return [_safe_call(func, item) for item in items]
+    futures = [_chunk_executor.submit(contextvars.copy_context().run, _safe_call, func, item) for item in items]
+    return [f.result() for f in futures]
+
+def _safe_call(func, item):
+    try:
+        return func(item)
+    except Exception as e:
+        print(f"Chunk call failed: {e}")
+        return None
+
+def call_doubao(system_prompt, user_prompt, use_cache=True, on_delta=None, stage='default'):
     """
     Unified caller for Doubao (Ark) API to replace DeepSeek.
+    Successfully parsed responses are cached on (model, prompts); pass
+    use_cache=False to force a fresh upstream call.
+    on_delta(text_so_far) receives the raw streamed output on a cache miss.
+    stage selects the upstream limits (refine, extract, tasks, cross_links).
     """
+    with llm_cache.bypass(not use_cache):
+        return llm_cache.cached_call(
+            get_config().model, system_prompt, user_prompt, 'json',
+            lambda: _call_doubao_uncached(system_prompt, user_prompt, on_delta, stage),
+        )
+
+def _call_doubao_uncached(system_prompt, user_prompt, on_delta=None, stage='default'):
     print(f"--- Calling Doubao API (Replacement for DeepSeek) ---")
-    load_dotenv()
-    ark_key = os.environ.get("ARK_API_KEY", "")
-    # Using a slightly more powerful model for main analysis if possible, 
-    # but defaulting to the flash model provided by user
-    endpoint_id = os.environ.get("DOUBAO_ENDPOINT_ID", "doubao-seed-1-6-flash-250828")
+    config = get_config()
 
-    if not ark_key:
+    if not config.api_key:
         print("ERROR: No Ark API Key found.")
         return None
 
     try:
-        client = OpenAI(
-            api_key=ark_key,
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
-        )
-        
         # Doubao also benefits from JSON instruction
         system_prompt += "\n\nIMPORTANT: Return ONLY valid JSON."
 
-        completion = client.chat.completions.create(
-            model=endpoint_id,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            # Doubao supports response_format in newer versions, 
-            # but we use our manual parsing logic for safety
-        )
-
-        content = completion.choices[0].message.content
+        # Doubao supports response_format in newer versions, 
+        # but we use our manual parsing logic for safety
+        content = _complete(config, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ], on_delta, stage=stage)
         print(f"Doubao Success! Raw content preview: {content[:100]}...")
 
-        # --- Manual JSON Parsing (Enhanced for Doubao) ---
-        # 1. Strip potential Markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        content = content.strip()
-
-        # 2. FIX: Remove invalid control characters (like \n, \t inside strings that aren't escaped)
-        # This is likely causing the "Invalid control character" error
-        content = re.sub(r'[\x00-\x1F\x7F]', '', content)
-        
-        # 3. Basic cleanup for trailing commas
-        content = re.sub(r',\s*([\]}])', r'\1', content)
-            
+        # --- Tolerant JSON Parsing (fences, raw control chars, trailing commas) ---
         try:
-            parsed_json = json.loads(content)
-            print("JSON Parsing Successful.")
-            return parsed_json
-        except json.JSONDecodeError as je:
-            print(f"JSON Parsing Failed: {je}")
-            # Try a second-pass recovery by finding the first { and last }
-            start = content.find('{')
-            end = content.rfind('}')
-            if start != -1 and end != -1:
-                content_recovered = content[start:end+1]
-                try:
-                    parsed_json = json.loads(content_recovered)
-                    print("JSON Parsing Successful after extraction.")
-                    return parsed_json
-                except:
-                    print("JSON Parsing still failed after extraction.")
+            parsed_json, repairs = json_repair.parse(content)
+        except json_repair.JSONRepairError as je:
+            print(f"JSON Parsing Failed: {je} (repairs tried: {je.repairs})")
             print(f"Full problematic content: {content}")
             raise
+        if repairs:
+            print(f"JSON Parsing Successful after repairs: {', '.join(repairs)}")
+        else:
+            print("JSON Parsing Successful.")
+        return parsed_json
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -326,9 +383,54 @@ def extract_course_structure(syllabus_text, thinking_type):
         4. **Structure**: Non-hierarchical mesh. Show how different weeks/topics connect horizontally.
         """
     
-    user_prompt = f"Please analyze the following syllabus content and strictly generate structured data according to the above model requirements:\n\n{syllabus_text[:20000]}" 
-    
-    return call_doubao(system_prompt, user_prompt)
+    chunks = split_text((syllabus_text or '')[:SYLLABUS_MAX_CHARS])
+    if len(chunks) == 1:
+        user_prompt = f"Please analyze the following syllabus content and strictly generate structured data according to the above model requirements:\n\n{chunks[0]}" 
+        return _call_with_node_stream(system_prompt, user_prompt, remap_ids=False)
+
+    # Map: extract each part in parallel. Reduce: merge partial graphs deterministically.
+    print(f"Extracting structure from {len(chunks)} chunks in parallel")
+
+    def extract_part(index_chunk):
+        index, chunk = index_chunk
+        user_prompt = (
+            f"This is part {index + 1} of {len(chunks)} of one syllabus. "
+            f"Please analyze this part and strictly generate structured data according to the above model requirements. "
+            f"Use the overall course objective as the root node in every part:\n\n{chunk}"
+        )
+        # Ids are only unique per chunk, so streamed nodes use the merged (label-derived) ids
+        return _call_with_node_stream(system_prompt, user_prompt, remap_ids=True)
+
+    partials = map_parallel(extract_part, list(enumerate(chunks)))
+    if not any(partials):
+        return None
+    merged = merge_graphs(partials)
+    print(f"Merged {len(chunks)} chunks into {len(merged['nodes'])} nodes and {len(merged['edges'])} edges")
+    return merged
+
+def _call_with_node_stream(system_prompt, user_prompt, remap_ids):
+    """
+    call_doubao that forwards nodes to the current stream sink as soon as
+    each node object has been fully received.
+    """
+    sink = current_sink()
+    if not sink:
+        return call_doubao(system_prompt, user_prompt, stage='extract')
+
+    parser = IncrementalNodeParser()
+    emitted = []
+
+    def emit(nodes):
+        for n in nodes:
+            n['id'] = stable_node_id(n.get('label', '')) if remap_ids else str(n.get('id', ''))
+        emitted.extend(nodes)
+        sink.add_nodes(nodes)
+
+    result = call_doubao(system_prompt, user_prompt, on_delta=lambda text: emit(parser.feed(text)), stage='extract')
+    if result and not emitted:
+        # Cache hit: nothing streamed, send the parsed nodes in one go
+        emit([dict(n) for n in result.get('nodes', [])])
+    return result
 
 def generate_smart_tasks(course_name, nodes, count):
     """
@@ -349,7 +451,7 @@ def generate_smart_tasks(course_name, nodes, count):
     concepts_str = ", ".join([n['label'] for n in nodes[:10]]) # Use top 10 nodes context
     user_prompt = f"Course: {course_name}. Key Concepts: {concepts_str}. Generate {count} tasks that guide the student through these concepts logically."
     
-    return call_doubao(system_prompt, user_prompt)
+    return call_doubao(system_prompt, user_prompt, stage='tasks')
 
 def find_cross_connections(current_course_name, current_concepts, other_courses_data):
     """
@@ -373,7 +475,7 @@ def find_cross_connections(current_course_name, current_concepts, other_courses_
     others_str = json.dumps(other_courses_data)
     user_prompt = f"Current Course: {current_course_name}. Concepts: {current_concepts}. Previous Courses: {others_str}. Find relevant cross-course connections."
     
-    result = call_doubao(system_prompt, user_prompt)
+    result = call_doubao(system_prompt, user_prompt, stage='cross_links')
     if result:
         return result.get('cross_links', [])
     return []
@@ -0,0 +1,189 @@
+"""
+Token-aware chunking of syllabus text and deterministic merging of the
+partial graphs extracted from each chunk.
+
+Long syllabi are split on week/section headings so every chunk can be sent
+to the LLM in parallel instead of truncating the input.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+
+CHUNK_MAX_TOKENS = getattr(settings, 'CHUNK_MAX_TOKENS', 3000)
+
+# Markdown headings, "Week 3", "| Lecture 4 |", "第三周", "第5章" ...
+HEADING_RE = re.compile(
+    r'^\s*(#{1,6}\s|\|?\s*(week|lesson|lecture|module|unit|chapter|session|part)\s*\d+|第\s*[\d一二三四五六七八九十百]+\s*[周章讲课节])',
+    re.IGNORECASE,
+)
+CJK_RE = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+TABLE_SEPARATOR_RE = re.compile(r'^\s*\|?\s*:?-{3,}')
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate: CJK characters count about one token each,
+    everything else about four characters per token.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _sections(text):
+    """
+    Splits text into sections, each starting at a heading line.
+    """
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if HEADING_RE.match(line) and current:
+            sections.append(current)
+            current = []
+        current.append(line)
+    if current:
+        sections.append(current)
+    return sections
+
+
+def _section_prefix(lines):
+    """
+    Lines repeated at the top of every piece of an oversized section:
+    the heading, plus a Markdown table header if the section holds a table.
+    """
+    prefix = [lines[0]] if HEADING_RE.match(lines[0]) else []
+    for i, line in enumerate(lines[1:4], start=1):
+        if TABLE_SEPARATOR_RE.match(line) and lines[i - 1].lstrip().startswith('|'):
+            prefix = lines[:i + 1]
+            break
+    return prefix
+
+
+def split_text(text, max_tokens=None):
+    """
+    Returns a list of chunks, each within max_tokens where possible.
+    Sections are packed greedily in document order; a section that is
+    too large on its own is split by lines, repeating its heading.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    buffer = []
+    buffer_tokens = 0
+
+    def flush():
+        nonlocal buffer, buffer_tokens
+        if buffer:
+            chunks.append('\n'.join(buffer))
+        buffer = []
+        buffer_tokens = 0
+
+    context = [] # heading (and table header) of the enclosing Markdown section
+    for lines in _sections(text):
+        if lines[0].lstrip().startswith('#'):
+            context = _section_prefix(lines)
+        section_tokens = estimate_tokens('\n'.join(lines))
+        if section_tokens <= max_tokens:
+            if buffer_tokens + section_tokens > max_tokens:
+                flush()
+                # A week row continuing a table keeps the table's heading
+                if context and lines[:len(context)] != context:
+                    buffer = list(context)
+                    buffer_tokens = estimate_tokens('\n'.join(context))
+            buffer.extend(lines)
+            buffer_tokens += section_tokens
+            continue
+
+        # Oversized section: split by lines, keeping its heading in every piece
+        flush()
+        prefix = _section_prefix(lines)
+        prefix_tokens = estimate_tokens('\n'.join(prefix))
+        buffer = list(prefix)
+        buffer_tokens = prefix_tokens
+        for line in lines[len(prefix):]:
+            line_tokens = estimate_tokens(line) + 1
+            if buffer_tokens + line_tokens > max_tokens and len(buffer) > len(prefix):
+                flush()
+                buffer = list(prefix)
+                buffer_tokens = prefix_tokens
+            buffer.append(line)
+            buffer_tokens += line_tokens
+        flush()
+
+    flush()
+    return [c for c in chunks if c.strip()]
+
+
+def normalize_label(label):
+    label = re.sub(r'[\s_\-:：·•]+', ' ', str(label or '')).strip().lower()
+    return re.sub(r'[^\w\s]', '', label)
+
+
+def stable_node_id(label):
+    return 'n_' + hashlib.sha1(normalize_label(label).encode('utf-8')).hexdigest()[:10]
+
+
+def merge_graphs(partials):
+    """
+    Merges per-chunk extraction results ({nodes, edges, concepts}) in chunk
+    order. Nodes with the same normalized label collapse into one node with
+    a stable id derived from the label; edges are remapped and deduplicated.
+    In tree mode only the first level-0 root survives and later roots are
+    folded into it so the result stays a single tree.
+    """
+    nodes = []
+    edges = []
+    concepts = []
+    node_by_id = {}
+    seen_edges = set()
+    seen_concepts = set()
+    root_id = None
+
+    for partial in partials:
+        if not partial:
+            continue
+        id_map = {}
+        for node in partial.get('nodes', []):
+            label = node.get('label') or str(node.get('id', ''))
+            new_id = stable_node_id(label)
+            if node.get('level') == 0:
+                if root_id is None:
+                    root_id = new_id
+                else:
+                    new_id = root_id
+            id_map[str(node.get('id', ''))] = new_id
+            if new_id in node_by_id:
+                existing = node_by_id[new_id]
+                # Keep the shallowest level seen for the concept
+                if isinstance(node.get('level'), int) and (not isinstance(existing.get('level'), int) or node['level'] < existing['level']):
+                    existing['level'] = node['level']
+                continue
+            merged = dict(node)
+            merged['id'] = new_id
+            node_by_id[new_id] = merged
+            nodes.append(merged)
+
+        for edge in partial.get('edges', []):
+            source = id_map.get(str(edge.get('from', '')))
+            target = id_map.get(str(edge.get('to', '')))
+            if not source or not target or source == target:
+                continue
+            if (source, target) in seen_edges:
+                continue
+            seen_edges.add((source, target))
+            merged = dict(edge)
+            merged['from'] = source
+            merged['to'] = target
+            edges.append(merged)
+
+        for concept in partial.get('concepts', []):
+            key = normalize_label(concept)
+            if key and key not in seen_concepts:
+                seen_concepts.add(key)
+                concepts.append(concept)
+
+    return {'nodes': nodes, 'edges': edges, 'concepts': concepts}
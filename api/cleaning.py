@@ -0,0 +1,169 @@
+"""
+Deterministic local "dehydration" of extracted syllabus text.
+
+Removes the noise the refiner prompt would otherwise pay tokens to delete:
+repeated per-page headers/footers, page numbers, copyright/disclaimer
+lines, whitespace runs and, for slide decks, duplicate (or incrementally
+built) slides. Pages are separated by form feeds ('\\f'), as written by
+extraction.py.
+"""
+import re
+
+from django.conf import settings
+
+from .extraction import PAGE_BREAK
+
+SYLLABUS_CLEANING = getattr(settings, 'SYLLABUS_CLEANING', True)
+
+EDGE_LINES = 3 # lines at the top/bottom of a page checked for running headers/footers
+REPEAT_MIN_PAGES = 3
+
+PAGE_NUMBER_RE = re.compile(
+    r'^\s*(?:'
+    r'(?:page|p\.|slide)?\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?'
+    r'|[-–—]\s*\d{1,4}\s*[-–—]'
+    r'|第\s*\d{1,4}\s*页(?:\s*[,，/]?\s*共\s*\d{1,4}\s*页)?'
+    r')\s*$',
+    re.IGNORECASE,
+)
+BARE_NUMBER_RE = re.compile(r'^\s*(\d{1,4})\s*$')
+# Whole notice lines only: topic lines like "Week 2: Copyright law" must survive
+BOILERPLATE_RE = re.compile(
+    r'^\s*(?:'
+    r'(?:©|\(c\)|copyright\s*(?:©|\(c\)|\d{4})).*'
+    r'|.*\ball rights reserved\.?|版权所有.*|.*版权所有'
+    r'|(?:strictly\s+)?confidential(?:\s*[-–—:,.]?\s*(?:do not|not for|internal)\b.*)?'
+    r'|(?:please\s+)?do not (?:copy|distribute|reproduce)\b.*'
+    r'|for internal use only\b.*'
+    r'|(?:disclaimer|免责声明)\s*[:：].*'
+    r'|.*未经(?:许可|授权).{0,10}(?:转载|复制|传播).*'
+    r')\s*$',
+    re.IGNORECASE,
+)
+_SPACES_RE = re.compile(r'[ \t 　]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_DIGITS_RE = re.compile(r'\d+')
+_PAGE_MARKER_RE = re.compile(r'page|p\.\s*\d|页|\d\s*(?:/|of)\s*\d', re.IGNORECASE)
+
+
+def _line_key(line):
+    key = _SPACES_RE.sub(' ', line).strip().lower()
+    # Running headers like "CS101 - Page 3" differ only in the page number;
+    # other digits ("Week 3") are kept so real content never collapses together
+    if _PAGE_MARKER_RE.search(key):
+        key = _DIGITS_RE.sub('#', key)
+    return key
+
+
+def _running_lines(pages):
+    """
+    Normalized lines that appear at the top or bottom of many pages.
+    """
+    if len(pages) < REPEAT_MIN_PAGES:
+        return set()
+    counts = {}
+    for lines in pages:
+        content = [l for l in lines if l.strip()]
+        edge = set(_line_key(l) for l in content[:EDGE_LINES] + content[-EDGE_LINES:])
+        for key in edge:
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(REPEAT_MIN_PAGES, -(-len(pages) * 3 // 5)) # 60% of pages
+    return {key for key, n in counts.items() if n >= threshold and key}
+
+
+def _drop_built_slides(pages):
+    """
+    Indices of the pages to keep: drops pages whose lines all reappear on a
+    neighbouring page (animation builds) or that repeat an earlier page exactly.
+    """
+    kept = []
+    seen = set()
+    last_key = frozenset()
+    keys = [frozenset(_line_key(l) for l in lines if l.strip()) for lines in pages]
+    for i in range(len(pages)):
+        key = keys[i]
+        if not key or key in seen or key <= last_key:
+            continue
+        if i + 1 < len(pages) and key < keys[i + 1]:
+            continue
+        seen.add(key)
+        last_key = key
+        kept.append(i)
+    return kept
+
+
+def _page_number_lines(pages, numbers):
+    """
+    {(page position, line index)} of bare numbers that number the pages:
+    the first or last content line of a page, counting up with the page's
+    number in the document (numbers[position]) on at least REPEAT_MIN_PAGES
+    pages. Other bare numbers are table cells (weeks, weights) and stay.
+    """
+    candidates = {}
+    for position, lines in enumerate(pages):
+        content = [i for i, l in enumerate(lines) if l.strip()]
+        if not content:
+            continue
+        for end, i in (('first', content[0]), ('last', content[-1])):
+            match = BARE_NUMBER_RE.match(lines[i])
+            if match:
+                offset = int(match.group(1)) - numbers[position]
+                candidates.setdefault((end, offset), set()).add((position, i))
+    found = set()
+    for lines in candidates.values():
+        if len(lines) >= REPEAT_MIN_PAGES:
+            found |= lines
+    return found
+
+
+def dehydrate(text, slides=False):
+    """
+    Returns (cleaned_text, report); report counts characters removed per rule.
+    Pass slides=True for PPTX text: only decks repeat pages as animation
+    builds, while near-identical PDF pages (e.g. weekly schedules) are content.
+    """
+    removed = {'headers_footers': 0, 'page_numbers': 0, 'boilerplate': 0, 'duplicate_slides': 0, 'whitespace': 0}
+    chars_before = len(text)
+    if not SYLLABUS_CLEANING or not text:
+        return text, {'chars_before': chars_before, 'chars_after': chars_before, 'removed': removed}
+
+    pages = [page.split('\n') for page in text.split(PAGE_BREAK)]
+    if slides and len(pages) > 1:
+        # Before header detection, so build steps do not look like running lines
+        numbers = _drop_built_slides(pages)
+        deduped = [pages[n] for n in numbers]
+        removed['duplicate_slides'] = len(text) - len(PAGE_BREAK.join('\n'.join(p) for p in deduped))
+        pages = deduped
+    else:
+        numbers = list(range(len(pages)))
+    running = _running_lines(pages)
+    page_numbers = _page_number_lines(pages, numbers)
+
+    cleaned_pages = []
+    for position, lines in enumerate(pages):
+        kept = []
+        content = [i for i, l in enumerate(lines) if l.strip()]
+        edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        for i, line in enumerate(lines):
+            if i in edges and _line_key(line) in running:
+                removed['headers_footers'] += len(line) + 1
+            elif (position, i) in page_numbers or (
+                    i in edges and PAGE_NUMBER_RE.match(line) and not BARE_NUMBER_RE.match(line)):
+                removed['page_numbers'] += len(line) + 1
+            elif len(line) < 300 and BOILERPLATE_RE.match(line):
+                removed['boilerplate'] += len(line) + 1
+            else:
+                kept.append(line)
+        cleaned_pages.append(kept)
+
+    # One character for the one-character form feed, so cleaning never grows the text
+    joined = '\n'.join('\n'.join(lines) for lines in cleaned_pages)
+    before_ws = len(joined)
+    joined = _SPACES_RE.sub(' ', joined)
+    joined = '\n'.join(line.strip() for line in joined.split('\n'))
+    joined = _BLANK_LINES_RE.sub('\n\n', joined).strip()
+    removed['whitespace'] = max(0, before_ws - len(joined))
+
+    report = {'chars_before': chars_before, 'chars_after': len(joined), 'removed': removed}
+    print(f"Dehydrated syllabus: {chars_before} -> {len(joined)} chars ({removed})")
+    return joined, report
@@ -0,0 +1,249 @@
+"""
+Concept matching for graph nodes.
+
+ConceptMatcher indexes node labels once (normalized label, token inverted
+index) and answers "which node best matches this concept?" by ranking the
+candidates that share a token: exact match, then prefix, then containment,
+then plain token overlap. Used to attach cross-course links to local nodes.
+
+The per-student ConceptIndex keeps BM25 statistics over every course's
+extracted concepts, so only the most related courses (and concepts) are
+sent to find_cross_connections, and identical concepts are linked without
+an LLM call.
+"""
+import datetime
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from . import queries
+from .chunking import normalize_label
+from .models import ConceptIndex, Course
+
+CROSS_LINK_TOP_COURSES = getattr(settings, 'CROSS_LINK_TOP_COURSES', 5)
+CROSS_LINK_TOP_CONCEPTS = getattr(settings, 'CROSS_LINK_TOP_CONCEPTS', 30)
+
+_WORD_RE = re.compile(r'[a-z0-9]+|[㐀-鿿]+')
+
+EXACT, PREFIX, CONTAINS, OVERLAP = 3, 2, 1, 0
+
+
+def tokenize(normalized):
+    """
+    Latin words (naively singularized) and CJK character bigrams.
+    """
+    tokens = []
+    for word in _WORD_RE.findall(normalized):
+        if word[0] >= '㐀':
+            if len(word) == 1:
+                tokens.append(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            tokens.append(word)
+    return tokens
+
+
+class ConceptMatcher:
+    def __init__(self, items):
+        """
+        items: iterable of (key, label), e.g. (node id, node label).
+        """
+        self.keys = []
+        self.labels = []
+        self.token_sets = []
+        self.exact = {}
+        self.postings = {}
+        for key, label in items:
+            normalized = normalize_label(label)
+            if not normalized:
+                continue
+            index = len(self.keys)
+            tokens = set(tokenize(normalized))
+            self.keys.append(key)
+            self.labels.append(normalized)
+            self.token_sets.append(tokens)
+            self.exact.setdefault(normalized, index)
+            for token in tokens:
+                self.postings.setdefault(token, []).append(index)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rank(self, concept, limit=5):
+        """
+        Returns up to `limit` (key, tier, score) tuples, best first.
+        """
+        query = normalize_label(concept)
+        if not query:
+            return []
+        exact = self.exact.get(query)
+        if exact is not None and limit == 1:
+            return [(self.keys[exact], EXACT, 1.0)]
+
+        query_tokens = set(tokenize(query))
+        shared = Counter()
+        for token in query_tokens:
+            shared.update(self.postings.get(token, ()))
+
+        ranked = []
+        for index, count in shared.items():
+            tokens = self.token_sets[index]
+            overlap = count / (len(tokens) + len(query_tokens) - count)
+            tier = OVERLAP
+            # Containment implies one side's tokens are all shared; only then compare strings
+            if count == len(tokens) or count == len(query_tokens):
+                label = self.labels[index]
+                if label == query:
+                    tier = EXACT
+                elif label.startswith(query) or query.startswith(label):
+                    tier = PREFIX
+                elif label in query or query in label:
+                    tier = CONTAINS
+            # Within a tier prefer more shared tokens, then the closer length
+            ranked.append((tier, overlap, -abs(len(self.labels[index]) - len(query)), -index))
+        ranked = [max(ranked)] if limit == 1 and ranked else sorted(ranked, reverse=True)
+        return [(self.keys[-r[3]], r[0], round(r[1], 3)) for r in ranked[:limit]]
+
+    def best(self, concept, min_tier=OVERLAP, min_overlap=0.5):
+        """
+        Key of the best matching item, or None. Plain token overlap only
+        counts when at least `min_overlap` of the tokens are shared.
+        """
+        ranked = self.rank(concept, limit=1)
+        if not ranked:
+            return None
+        key, tier, overlap = ranked[0]
+        if tier < min_tier or (tier == OVERLAP and overlap < min_overlap):
+            return None
+        return key
+
+
+# --- Per-student course concept index (BM25) -------------------------------
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _course_entry(course):
+    tf = {}
+    for concept in course.extracted_concepts or []:
+        for token in tokenize(normalize_label(concept)):
+            tf[token] = tf.get(token, 0) + 1
+    return {
+        'name': course.name,
+        'length': sum(tf.values()),
+        'tf': tf,
+        'concepts': list(course.extracted_concepts or []),
+    }
+
+
+def index_course(course):
+    """
+    Adds or replaces one course in its owner's concept index with a single
+    atomic update ($inc on document frequencies, $set on the course entry).
+    """
+    if not course.owner:
+        return
+    course_id = str(course.id)
+    entry = _course_entry(course)
+    # The first write for a student builds the whole index from their courses
+    existing = queries.concept_index(course.owner).only('courses').first() or load_index(course.owner)
+    old_tf = (existing.courses.get(course_id) or {}).get('tf', {})
+
+    delta = {}
+    for token in entry['tf']:
+        delta[token] = delta.get(token, 0) + 1
+    for token in old_tf:
+        delta[token] = delta.get(token, 0) - 1
+    inc = {f"df.{token}": n for token, n in delta.items() if n}
+    update = {'$set': {f"courses.{course_id}": entry, 'updated_at': datetime.datetime.utcnow()}}
+    if inc:
+        update['$inc'] = inc
+    queries.concept_index(course.owner).update_one(__raw__=update, upsert=True)
+
+
+def load_index(student):
+    index = queries.concept_index(student).first()
+    if index is not None:
+        return index
+    courses = {}
+    df = {}
+    for course in Course.objects(owner=student).only('id', 'name', 'extracted_concepts', 'owner'):
+        if not course.extracted_concepts:
+            continue
+        entry = _course_entry(course)
+        courses[str(course.id)] = entry
+        for token in entry['tf']:
+            df[token] = df.get(token, 0) + 1
+    index = ConceptIndex(owner=student, df=df, courses=courses)
+    try:
+        index.save()
+    except NotUniqueError:
+        # Built concurrently by another worker
+        index = queries.concept_index(student).first()
+    return index
+
+
+def related_courses(index, course_id, concepts, top_k=None, max_concepts=None):
+    """
+    Picks the other courses most related to `concepts` by BM25.
+    Returns (direct_links, other_courses_data): exact or near-exact concept
+    matches as ready cross links, and the remaining top-K courses with their
+    best matching concepts ({'name', 'concepts'}) for find_cross_connections.
+    """
+    top_k = top_k or CROSS_LINK_TOP_COURSES
+    max_concepts = max_concepts or CROSS_LINK_TOP_CONCEPTS
+    course_id = str(course_id)
+
+    query = {}
+    for concept in concepts:
+        normalized = normalize_label(concept)
+        if normalized:
+            query.setdefault(frozenset(tokenize(normalized)), concept)
+    query_tokens = set().union(*query) if query else set()
+    if not query_tokens or not index:
+        return [], []
+
+    courses = {cid: entry for cid, entry in (index.courses or {}).items() if cid != course_id}
+    if not courses:
+        return [], []
+    df = index.df or {}
+    total = len(index.courses)
+    avg_length = sum(e['length'] for e in courses.values()) / len(courses) or 1
+    idf = {t: math.log(1 + (total - df.get(t, 0) + 0.5) / (df.get(t, 0) + 0.5)) for t in query_tokens}
+
+    scored = []
+    for cid, entry in courses.items():
+        tf = entry['tf']
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * entry['length'] / avg_length)
+        score = sum(idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm) for t in query_tokens if t in tf)
+        if score > 0:
+            scored.append((score, cid))
+    scored.sort(reverse=True)
+
+    direct_links = []
+    others = []
+    for score, cid in scored[:top_k]:
+        entry = courses[cid]
+        remaining = []
+        for concept in entry['concepts']:
+            tokens = frozenset(tokenize(normalize_label(concept)))
+            if tokens in query:
+                # Same concept (up to case, punctuation and plurals): no LLM needed
+                direct_links.append({
+                    'from_concept': query[tokens],
+                    'to_course': entry['name'],
+                    'to_concept': concept,
+                    'reason': "Same concept appears in both courses",
+                })
+            elif tokens & query_tokens:
+                remaining.append((sum(idf[t] for t in tokens & query_tokens), concept))
+        remaining.sort(key=lambda r: r[0], reverse=True)
+        if remaining:
+            others.append({'name': entry['name'], 'concepts': [c for _, c in remaining[:max_concepts]]})
+    return direct_links, others
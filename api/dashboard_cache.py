@@ -0,0 +1,155 @@
+"""
+Materialized dashboard payloads.
+
+get_dashboard_data is polled far more often than the data behind it
+changes. The payload is serialized once, stored as JSON bytes with gzip
+(and brotli, when installed) encodings and a content hash, and served from
+the `dashboard` cache with a strong ETag, so an unchanged dashboard is
+answered (often with a 304) without any Mongo query.
+
+Writers call invalidate(username). Entries are keyed by a per-student
+generation number that invalidate() bumps, so a payload built from data
+read before a write can never be stored under the new generation.
+Use a shared cache backend (DASHBOARD_CACHE_BACKEND) when views and job
+workers run in separate processes.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DASHBOARD_CACHE_TTL = getattr(settings, 'DASHBOARD_CACHE_TTL', 600) # seconds
+MIN_COMPRESS_BYTES = 512
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'builds': 0, 'not_modified': 0, 'invalidations': 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _cache():
+    return caches['dashboard'] if 'dashboard' in settings.CACHES else caches['default']
+
+
+def _generation_key(username):
+    return f"dashboard:gen:{username}"
+
+
+def _new_generation():
+    # Clock-based, so a generation key lost to eviction never restarts below entries still cached
+    return int(time.time() * 1000)
+
+
+def _generation(username):
+    cache = _cache()
+    generation = cache.get(_generation_key(username))
+    if generation is None:
+        cache.add(_generation_key(username), _new_generation(), None)
+        generation = cache.get(_generation_key(username))
+    return generation
+
+
+def invalidate(username):
+    """
+    Drops every cached dashboard variant of this student.
+    """
+    if not username:
+        return
+    cache = _cache()
+    try:
+        cache.incr(_generation_key(username))
+    except ValueError:
+        # No generation yet (or evicted)
+        cache.add(_generation_key(username), _new_generation(), None)
+    _count('invalidations')
+
+
+def materialize(payload):
+    """
+    Pre-encoded representations of a payload: {'etag', 'identity', 'gzip', 'br'}.
+    """
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    entry = {
+        'etag': hashlib.sha256(body).hexdigest()[:32],
+        'identity': body,
+        'gzip': None,
+        'br': None,
+    }
+    if len(body) >= MIN_COMPRESS_BYTES:
+        entry['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+        if brotli is not None:
+            entry['br'] = brotli.compress(body, quality=5)
+    return entry
+
+
+def get_or_build(username, variant, build):
+    """
+    The materialized payload for (student, variant), calling build() for
+    the payload dict on a miss. Only successful payloads are cached.
+    """
+    cache = _cache()
+    key = f"dashboard:{username}:{_generation(username)}:{variant}"
+    entry = cache.get(key)
+    if entry is not None:
+        _count('hits')
+        return entry
+    payload = build()
+    entry = materialize(payload)
+    _count('builds')
+    if payload.get('status') == 'success':
+        cache.set(key, entry, DASHBOARD_CACHE_TTL)
+    return entry
+
+
+def _if_none_match(request):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    # Accept any encoding's tag for the same content
+    return {tag.strip().strip('"').split('-')[0] for tag in header.split(',') if tag.strip()}
+
+
+def respond(request, entry):
+    """
+    HttpResponse for a materialized entry: 304 when the client's ETag
+    matches, otherwise the best encoding the client accepts.
+    """
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    encoding = 'identity'
+    if entry['br'] is not None and 'br' in accepted:
+        encoding = 'br'
+    elif entry['gzip'] is not None and 'gzip' in accepted:
+        encoding = 'gzip'
+    # Strong ETags must differ per content-coding
+    etag = f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"'
+
+    if entry['etag'] in _if_none_match(request):
+        _count('not_modified')
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry[encoding], content_type='application/json')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    # Browsers revalidate on every poll and keep the body for the 304
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def stats():
+    with _lock:
+        return dict(_stats, brotli=brotli is not None)
@@ -0,0 +1,280 @@
+"""
+Text extraction for uploaded syllabi (PDF, DOCX, PPTX, plain text).
+
+Reads from Django's temporary upload file (or the in-memory upload for
+small files) without copying the whole document into a bytes object,
+collects fragments in a list joined once, and stops at a page/character
+budget. Large PDFs are split into page ranges extracted on a process pool.
+Each extraction returns a report with parse time (and peak memory when
+profiling), and per-format totals are kept for /api/metrics/.
+"""
+import codecs
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from docx import Document as DocxDocument
+from pptx import Presentation
+from pypdf import PdfReader
+
+EXTRACT_MAX_PAGES = getattr(settings, 'EXTRACT_MAX_PAGES', 300) # PDF pages / PPTX slides
+EXTRACT_MAX_CHARS = getattr(settings, 'EXTRACT_MAX_CHARS', getattr(settings, 'SYLLABUS_MAX_CHARS', 200000))
+PDF_WORKERS = getattr(settings, 'PDF_WORKERS', min(4, os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 20)
+EXTRACT_TRACE_MEMORY = getattr(settings, 'EXTRACT_TRACE_MEMORY', False) # serializes extractions while on
+
+PAGE_BREAK = '\f' # between PDF pages / PPTX slides, so cleaning.py can see page edges
+
+FAILED_TEXT = {
+    'pdf': "PDF Parsing Failed",
+    'docx': "Docx Parsing Failed",
+    'pptx': "PPTX Parsing Failed",
+}
+
+_pdf_pool = None
+_pool_lock = threading.Lock()
+_trace_lock = threading.Lock() # measured extractions run one at a time, so the peak is not reset mid-way
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class _Budget:
+    def __init__(self, max_chars):
+        self.remaining = max_chars
+        self.truncated_by = [] # 'chars' and/or 'pages'
+
+    @property
+    def truncated(self):
+        return bool(self.truncated_by)
+
+    def cut(self, reason):
+        if reason not in self.truncated_by:
+            self.truncated_by.append(reason)
+
+    def take(self, text):
+        """
+        Returns the part of text that still fits in the budget.
+        """
+        if len(text) > self.remaining:
+            text = text[:self.remaining]
+            self.remaining = 0
+            self.cut('chars')
+            return text
+        self.remaining -= len(text)
+        return text
+
+    @property
+    def spent(self):
+        # Checked before taking more content, so anything left over is cut off
+        if self.remaining <= 0:
+            self.cut('chars')
+            return True
+        return False
+
+
+def detect_format(file_name):
+    name = file_name.lower()
+    for fmt in ('pdf', 'docx', 'pptx'):
+        if name.endswith('.' + fmt):
+            return fmt
+    return 'text'
+
+
+def _source(uploaded_file):
+    # Large uploads are spooled to disk by Django; hand parsers the path so
+    # nothing re-reads the document into memory.
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        return uploaded_file.temporary_file_path()
+    uploaded_file.seek(0)
+    return uploaded_file
+
+
+def file_digest(uploaded_file):
+    h = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        h.update(chunk)
+    uploaded_file.seek(0)
+    return h.hexdigest()
+
+
+def _pdf_pages(path, start, stop, max_chars):
+    # Runs in a pool worker: each worker opens its own reader on the shared file
+    reader = PdfReader(path)
+    pages = []
+    total = 0
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text() or ''
+        pages.append(text)
+        total += len(text)
+        if total >= max_chars:
+            break
+    return pages
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pool_lock:
+        if _pdf_pool is None:
+            # spawn, not fork: the server process runs job and stage threads
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_pool
+
+
+def _extract_pdf(source, budget, max_pages):
+    reader = PdfReader(source)
+    page_count = min(len(reader.pages), max_pages)
+    if len(reader.pages) > max_pages:
+        budget.cut('pages')
+    parts = []
+
+    if isinstance(source, str) and PDF_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        step = -(-page_count // PDF_WORKERS)
+        futures = [
+            _get_pdf_pool().submit(_pdf_pages, source, start, min(start + step, page_count), budget.remaining)
+            for start in range(0, page_count, step)
+        ]
+        for future in futures:
+            for text in future.result():
+                if budget.spent:
+                    break
+                parts.append(budget.take(text + PAGE_BREAK))
+        return parts, page_count
+
+    for i in range(page_count):
+        if budget.spent:
+            break
+        parts.append(budget.take((reader.pages[i].extract_text() or '') + PAGE_BREAK))
+    return parts, page_count
+
+
+def _extract_docx(source, budget, max_pages):
+    doc = DocxDocument(source)
+    parts = []
+    for para in doc.paragraphs:
+        if budget.spent:
+            break
+        parts.append(budget.take(para.text + "\n"))
+    return parts, None
+
+
+def _extract_pptx(source, budget, max_pages):
+    prs = Presentation(source)
+    parts = []
+    slide_count = 0
+    for slide in prs.slides:
+        if slide_count >= max_pages:
+            budget.cut('pages')
+            break
+        if budget.spent:
+            break
+        slide_count += 1
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                parts.append(budget.take(shape.text + "\n"))
+        parts.append(budget.take(PAGE_BREAK))
+    return parts, slide_count
+
+
+def _extract_plain(uploaded_file, budget, max_pages):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    parts = []
+    for chunk in uploaded_file.chunks():
+        if budget.spent:
+            break
+        parts.append(budget.take(decoder.decode(chunk)))
+    if budget.remaining > 0:
+        parts.append(budget.take(decoder.decode(b'', final=True)))
+    return parts, None
+
+
+_EXTRACTORS = {'pdf': _extract_pdf, 'docx': _extract_docx, 'pptx': _extract_pptx}
+
+
+def extract_text(uploaded_file, max_chars=None, max_pages=None):
+    """
+    Extracts text from a Django UploadedFile. Returns (text, report) where
+    report has format, pages, chars, truncated (truncated_by: 'chars'/'pages'),
+    seconds and peak_memory_kb
+    (None unless EXTRACT_TRACE_MEMORY is on; covers this process only).
+    """
+    fmt = detect_format(uploaded_file.name)
+    budget = _Budget(max_chars or EXTRACT_MAX_CHARS)
+    max_pages = max_pages or EXTRACT_MAX_PAGES
+
+    peak_kb = None
+    if EXTRACT_TRACE_MEMORY:
+        # tracemalloc has one peak per process: concurrent extractions would reset each other's
+        with _trace_lock:
+            owns_trace = not tracemalloc.is_tracing()
+            if owns_trace:
+                tracemalloc.start()
+            try:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                text, pages, failed, seconds = _extract(uploaded_file, fmt, budget, max_pages)
+                peak_kb = max(0, tracemalloc.get_traced_memory()[1] - baseline) // 1024
+            finally:
+                if owns_trace:
+                    tracemalloc.stop()
+    else:
+        text, pages, failed, seconds = _extract(uploaded_file, fmt, budget, max_pages)
+
+    report = {
+        'format': fmt,
+        'pages': pages,
+        'chars': len(text),
+        'truncated': budget.truncated,
+        'truncated_by': budget.truncated_by,
+        'failed': failed,
+        'seconds': round(seconds, 4),
+        'peak_memory_kb': peak_kb,
+    }
+    _record(report)
+    print(f"Extracted {report['chars']} chars from {fmt} in {seconds:.3f}s"
+          + (f", peak {peak_kb} KB" if peak_kb is not None else "")
+          + (f" (truncated by {'/'.join(budget.truncated_by)} budget)" if budget.truncated else ""))
+    return text, report
+
+
+def _extract(uploaded_file, fmt, budget, max_pages):
+    started = time.perf_counter()
+    pages = None
+    try:
+        if fmt == 'text':
+            parts, pages = _extract_plain(uploaded_file, budget, max_pages)
+        else:
+            parts, pages = _EXTRACTORS[fmt](_source(uploaded_file), budget, max_pages)
+        text = ''.join(parts)
+        failed = False
+    except Exception as e:
+        print(f"{fmt.upper()} Parsing Error: {e}")
+        text = FAILED_TEXT.get(fmt, '')
+        failed = True
+    return text, pages, failed, time.perf_counter() - started
+
+
+def _record(report):
+    with _stats_lock:
+        entry = _stats.setdefault(report['format'], {
+            'files': 0, 'failed': 0, 'truncated': 0, 'seconds_total': 0.0, 'max_seconds': 0.0, 'max_peak_memory_kb': 0,
+        })
+        entry['files'] += 1
+        entry['failed'] += int(report['failed'])
+        entry['truncated'] += int(report['truncated'])
+        entry['seconds_total'] += report['seconds']
+        entry['max_seconds'] = max(entry['max_seconds'], report['seconds'])
+        if report['peak_memory_kb'] is not None:
+            entry['max_peak_memory_kb'] = max(entry['max_peak_memory_kb'], report['peak_memory_kb'])
+
+
+def stats():
+    with _stats_lock:
+        return {
+            fmt: dict(entry, avg_seconds=round(entry['seconds_total'] / entry['files'], 4))
+            for fmt, entry in _stats.items()
+        }
@@ -0,0 +1,245 @@
+"""
+Upstream governor for the Ark endpoint.
+
+Every LLM call passes through `governor.call(stage, fn)`, which applies:
+- a token-bucket rate limit per stage,
+- an AIMD adaptive concurrency cap per stage, grown while latency stays under
+  target and halved on 429s, timeouts or slow responses,
+- one circuit breaker for the upstream, which fails calls fast while Ark is
+  unhealthy so the pipeline drops straight into its mock fallbacks.
+"""
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+DEFAULT_STAGE_LIMITS = {
+    'rate': 5.0, # requests per second
+    'burst': 10,
+    'min_concurrency': 1,
+    'max_concurrency': 16,
+    'initial_concurrency': 4,
+    'target_latency': 60.0, # seconds; slower calls shrink the concurrency cap
+    'timeout': 120.0, # per-request upstream timeout
+    'queue_timeout': 30.0, # how long a call may wait for a slot before failing
+}
+STAGE_LIMITS = getattr(settings, 'LLM_STAGE_LIMITS', {})
+BREAKER_FAILURES = getattr(settings, 'LLM_BREAKER_FAILURES', 5) # consecutive failures before opening
+BREAKER_RESET = getattr(settings, 'LLM_BREAKER_RESET', 30.0) # seconds open before a trial call
+
+# Errors that say the upstream is overloaded or unhealthy (not our request being bad).
+# A streamed response is read after the SDK returns, so a read timeout or dropped
+# connection mid-stream surfaces as a raw httpx error rather than an OpenAI one.
+UPSTREAM_ERRORS = (
+    RateLimitError, APITimeoutError, APIConnectionError, InternalServerError,
+    httpx.TimeoutException, httpx.TransportError,
+)
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling Ark when the breaker is open or no slot frees up in time.
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency cap with additive increase / multiplicative decrease.
+    """
+
+    def __init__(self, min_limit, max_limit, initial, target_latency):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial)
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        # Give the slot back without a latency sample
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def release(self, latency, overloaded):
+        with self.cond:
+            self.in_flight -= 1
+            if overloaded or latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit / 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed' # closed, open, half_open
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        with self.lock:
+            return self.state == 'open' and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                # Let a single trial call through
+                self.state = 'half_open'
+                return True
+            if self.state == 'half_open':
+                return False
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = 'closed'
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit breaker OPEN after {self.failures} upstream failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class StageGovernor:
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.bucket = TokenBucket(limits['rate'], limits['burst'])
+        self.limiter = AdaptiveLimiter(
+            limits['min_concurrency'], limits['max_concurrency'],
+            limits['initial_concurrency'], limits['target_latency'],
+        )
+        self.metrics = {'calls': 0, 'succeeded': 0, 'failed': 0, 'rate_limited': 0, 'rejected': 0, 'latency_ms_total': 0}
+        self.metrics_lock = threading.Lock()
+
+    def count(self, **increments):
+        with self.metrics_lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+_stages = {}
+_lock = threading.Lock()
+
+
+def get_stage(name):
+    with _lock:
+        if name not in _stages:
+            limits = dict(DEFAULT_STAGE_LIMITS)
+            limits.update(STAGE_LIMITS.get(name, {}))
+            _stages[name] = StageGovernor(name, limits)
+        return _stages[name]
+
+
+def call(stage_name, fn):
+    """
+    Runs fn(timeout) under the stage's limits. Raises UpstreamUnavailable
+    without calling fn when the upstream is unhealthy or saturated.
+    """
+    stage = get_stage(stage_name)
+    queue_timeout = stage.limits['queue_timeout']
+
+    if _breaker.is_open():
+        # Fail fast without queueing while the upstream is known to be down
+        stage.count(rejected=1)
+        raise UpstreamUnavailable("Ark circuit breaker is open")
+    if not stage.bucket.acquire(queue_timeout):
+        stage.count(rejected=1)
+        raise UpstreamUnavailable(f"Rate limit for stage '{stage_name}' exceeded")
+    if not stage.limiter.acquire(queue_timeout):
+        stage.count(rejected=1)
+        raise UpstreamUnavailable(f"No upstream slot for stage '{stage_name}' within {queue_timeout}s")
+    if not _breaker.allow():
+        # Opened while we queued, or another caller holds the half-open trial slot
+        stage.limiter.cancel()
+        stage.count(rejected=1)
+        raise UpstreamUnavailable("Ark circuit breaker is open")
+
+    stage.count(calls=1)
+    started = time.monotonic()
+    overloaded = False
+    try:
+        result = fn(stage.limits['timeout'])
+        _breaker.record_success()
+        stage.count(succeeded=1)
+        return result
+    except UPSTREAM_ERRORS as e:
+        overloaded = True
+        stage.count(failed=1, rate_limited=1 if isinstance(e, RateLimitError) else 0)
+        _breaker.record_failure()
+        raise
+    except Exception:
+        # The upstream answered (e.g. a 4xx for a bad request), so it is healthy
+        _breaker.record_success()
+        stage.count(failed=1)
+        raise
+    finally:
+        latency = time.monotonic() - started
+        stage.count(latency_ms_total=int(latency * 1000))
+        stage.limiter.release(latency, overloaded)
+
+
+def metrics():
+    with _lock:
+        stages = list(_stages.values())
+    return {
+        'breaker': {'state': _breaker.state, 'consecutive_failures': _breaker.failures},
+        'stages': {
+            s.name: dict(
+                s.metrics,
+                concurrency_limit=round(s.limiter.limit, 2),
+                in_flight=s.limiter.in_flight,
+                avg_latency_ms=round(s.metrics['latency_ms_total'] / s.metrics['calls']) if s.metrics['calls'] else 0,
+            )
+            for s in stages
+        },
+    }
@@ -0,0 +1,166 @@
+"""
+Level-of-detail queries over a course graph.
+
+Instead of the whole graph, the dashboard can ask for a collapsed overview
+(the root and its level-1 branches for convergent graphs, the best
+connected hubs for divergent ones) and then expand a node into its k-hop
+neighbourhood. Each graph version is indexed once per process (nodes and
+edges by id, adjacency lists, degrees), so an expand request touches only
+the neighbourhood instead of scanning every node and edge.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import queries
+from .models import Graph
+
+GRAPH_INDEX_CACHE_SIZE = getattr(settings, 'GRAPH_INDEX_CACHE_SIZE', 64) # graph versions kept in process
+GRAPH_OVERVIEW_HUBS = getattr(settings, 'GRAPH_OVERVIEW_HUBS', 12)
+GRAPH_OVERVIEW_MIN_NODES = getattr(settings, 'GRAPH_OVERVIEW_MIN_NODES', 150) # smaller graphs are sent whole
+MAX_HOPS = 3
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'builds': 0}
+
+
+def edge_class(edge):
+    """
+    Filter class of an edge: 'cross' for dashed cross-course links,
+    otherwise its lower-cased colour (vis accepts a string or {'color': ...}).
+    """
+    if edge.get('dashes'):
+        return 'cross'
+    color = edge.get('color')
+    if isinstance(color, dict):
+        color = color.get('color')
+    return str(color).lower() if color else 'default'
+
+
+class GraphIndex:
+    def __init__(self, graph):
+        self.version = graph.version
+        self.layout = graph.layout
+        self.order = [n['id'] for n in graph.nodes]
+        self.position = {node_id: i for i, node_id in enumerate(self.order)}
+        self.nodes = {n['id']: n for n in graph.nodes}
+        self.edges = {}
+        self.ranked = None # node ids by degree, computed on first overview
+        self.adjacency = {node_id: [] for node_id in self.order} # node id -> [(neighbour id, edge id)]
+        for i, edge in enumerate(graph.edges):
+            edge_id = edge.get('id') or f"edge_{i}" # graphs saved before stable edge ids
+            if edge['from'] not in self.nodes or edge['to'] not in self.nodes:
+                continue
+            self.edges[edge_id] = edge if 'id' in edge else dict(edge, id=edge_id)
+            self.adjacency[edge['from']].append((edge['to'], edge_id))
+            self.adjacency[edge['to']].append((edge['from'], edge_id))
+
+    def degree(self, node_id):
+        return len(self.adjacency.get(node_id, ()))
+
+    def overview_ids(self, thinking_type, hubs=None):
+        if thinking_type == 'convergent':
+            ids = [i for i in self.order if self.nodes[i].get('level') in (0, 1)]
+            if ids:
+                return ids
+        # Divergent (or no levels): the best connected nodes, root first on ties
+        if self.ranked is None:
+            self.ranked = sorted(self.order, key=lambda i: (-self.degree(i), self.position[i]))
+        return self.ranked[:hubs or GRAPH_OVERVIEW_HUBS]
+
+    def neighbourhood(self, node_id, hops=1, shapes=None, edge_classes=None):
+        """
+        Ids of nodes within `hops` of node_id (BFS over edges that pass the
+        filters, visiting only nodes whose shape passes).
+        """
+        seen = {node_id}
+        frontier = [node_id]
+        for _ in range(hops):
+            next_frontier = []
+            for current in frontier:
+                for neighbour, edge_id in self.adjacency.get(current, ()):
+                    if neighbour in seen or not self._edge_ok(edge_id, edge_classes):
+                        continue
+                    if shapes and self.nodes[neighbour].get('shape') not in shapes:
+                        continue
+                    seen.add(neighbour)
+                    next_frontier.append(neighbour)
+            frontier = next_frontier
+        return seen
+
+    def _edge_ok(self, edge_id, edge_classes):
+        return not edge_classes or edge_class(self.edges[edge_id]) in edge_classes
+
+    def subgraph(self, node_ids, edge_classes=None, border=False):
+        """
+        Nodes in node_ids with the edges between them; with border=True also
+        the edges leading out of the set (vis draws them once the client
+        has the other end). Each node carries `hidden_neighbours`, the
+        number of its neighbours outside the set, for the "+n" badge.
+        """
+        node_ids = set(node_ids)
+        nodes = []
+        edges = {}
+        for node_id in sorted(node_ids, key=self.position.get):
+            hidden = 0
+            for neighbour, edge_id in self.adjacency[node_id]:
+                inside = neighbour in node_ids
+                hidden += not inside
+                if (inside or border) and self._edge_ok(edge_id, edge_classes):
+                    edges[edge_id] = self.edges[edge_id]
+            nodes.append(dict(self.nodes[node_id], hidden_neighbours=hidden))
+        return nodes, list(edges.values())
+
+
+def _index(graph_id, version):
+    key = (str(graph_id), version)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            _stats['hits'] += 1
+            return index
+    graph = Graph.objects(id=graph_id).first()
+    if graph is None:
+        return None
+    index = GraphIndex(graph)
+    with _lock:
+        _stats['builds'] += 1
+        _indexes[(str(graph.id), graph.version)] = index
+        while len(_indexes) > GRAPH_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def load(course):
+    """
+    GraphIndex for the course's current graph version, or None. Only the
+    id/version are read from Mongo when the version is already indexed.
+    """
+    head = queries.current_graph(course).only('id', 'version').first()
+    if head is None:
+        return None
+    return _index(head.id, head.version)
+
+
+def overview(index, thinking_type, shapes=None, edge_classes=None):
+    ids = [i for i in index.overview_ids(thinking_type) if not shapes or index.nodes[i].get('shape') in shapes]
+    return index.subgraph(ids, edge_classes)
+
+
+def expand(index, node_id, hops=1, shapes=None, edge_classes=None):
+    if node_id not in index.nodes:
+        raise KeyError(f"Unknown node {node_id}")
+    try:
+        hops = max(1, min(int(hops), MAX_HOPS))
+    except (TypeError, ValueError):
+        raise ValueError(f"hops must be a whole number, not {hops!r}")
+    ids = index.neighbourhood(node_id, hops, shapes, edge_classes)
+    return index.subgraph(ids, edge_classes, border=True)
+
+
+def stats():
+    with _lock:
+        return dict(_stats, cached=len(_indexes))
@@ -0,0 +1,192 @@
+"""
+Versioned course graphs.
+
+Each course has one Graph document holding the current snapshot and a
+version number. Every regeneration stores only what changed as a
+GraphDelta (nodes/edges upserted or removed, keyed by stable ids), so a
+client holding version N can catch up by applying the deltas after N
+instead of downloading the whole graph. Deltas older than
+GRAPH_DELTA_RETENTION versions are compacted away; clients that far behind
+get the snapshot.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+from . import layout, queries
+from .chunking import stable_node_id
+from .models import Graph, GraphDelta
+
+GRAPH_DELTA_RETENTION = getattr(settings, 'GRAPH_DELTA_RETENTION', 10)
+SAVE_RETRIES = 3
+
+
+def stable_edge_id(edge):
+    key = f"{edge.get('from')}\x00{edge.get('to')}\x00{edge.get('label', '')}\x00{bool(edge.get('dashes'))}"
+    return 'e_' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+
+
+def stabilize(nodes, edges):
+    """
+    Re-keys nodes by their normalized label (so the same concept keeps its
+    id across regenerations) and gives edges deterministic ids.
+    Nodes with the same label collapse into the first one.
+    """
+    id_map = {}
+    stable_nodes = []
+    seen = set()
+    for node in nodes:
+        new_id = stable_node_id(node.get('label', '')) if node.get('label') else str(node.get('id', ''))
+        id_map[str(node.get('id', ''))] = new_id
+        if new_id in seen:
+            continue
+        seen.add(new_id)
+        stable_nodes.append(dict(node, id=new_id))
+
+    stable_edges = []
+    seen = set()
+    for edge in edges:
+        edge = dict(edge)
+        edge['from'] = id_map.get(str(edge.get('from', '')), str(edge.get('from', '')))
+        edge['to'] = id_map.get(str(edge.get('to', '')), str(edge.get('to', '')))
+        edge.pop('id', None)
+        edge['id'] = stable_edge_id(edge)
+        if edge['id'] in seen or edge['from'] == edge['to']:
+            continue
+        seen.add(edge['id'])
+        stable_edges.append(edge)
+    return stable_nodes, stable_edges
+
+
+def diff(old_items, new_items):
+    """
+    Returns (upserted, removed_ids) turning old_items into new_items.
+    """
+    old_by_id = {item['id']: item for item in old_items if 'id' in item}
+    new_ids = set()
+    upserted = []
+    for item in new_items:
+        new_ids.add(item['id'])
+        if old_by_id.get(item['id']) != item:
+            upserted.append(item)
+    removed = [item_id for item_id in old_by_id if item_id not in new_ids]
+    return upserted, removed
+
+
+def current(course):
+    return queries.current_graph(course).first()
+
+
+def save_graph(course, owner, nodes, edges, thinking_type=None):
+    """
+    Stores nodes/edges, laid out for `thinking_type`, as the course's next
+    graph version. Returns the Graph.
+    """
+    thinking_type = thinking_type or 'divergent'
+    nodes, edges = stabilize(nodes, edges)
+    for _ in range(SAVE_RETRIES):
+        graph = current(course)
+        now = datetime.datetime.utcnow()
+        if graph is None:
+            nodes = layout.apply(nodes, edges, thinking_type)
+            graph = Graph(
+                course=course, owner=owner, nodes=nodes, edges=edges, layout=thinking_type,
+                version=1, created_at=now, updated_at=now,
+            )
+            graph.save()
+            return graph
+
+        # Keep existing coordinates when the layout mode is unchanged
+        previous = graph.nodes if graph.layout == thinking_type else None
+        laid_out = layout.apply(nodes, edges, thinking_type, previous_nodes=previous)
+        nodes_upserted, nodes_removed = diff(graph.nodes, laid_out)
+        edges_upserted, edges_removed = diff(graph.edges, edges)
+        if not (nodes_upserted or nodes_removed or edges_upserted or edges_removed):
+            if graph.layout != thinking_type:
+                Graph.objects(id=graph.id).update_one(set__layout=thinking_type)
+                graph.layout = thinking_type
+            return graph
+
+        version = graph.version + 1
+        # Graphs saved before versioning have no edge ids to diff against;
+        # they are replaced without a delta, so clients fall back to the snapshot
+        legacy = any('id' not in e for e in graph.edges)
+        # Optimistic concurrency: only advance from the version the delta was computed against
+        expected = Q(version=graph.version)
+        if graph.version == 1:
+            expected |= Q(version__exists=False) # saved before versioning
+        updated = Graph.objects(expected, id=graph.id).update_one(
+            set__nodes=laid_out, set__edges=edges, set__version=version, set__owner=owner,
+            set__layout=thinking_type, set__updated_at=now,
+        )
+        if not updated:
+            continue
+        if legacy:
+            compact(course, version, keep_graph_id=graph.id)
+            graph.reload()
+            return graph
+        GraphDelta(
+            course=course,
+            version=version,
+            nodes_upserted=nodes_upserted,
+            nodes_removed=nodes_removed,
+            edges_upserted=edges_upserted,
+            edges_removed=edges_removed,
+        ).save()
+        compact(course, version)
+        graph.reload()
+        return graph
+    raise RuntimeError(f"Graph for course {course.id} changed concurrently {SAVE_RETRIES} times")
+
+
+def ensure_layout(course, graph, thinking_type):
+    """
+    Returns the graph laid out for `thinking_type`, saving a new version
+    (positions only) when it was laid out for the other one. Called when a
+    student switches thinking type, never on a read.
+    """
+    thinking_type = thinking_type or 'divergent'
+    if graph is None or graph.layout == thinking_type:
+        return graph
+    return save_graph(course, graph.owner, graph.nodes, graph.edges, thinking_type)
+
+
+def compact(course, version, keep_graph_id=None):
+    """
+    Drops deltas beyond the retention window (older clients get the
+    snapshot) and per-generation Graph documents from before versioning.
+    """
+    GraphDelta.objects(course=course, version__lte=version - GRAPH_DELTA_RETENTION).delete()
+    if keep_graph_id:
+        Graph.objects(course=course, id__ne=keep_graph_id).delete()
+
+
+def changes_since(course, graph, since):
+    """
+    Payload for a client holding version `since` of this graph:
+    {'version', 'unchanged': True} | {'version', 'deltas': [...]} | {'version', 'nodes', 'edges'}.
+    """
+    if graph is None:
+        return {'version': 0, 'nodes': [], 'edges': []}
+    if since == graph.version:
+        return {'version': graph.version, 'layout': graph.layout, 'unchanged': True}
+    if since and 0 < since < graph.version:
+        deltas = list(queries.graph_deltas(course, since, graph.version))
+        if len(deltas) == graph.version - since:
+            return {
+                'version': graph.version,
+                'layout': graph.layout,
+                'deltas': [
+                    {
+                        'version': d.version,
+                        'nodes_upserted': d.nodes_upserted,
+                        'nodes_removed': d.nodes_removed,
+                        'edges_upserted': d.edges_upserted,
+                        'edges_removed': d.edges_removed,
+                    }
+                    for d in deltas
+                ],
+            }
+    return {'version': graph.version, 'layout': graph.layout, 'nodes': graph.nodes, 'edges': graph.edges}
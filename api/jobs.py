@@ -0,0 +1,261 @@
+"""
+Background job subsystem.
+
+Views enqueue a durable `Job` document in Mongo and return its id right away.
+A local thread pool claims queued jobs and runs the registered handler stage
+by stage, writing progress back to the document so the templates can poll
+`/api/job_status/`.
+"""
+import datetime
+import hashlib
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from . import queries
+from .models import Job
+
+JOB_WORKERS = getattr(settings, 'JOB_WORKERS', 4)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+JOB_RETRY_BACKOFF = getattr(settings, 'JOB_RETRY_BACKOFF', 2.0) # seconds, doubled per attempt
+JOB_IDEMPOTENCY_WINDOW = getattr(settings, 'JOB_IDEMPOTENCY_WINDOW', 600) # seconds
+JOB_LEASE_SECONDS = getattr(settings, 'JOB_LEASE_SECONDS', 900) # running jobs older than this are re-queued
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def register(kind):
+    """
+    Decorator registering `func(job, ctx)` as the handler for a job kind.
+    The handler returns a dict that is stored as the job result.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def make_idempotency_key(*parts):
+    """
+    Builds a stable key from the given parts (str or bytes).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(part)
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+class JobContext:
+    """
+    Handed to job handlers to report per-stage progress.
+    """
+
+    def __init__(self, job, stage_names):
+        self.job = job
+        self.stage_names = list(stage_names)
+        self.finished = set() # stages run in parallel, so progress counts them rather than using the index
+        self.lock = threading.Lock()
+
+    def _touch(self, **updates):
+        updates['set__updated_at'] = datetime.datetime.utcnow()
+        Job.objects(id=self.job.id).update(**updates)
+
+    def start_stage(self, name):
+        print(f"JOB {self.job.id}: stage '{name}' started")
+        self._touch(**{
+            'set__stage': name,
+            f'set__stages__{self.stage_names.index(name)}__status': 'running',
+            f'set__stages__{self.stage_names.index(name)}__started_at': datetime.datetime.utcnow(),
+        })
+
+    def finish_stage(self, name, status='done'):
+        index = self.stage_names.index(name)
+        with self.lock:
+            self.finished.add(name)
+            progress = int(100 * len(self.finished) / len(self.stage_names))
+        self._touch(**{
+            f'set__stages__{index}__status': status,
+            f'set__stages__{index}__finished_at': datetime.datetime.utcnow(),
+            # $max: writes from parallel stages may land out of order, and a retry starts counting again
+            'max__progress': progress,
+        })
+
+    def stage(self, name):
+        return _StageScope(self, name)
+
+    def checkpoint(self, name, produce):
+        """
+        Runs produce() once per job: on a retry, returns the value an earlier
+        attempt recorded. The value is stored on the Job, so it must be BSON.
+        """
+        if name in self.job.checkpoints:
+            return self.job.checkpoints[name]
+        value = produce()
+        Job.objects(id=self.job.id).update(**{f'set__checkpoints__{name}': value})
+        self.job.checkpoints[name] = value
+        return value
+
+
+class _StageScope:
+    def __init__(self, ctx, name):
+        self.ctx = ctx
+        self.name = name
+
+    def __enter__(self):
+        self.ctx.start_stage(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.ctx.finish_stage(self.name, 'failed' if exc_type else 'done')
+        return False
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='piggy-job')
+            # Pick up anything a previous process left behind
+            threading.Thread(target=recover_pending, daemon=True).start()
+        return _executor
+
+
+def enqueue(kind, owner, payload, stage_names, idempotency_key=None):
+    """
+    Creates (or reuses) a job and submits it to the worker pool.
+    Returns the Job document.
+    """
+    if idempotency_key:
+        existing = queries.job_by_key(idempotency_key).first()
+        if existing:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=JOB_IDEMPOTENCY_WINDOW)
+            if existing.status != 'failed' and existing.created_at >= cutoff:
+                print(f"JOB {existing.id}: reused for idempotency key {idempotency_key[:12]}")
+                return existing
+            # Expired or failed: release the key so a fresh job can take it
+            Job.objects(id=existing.id, idempotency_key=idempotency_key).update(unset__idempotency_key=True)
+
+    job = Job(
+        kind=kind,
+        owner=owner,
+        payload=payload,
+        idempotency_key=idempotency_key,
+        stages=[{'name': name, 'status': 'pending'} for name in stage_names],
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    try:
+        job.save()
+    except NotUniqueError:
+        # Lost the race against a concurrent identical request
+        return queries.job_by_key(idempotency_key).get()
+
+    _submit(job.id)
+    return job
+
+
+def _submit(job_id):
+    _get_executor().submit(_execute, job_id)
+
+
+def _claim(job_id):
+    """
+    Atomically moves a queued job to running so only one worker runs it.
+    """
+    return Job.objects(id=job_id, status='queued').modify(
+        new=True,
+        set__status='running',
+        inc__attempts=1,
+        set__updated_at=datetime.datetime.utcnow(),
+    )
+
+
+def _execute(job_id):
+    job = _claim(job_id)
+    if job is None:
+        return
+
+    handler = _handlers.get(job.kind)
+    if handler is None:
+        Job.objects(id=job.id).update(set__status='failed', set__error=f"No handler for job kind '{job.kind}'")
+        return
+
+    ctx = JobContext(job, [s['name'] for s in job.stages])
+    try:
+        result = handler(job, ctx) or {}
+        Job.objects(id=job.id).update(
+            set__status='succeeded',
+            set__result=result,
+            set__progress=100,
+            set__updated_at=datetime.datetime.utcnow(),
+        )
+        print(f"JOB {job.id}: succeeded")
+    except Exception as e:
+        traceback.print_exc()
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+            print(f"JOB {job.id}: attempt {job.attempts} failed, retrying in {delay:.1f}s")
+            Job.objects(id=job.id).update(
+                set__status='queued',
+                set__error=str(e),
+                set__updated_at=datetime.datetime.utcnow(),
+            )
+            timer = threading.Timer(delay, _submit, args=[job.id])
+            timer.daemon = True
+            timer.start()
+        else:
+            Job.objects(id=job.id).update(
+                set__status='failed',
+                set__error=str(e),
+                set__updated_at=datetime.datetime.utcnow(),
+            )
+            print(f"JOB {job.id}: failed after {job.attempts} attempts")
+
+
+def recover_pending():
+    """
+    Re-submits queued jobs and jobs whose running lease has expired
+    (e.g. the worker process died mid-stage).
+    """
+    try:
+        stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+        queries.stale_running_jobs(stale).update(set__status='queued')
+        for job in Job.objects(status='queued').only('id'):
+            _submit(job.id)
+    except Exception as e:
+        print(f"Job recovery failed: {e}")
+
+
+def run_forever(poll_interval=5.0):
+    """
+    Standalone worker loop used by the `run_jobs` management command.
+    """
+    _get_executor()
+    while True:
+        recover_pending()
+        time.sleep(poll_interval)
+
+
+def job_to_dict(job):
+    return {
+        'id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'stages': [
+            {'name': s.get('name'), 'status': s.get('status')}
+            for s in job.stages
+        ],
+        'attempts': job.attempts,
+        'result': job.result if job.status == 'succeeded' else None,
+        'error': job.error if job.status == 'failed' else None,
+    }
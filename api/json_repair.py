@@ -0,0 +1,253 @@
+"""
+Tolerant single-pass JSON extraction for LLM output.
+
+One scan over the text handles everything call_doubao used to do with
+several regex passes and re-parses:
+- skips Markdown fences and prose around the JSON value,
+- escapes raw control characters inside strings (instead of deleting them),
+- drops trailing commas before } and ],
+- optionally closes a truncated document (streaming / cut-off output).
+The cleaned text is then parsed once with json.loads. Well-formed output
+skips the rewrite and is decoded in place.
+
+The parser is incremental: feed() may be called with chunks as they stream in.
+"""
+import json
+import re
+import threading
+
+# Characters the scanner stops at; everything between them is copied verbatim.
+# Outside strings, ordinary whitespace is not interesting; inside strings only
+# the closing quote, escapes and raw control characters are.
+_STRUCTURAL = re.compile(r'["{}\[\],\x00-\x08\x0b\x0c\x0e-\x1f]')
+_IN_STRING = re.compile(r'["\\\x00-\x1f]')
+_PARTIAL_UNICODE = re.compile(r'(\\+)u[0-9a-fA-F]{0,3}$')
+_decoder = json.JSONDecoder()
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f'}
+
+_stats = {'parsed': 0, 'failed': 0}
+_repair_counts = {}
+_stats_lock = threading.Lock()
+
+
+class JSONRepairError(ValueError):
+    def __init__(self, message, repairs):
+        super().__init__(message)
+        self.repairs = repairs
+
+
+class TolerantJSONParser:
+    def __init__(self):
+        self.out = []
+        self.stack = [] # open containers: '{' or '['
+        self.in_string = False
+        self.escape_pending = False # a backslash ended the previous chunk
+        self.comma_index = None # position in out of a comma that may turn out to be trailing
+        self.last_structural = None
+        self.key_start = None # position in out of an object key not yet followed by its value
+        self.started = False
+        self.done = False
+        self.repairs = []
+
+    def _repair(self, name):
+        if name not in self.repairs:
+            self.repairs.append(name)
+
+    def feed(self, text):
+        if self.done or not text:
+            return
+        pos = 0
+        if not self.started:
+            start = _first_container(text)
+            if start == -1:
+                if text.strip():
+                    self._repair('stripped_prefix')
+                return
+            if text[:start].strip():
+                self._repair('stripped_prefix')
+            self.started = True
+            pos = start
+
+        if self.escape_pending:
+            self.out.append(text[0])
+            self.escape_pending = False
+            pos = max(pos, 1)
+
+        out = self.out
+        n = len(text)
+        while pos < n:
+            if self.in_string:
+                m = _IN_STRING.search(text, pos)
+                if m is None:
+                    break
+                i = m.start()
+                out.append(text[pos:i])
+                ch = text[i]
+                if ch == '"':
+                    out.append(ch)
+                    self.in_string = False
+                elif ch == '\\':
+                    if i + 1 < n:
+                        out.append(text[i:i + 2])
+                        pos = i + 2
+                        continue
+                    out.append(ch)
+                    self.escape_pending = True
+                else:
+                    out.append(_CONTROL_ESCAPES.get(ch, f'\\u{ord(ch):04x}'))
+                    self._repair('escaped_control_chars')
+                pos = i + 1
+                continue
+
+            m = _STRUCTURAL.search(text, pos)
+            if m is None:
+                break
+            i = m.start()
+            gap = text[pos:i]
+            ch = text[i]
+            if self.comma_index is not None and gap.strip():
+                self.comma_index = None
+            out.append(gap)
+            expect_key = self.stack and self.stack[-1] == '{' and self.last_structural in ('{', ',')
+            self.key_start = None
+            if ch in '"{}[],':
+                self.last_structural = ch
+            if ch == '"':
+                self.comma_index = None
+                self.in_string = True
+                if expect_key:
+                    self.key_start = len(out)
+                out.append(ch)
+            elif ch == ',':
+                self.comma_index = len(out)
+                out.append(ch)
+            elif ch in '{[':
+                self.comma_index = None
+                self.stack.append(ch)
+                out.append(ch)
+            elif ch in '}]':
+                if self.comma_index is not None:
+                    out[self.comma_index] = ''
+                    self.comma_index = None
+                    self._repair('trailing_comma')
+                if self.stack:
+                    self.stack.pop()
+                out.append(ch)
+                if not self.stack:
+                    self.done = True
+                    if text[i + 1:].strip():
+                        self._repair('stripped_suffix')
+                    return
+            else:
+                self._repair('dropped_control_chars')
+            pos = i + 1
+
+        out.append(text[pos:])
+
+    def finish(self, allow_partial=False):
+        """
+        Returns (value, repairs). With allow_partial, an unterminated
+        document is closed so the received part can still be used.
+        """
+        if not self.started:
+            raise JSONRepairError("No JSON object or array found", self.repairs)
+        repairs = list(self.repairs) # finish() may run on every streamed prefix; feed() keeps going
+        if not self.done:
+            if not allow_partial:
+                raise JSONRepairError("Unterminated JSON document", repairs)
+            repairs.append('closed_truncated')
+            text = ''.join(self.out)
+            in_string = self.in_string
+            if self.key_start is not None:
+                # A key cut off before its value ('{"na' or '{"name"') is dropped
+                after_key = ''.join(self.out[self.key_start:])
+                if in_string or ':' not in after_key[1:].split('"', 1)[-1]:
+                    text = ''.join(self.out[:self.key_start])
+                    in_string = False
+            if in_string:
+                # Drop an escape cut short: a lone backslash or a partial \uXXXX
+                if self.escape_pending:
+                    text = text[:-1]
+                else:
+                    m = _PARTIAL_UNICODE.search(text)
+                    if m and len(m.group(1)) % 2:
+                        text = text[:m.start() + len(m.group(1)) - 1]
+                text += '"'
+            text = text.rstrip()
+            if text.endswith(','):
+                text = text[:-1]
+            elif text.endswith(':'):
+                text += ' null'
+            closing = ''.join('}' if c == '{' else ']' for c in reversed(self.stack))
+            text += closing
+        else:
+            text = ''.join(self.out)
+        try:
+            return json.loads(text), repairs
+        except ValueError as e:
+            raise JSONRepairError(str(e), repairs)
+
+
+def _first_container(text, start=0):
+    brace = text.find('{', start)
+    bracket = text.find('[', start)
+    if brace == -1:
+        return bracket
+    if bracket == -1:
+        return brace
+    return min(brace, bracket)
+
+
+def parse(text, allow_partial=False):
+    """
+    Parses possibly messy LLM output. Returns (value, repairs) where repairs
+    lists the fixes applied; raises JSONRepairError if nothing usable is found.
+    """
+    # Fast path: well-formed JSON, possibly wrapped in a fence or prose, needs
+    # no rewriting; raw_decode stops at the end of the value
+    start = _first_container(text)
+    if start != -1:
+        try:
+            value, end = _decoder.raw_decode(text, start)
+            repairs = []
+            if text[:start].strip():
+                repairs.append('stripped_prefix')
+            if text[end:].strip():
+                repairs.append('stripped_suffix')
+            _record(True, repairs)
+            return value, repairs
+        except ValueError:
+            pass
+
+    last_error = None
+    start = 0
+    # Prose before the payload may itself contain a brace; retry from the next one
+    for _ in range(3):
+        start = _first_container(text, start)
+        if start == -1:
+            break
+        parser = TolerantJSONParser()
+        parser.feed(text[start:])
+        try:
+            value, repairs = parser.finish(allow_partial=allow_partial)
+            if start and text[:start].strip() and 'stripped_prefix' not in repairs:
+                repairs.insert(0, 'stripped_prefix')
+            _record(True, repairs)
+            return value, repairs
+        except JSONRepairError as e:
+            last_error = e
+            start += 1
+    _record(False, last_error.repairs if last_error else [])
+    raise last_error or JSONRepairError("No JSON object or array found", [])
+
+
+def _record(ok, repairs):
+    with _stats_lock:
+        _stats['parsed' if ok else 'failed'] += 1
+        for name in repairs:
+            _repair_counts[name] = _repair_counts.get(name, 0) + 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats, repairs=dict(_repair_counts))
@@ -0,0 +1,203 @@
+"""
+Content-addressed cache for LLM responses.
+
+Keyed on (model, system prompt, user prompt, parse mode). Two tiers:
+an in-process LRU in front of the shared `llm_cache` Mongo collection,
+which expires entries by TTL index and is trimmed to a maximum size.
+Only successfully parsed responses are ever stored.
+"""
+import contextvars
+import copy
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import LLMCacheEntry
+from . import queries, singleflight
+
+LLM_CACHE_ENABLED = getattr(settings, 'LLM_CACHE_ENABLED', True)
+LLM_CACHE_LOCAL_SIZE = getattr(settings, 'LLM_CACHE_LOCAL_SIZE', 256) # entries kept in process
+LLM_CACHE_MAX_ENTRIES = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 5000) # entries kept in Mongo
+LLM_CACHE_TTL = getattr(settings, 'LLM_CACHE_TTL', 7 * 24 * 3600) # seconds
+TRIM_EVERY = 50 # shared-tier writes between size checks
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0}
+_writes_since_trim = 0
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+def make_key(model, system_prompt, user_prompt, parse_mode):
+    h = hashlib.sha256()
+    for part in (model, system_prompt, user_prompt, parse_mode):
+        h.update((part or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+@contextmanager
+def bypass(enabled=True):
+    """
+    Skips the cache (both lookup and store) for LLM calls made in this context,
+    e.g. when a student explicitly asks to regenerate.
+    """
+    token = _bypass.set(_bypass.get() or bool(enabled))
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_bypassed():
+    return not LLM_CACHE_ENABLED or _bypass.get()
+
+
+def _bump(counter):
+    with _lock:
+        _stats[counter] += 1
+
+
+def _remember_local(key, value):
+    with _lock:
+        _local[key] = (time.monotonic(), value)
+        _local.move_to_end(key)
+        while len(_local) > LLM_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def get(key):
+    """
+    Returns (hit, value).
+    """
+    if is_bypassed():
+        _bump('bypassed')
+        return False, None
+
+    with _lock:
+        if key in _local:
+            stored_at, value = _local[key]
+            if time.monotonic() - stored_at <= LLM_CACHE_TTL:
+                _local.move_to_end(key)
+                _stats['local_hits'] += 1
+                # Callers mutate the returned nodes/edges, never hand out the cached object
+                return True, copy.deepcopy(value)
+            del _local[key]
+
+    hit, value = get_shared(key)
+    if hit:
+        return True, value
+
+    _bump('misses')
+    return False, None
+
+
+def get_shared(key):
+    """
+    Looks the key up in the Mongo tier only. Returns (hit, value).
+    """
+    try:
+        entry = queries.llm_cache_entry(key).only('response', 'created_at', 'expires_at').first()
+    except Exception as e:
+        print(f"LLM cache lookup failed: {e}")
+        return False, None
+
+    if entry is not None:
+        # The TTL monitor only runs once a minute, so double check the expiry here.
+        # Entries stored before expires_at existed expire by age.
+        expires_at = entry.expires_at or entry.created_at + datetime.timedelta(seconds=LLM_CACHE_TTL)
+        if datetime.datetime.utcnow() <= expires_at:
+            value = json.loads(entry.response)
+            queries.llm_cache_entry(key).update(inc__hits=1, set__last_hit_at=datetime.datetime.utcnow())
+            _remember_local(key, copy.deepcopy(value))
+            _bump('shared_hits')
+            return True, value
+    return False, None
+
+
+def put(key, value, model=None, parse_mode=None):
+    global _writes_since_trim
+    if is_bypassed() or value is None:
+        return
+
+    _remember_local(key, copy.deepcopy(value))
+    encoded = json.dumps(value, ensure_ascii=False)
+    now = datetime.datetime.utcnow()
+    try:
+        queries.llm_cache_entry(key).update_one(
+            upsert=True,
+            set__model=model,
+            set__parse_mode=parse_mode,
+            set__response=encoded,
+            set__size=len(encoded),
+            set__created_at=now,
+            set__expires_at=now + datetime.timedelta(seconds=LLM_CACHE_TTL),
+            set__last_hit_at=now,
+        )
+    except Exception as e:
+        print(f"LLM cache store failed: {e}")
+        return
+
+    _bump('stores')
+    with _lock:
+        _writes_since_trim += 1
+        should_trim = _writes_since_trim >= TRIM_EVERY
+        if should_trim:
+            _writes_since_trim = 0
+    if should_trim:
+        trim()
+
+
+def trim():
+    """
+    Evicts least recently hit entries beyond LLM_CACHE_MAX_ENTRIES.
+    """
+    try:
+        overflow = LLMCacheEntry.objects.count() - LLM_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale_ids = [e.id for e in queries.least_recent_llm_cache_entries(overflow)]
+            LLMCacheEntry.objects(id__in=stale_ids).delete()
+            print(f"LLM cache trimmed {len(stale_ids)} entries")
+    except Exception as e:
+        print(f"LLM cache trim failed: {e}")
+
+
+def cached_call(model, system_prompt, user_prompt, parse_mode, producer):
+    """
+    Returns the cached response for the prompt, or calls `producer()` and
+    caches its result. `producer` must return None on failure so that
+    failures are never cached.
+    """
+    key = make_key(model, system_prompt, user_prompt, parse_mode)
+    hit, value = get(key)
+    if hit:
+        print(f"LLM cache hit ({parse_mode}) {key[:12]}")
+        return value
+
+    if is_bypassed():
+        # An explicit fresh call is never coalesced with (or stored for) anyone else
+        return producer()
+
+    def produce_and_store():
+        value = producer()
+        if value is not None:
+            put(key, value, model=model, parse_mode=parse_mode)
+        return value
+
+    # Identical concurrent calls (same key) share one upstream request
+    return singleflight.do(key, produce_and_store, lambda: get_shared(key))
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result['local_size'] = len(_local)
+    lookups = result['local_hits'] + result['shared_hits'] + result['misses']
+    result['hit_rate'] = round((result['local_hits'] + result['shared_hits']) / lookups, 3) if lookups else 0.0
+    return result
@@ -0,0 +1,87 @@
+"""
+Process-wide Ark (OpenAI-compatible) client.
+
+Configuration is read once from settings, and a single OpenAI client backed
+by a pooled httpx client is shared by every LLM call, so calls reuse
+keep-alive connections instead of paying for a new TLS handshake each time.
+"""
+import threading
+
+import httpx
+from django.conf import settings
+from openai import OpenAI
+
+
+class LLMConfig:
+    def __init__(self):
+        self.api_key = getattr(settings, 'ARK_API_KEY', '')
+        # Point at a local stand-in server for load tests
+        self.base_url = getattr(settings, 'ARK_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.model = getattr(settings, 'DOUBAO_ENDPOINT_ID', 'doubao-seed-1-6-flash-250828')
+        self.timeout = getattr(settings, 'LLM_TIMEOUT', 120.0) # seconds, whole request
+        self.connect_timeout = getattr(settings, 'LLM_CONNECT_TIMEOUT', 10.0)
+        self.max_connections = getattr(settings, 'LLM_MAX_CONNECTIONS', 20)
+        self.max_keepalive = getattr(settings, 'LLM_MAX_KEEPALIVE', 10)
+        self.keepalive_expiry = getattr(settings, 'LLM_KEEPALIVE_EXPIRY', 60.0)
+        # The SDK retries 429s and timeouts inside one governor.call, hidden from
+        # the breaker and the AIMD limiter; leave retrying to the callers' fallbacks
+        self.max_retries = getattr(settings, 'LLM_MAX_RETRIES', 0)
+
+
+_config = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_config():
+    global _config
+    if _config is None:
+        with _lock:
+            if _config is None:
+                _config = LLMConfig()
+    return _config
+
+
+def build_client(config):
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+    )
+    return OpenAI(
+        api_key=config.api_key or 'missing-key',
+        base_url=config.base_url,
+        max_retries=config.max_retries,
+        http_client=http_client,
+    )
+
+
+def get_client():
+    """
+    Returns the shared client, creating it on first use.
+    The OpenAI client is thread-safe, so job workers share it.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = build_client(get_config())
+    return _client
+
+
+def reset(**overrides):
+    """
+    Closes the pooled client and reloads configuration, optionally
+    overriding fields (e.g. base_url for a local stand-in server).
+    """
+    global _client, _config
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _config = LLMConfig()
+        for name, value in overrides.items():
+            setattr(_config, name, value)
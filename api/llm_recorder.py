@@ -0,0 +1,60 @@
+"""
+Captures real prompt/response pairs as replay fixtures for the mock LLM server.
+
+Enabled by setting LLM_RECORD_DIR; each successful upstream completion is
+appended to <LLM_RECORD_DIR>/recorded.jsonl as
+{"fingerprint", "model", "system", "user", "response"}.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+
+LLM_RECORD_DIR = getattr(settings, 'LLM_RECORD_DIR', '')
+_lock = threading.Lock()
+
+
+def fingerprint(system_prompt, user_prompt):
+    return hashlib.sha256(f"{system_prompt}\x00{user_prompt}".encode('utf-8')).hexdigest()
+
+
+def record(model, messages, response):
+    if not LLM_RECORD_DIR:
+        return
+    system_prompt = next((m['content'] for m in messages if m['role'] == 'system'), '')
+    user_prompt = next((m['content'] for m in messages if m['role'] == 'user'), '')
+    line = json.dumps({
+        'fingerprint': fingerprint(system_prompt, user_prompt),
+        'model': model,
+        'system': system_prompt,
+        'user': user_prompt,
+        'response': response,
+    }, ensure_ascii=False)
+    try:
+        os.makedirs(LLM_RECORD_DIR, exist_ok=True)
+        with _lock:
+            with open(os.path.join(LLM_RECORD_DIR, 'recorded.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except OSError as e:
+        print(f"LLM recording failed: {e}")
+
+
+def load_fixtures(paths):
+    """
+    Reads fixture files (or directories of *.jsonl) into {fingerprint: response}.
+    """
+    fixtures = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.jsonl')]
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        fixtures[entry['fingerprint']] = entry['response']
+    return fixtures
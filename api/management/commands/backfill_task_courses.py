@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateMany
+
+from api.models import Course, Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies course name/icon onto tasks generated before Task kept a "
+        "snapshot of them, so task details no longer fall back to a Course read."
+    )
+
+    def handle(self, *args, **options):
+        collection = Task._get_collection()
+        course_ids = collection.distinct('course', {'course_name': None, 'course': {'$ne': None}})
+        courses = Course.objects(id__in=course_ids).only('name', 'icon') if course_ids else []
+        operations = [
+            UpdateMany({'course': course.id, 'course_name': None},
+                       {'$set': {'course_name': course.name, 'course_icon': course.icon}})
+            for course in courses
+        ]
+        updated = collection.bulk_write(operations, ordered=False).modified_count if operations else 0
+        self.stdout.write(f"Backfilled {updated} tasks across {len(operations)} courses")
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.concepts import ConceptMatcher
+
+TOPICS = [
+    'graph', 'tree', 'hash table', 'heap', 'sorting', 'dynamic programming', 'recursion', 'linked list',
+    'matrix', 'eigenvalue', 'probability', 'regression', 'neural network', 'gradient descent', 'compiler',
+    'parser', 'scheduling', 'memory', 'cache', 'network', 'protocol', 'database', 'index', 'transaction',
+    '线性代数', '概率论', '数据结构', '操作系统', '编译原理', '机器学习',
+]
+QUALIFIERS = ['introduction to', 'advanced', 'applied', 'basic', 'theory of', 'algorithms for', 'lab:', 'review of']
+
+
+def legacy_attach(nodes, from_concept):
+    # The nested scan generate_tasks used before ConceptMatcher
+    for n in nodes:
+        if n['label'].lower() in from_concept.lower() or from_concept.lower() in n['label'].lower():
+            return n['id']
+    return None
+
+
+def _graph(rng, size):
+    nodes = []
+    for i in range(size):
+        label = f"{rng.choice(QUALIFIERS)} {rng.choice(TOPICS)} {rng.choice(TOPICS)} {i}"
+        nodes.append({'id': f"n{i}", 'label': label.title()})
+    return nodes
+
+
+def _links(rng, nodes, count):
+    links = []
+    for _ in range(count):
+        target = rng.choice(nodes)['label']
+        # Models paraphrase: drop the qualifier, change case, add plurals or trailing words
+        words = target.split()
+        variant = rng.choice([
+            target,
+            target.lower(),
+            ' '.join(words[1:]),
+            target + ' Basics',
+            ' '.join(w + 's' if w.isalpha() and len(w) > 3 else w for w in words),
+        ])
+        links.append((variant, target))
+    return links
+
+
+class Command(BaseCommand):
+    help = "Benchmarks cross-link attachment: nested substring scan vs ConceptMatcher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*', default=[100, 1000, 5000])
+        parser.add_argument('--links', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        for size in options['sizes']:
+            nodes = _graph(rng, size)
+            links = _links(rng, nodes, options['links'])
+            labels = {n['id']: n['label'] for n in nodes}
+
+            start = time.perf_counter()
+            legacy = [legacy_attach(nodes, concept) for concept, _ in links]
+            legacy_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            matcher = ConceptMatcher((n['id'], n['label']) for n in nodes)
+            build_ms = (time.perf_counter() - start) * 1000
+            samples = []
+            indexed = []
+            for concept, _ in links:
+                t = time.perf_counter()
+                indexed.append(matcher.best(concept))
+                samples.append((time.perf_counter() - t) * 1000)
+
+            def accuracy(results):
+                hits = sum(1 for key, (_, target) in zip(results, links) if key and labels[key] == target)
+                return f"{hits}/{len(links)}"
+
+            self.stdout.write(
+                f"{size:>6} nodes, {len(links)} links | "
+                f"nested scan {legacy_ms:.1f} ms ({accuracy(legacy)} exact targets) | "
+                f"index build {build_ms:.1f} ms + lookups {sum(samples):.1f} ms "
+                f"(median {statistics.median(samples):.3f} ms, {accuracy(indexed)} exact targets)"
+            )
@@ -0,0 +1,166 @@
+import json
+import random
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import json_repair
+from api.llm_recorder import load_fixtures
+from api.mock_llm import canned_response
+
+
+def legacy_parse(content):
+    # The regex repair chain call_doubao used before json_repair
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+    content = content.strip()
+    content = re.sub(r'[\x00-\x1F\x7F]', '', content)
+    content = re.sub(r',\s*([\]}])', r'\1', content)
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        start = content.find('{')
+        end = content.rfind('}')
+        if start != -1 and end != -1:
+            return json.loads(content[start:end + 1])
+        raise
+
+
+def _strip_fence(text):
+    match = re.search(r'```(?:json)?\s*(.*?)```', text, re.S)
+    return match.group(1) if match else text
+
+
+def _sample_corpus():
+    graph_prompt = 'Return {"nodes": [...], "edges": [...]}'
+    corpus = [
+        canned_response('Curriculum Data Specialist', 'x'), # Markdown, skipped below
+        canned_response('Return JSON: {"tasks": [...]}', 'Generate 5 tasks'),
+        canned_response('Return {"cross_links": []}', 'x'),
+        canned_response(graph_prompt, 'Data Structures'),
+    ]
+    # A large graph like a chunk-merged syllabus produces
+    nodes = [{'id': f"n{i}", 'label': f"概念 {i}: Topic with \"quotes\" and \\ slashes", 'level': i % 3} for i in range(400)]
+    edges = [{'from': f"n{i // 3}", 'to': f"n{i}", 'label': 'Strong'} for i in range(1, 400)]
+    corpus.append("```json\n" + json.dumps({'nodes': nodes, 'edges': edges}, ensure_ascii=False, indent=2) + "\n```")
+    return corpus
+
+
+def _mutate(rng, value):
+    """
+    Re-serializes value with the kinds of damage model outputs show.
+    Returns (text, expected) where expected is what a correct repair yields.
+    """
+    expected = value
+
+    def inject_string_noise(v):
+        if isinstance(v, dict):
+            return {k: inject_string_noise(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [inject_string_noise(x) for x in v]
+        if isinstance(v, str) and v and rng.random() < 0.3:
+            cut = rng.randrange(len(v) + 1)
+            return v[:cut] + rng.choice(['\n', '\t', '\r\n', '\x0b']) + v[cut:]
+        return v
+
+    if rng.random() < 0.5:
+        expected = inject_string_noise(value)
+    text = json.dumps(expected, ensure_ascii=False, indent=rng.choice([None, 2]))
+    # Unescape the injected control characters so they appear raw, as models emit them
+    text = text.replace('\\n', '\n').replace('\\t', '\t').replace('\\r', '\r').replace('\\u000b', '\x0b')
+    if rng.random() < 0.5:
+        # Trailing commas after the last member of non-empty containers
+        text = re.sub(r'(?<=["\d}\]el])(\s*)([}\]])', lambda m: (',' if rng.random() < 0.3 else '') + m.group(1) + m.group(2), text)
+    wrap = rng.random()
+    if wrap < 0.3:
+        text = "```json\n" + text + "\n```"
+    elif wrap < 0.5:
+        text = "Here is the result:\n```\n" + text + "\n```\nLet me know if you need more."
+    elif wrap < 0.7:
+        text = "Sure! " + text + "\nHope this helps."
+    return text, expected
+
+
+class Command(BaseCommand):
+    help = "Fuzzes and benchmarks the tolerant JSON parser against the old regex repair chain."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=2000, help="Fuzz cases to generate")
+        parser.add_argument('--rounds', type=int, default=200, help="Benchmark repetitions per sample")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fixtures', nargs='*', default=[], help="Recorded responses (see LLM_RECORD_DIR) to add to the corpus")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = _sample_corpus() + list(load_fixtures(options['fixtures']).values())
+
+        values = []
+        for text in corpus:
+            try:
+                values.append(json.loads(_strip_fence(text)))
+            except ValueError:
+                continue # free-text responses (e.g. refined Markdown) are not JSON
+        self.stdout.write(f"Corpus: {len(corpus)} responses, {len(values)} JSON documents")
+
+        results = {'new': {'ok': 0, 'exact': 0}, 'legacy': {'ok': 0, 'exact': 0}}
+        failures = []
+        prefixes = 0
+        prefix_failures = []
+        for case in range(options['cases']):
+            text, expected = _mutate(rng, rng.choice(values))
+            for name, parse in (('new', lambda t: json_repair.parse(t)[0]), ('legacy', legacy_parse)):
+                try:
+                    value = parse(text)
+                except ValueError:
+                    if name == 'new':
+                        failures.append(text)
+                    continue
+                results[name]['ok'] += 1
+                if value == expected:
+                    results[name]['exact'] += 1
+
+            # Truncated streams must still yield a usable prefix once the value has started
+            cut = text[:rng.randrange(1, len(text) + 1)]
+            if json_repair._first_container(cut) != -1:
+                prefixes += 1
+                try:
+                    json_repair.parse(cut, allow_partial=True)
+                except ValueError:
+                    prefix_failures.append(cut)
+
+        cases = options['cases']
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:>7}: parsed {r['ok']}/{cases}, exact value {r['exact']}/{cases}"
+            )
+        for text in failures[:3]:
+            self.stdout.write(self.style.WARNING(f"Unparsed case: {text[:200]!r}"))
+        self.stdout.write(f"partial: parsed {prefixes - len(prefix_failures)}/{prefixes} truncated prefixes")
+        for text in prefix_failures[:3]:
+            self.stdout.write(self.style.WARNING(f"Unparsed prefix: {text[-200:]!r}"))
+
+        self.stdout.write("Benchmark (median per document):")
+        samples_to_time = [('clean', text) for text in corpus]
+        samples_to_time += [('damaged', _mutate(rng, value)[0]) for value in values]
+        for label, text in samples_to_time:
+            try:
+                legacy_parse(text)
+            except ValueError:
+                continue
+            timings = {}
+            for name, parse in (('new', json_repair.parse), ('legacy', legacy_parse)):
+                samples = []
+                for _ in range(options['rounds']):
+                    start = time.perf_counter()
+                    parse(text)
+                    samples.append((time.perf_counter() - start) * 1e6)
+                timings[name] = statistics.median(samples)
+            self.stdout.write(
+                f"  {label:>7} {len(text):>7} chars: json_repair {timings['new']:.1f} us, "
+                f"legacy {timings['legacy']:.1f} us"
+            )
+        self.stdout.write(f"Repairs applied: {json_repair.stats()['repairs']}")
@@ -0,0 +1,85 @@
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from api import llm_client
+
+CANNED_COMPLETION = json.dumps({
+    "id": "bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{\"ok\": true}"}}],
+}).encode('utf-8')
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(CANNED_COMPLETION)))
+        self.end_headers()
+        self.wfile.write(CANNED_COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measures per-call LLM client overhead: a new client per call vs the pooled client."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200)
+        parser.add_argument('--base-url', default=None, help="Existing OpenAI-compatible server (default: built-in stand-in)")
+
+    def handle(self, *args, **options):
+        server = None
+        base_url = options['base_url']
+        if not base_url:
+            server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+        messages = [{"role": "user", "content": "ping"}]
+        calls = options['calls']
+
+        def per_call_client():
+            # What call_doubao used to do on every invocation
+            load_dotenv()
+            client = OpenAI(api_key='bench', base_url=base_url)
+            client.chat.completions.create(model='bench', messages=messages)
+            client.close()
+
+        llm_client.reset(base_url=base_url, api_key='bench')
+
+        def pooled_client():
+            llm_client.get_client().chat.completions.create(model='bench', messages=messages)
+
+        try:
+            for name, fn in (('per-call client', per_call_client), ('pooled client', pooled_client)):
+                fn() # warm up
+                samples = []
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    fn()
+                    samples.append((time.perf_counter() - start) * 1000)
+                samples.sort()
+                self.stdout.write(
+                    f"{name:>16}: mean {statistics.mean(samples):.2f} ms, "
+                    f"p50 {samples[len(samples) // 2]:.2f} ms, "
+                    f"p95 {samples[int(len(samples) * 0.95) - 1]:.2f} ms over {calls} calls"
+                )
+        finally:
+            llm_client.reset()
+            if server:
+                server.shutdown()
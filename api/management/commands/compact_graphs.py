@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import graph_store
+from api.models import Graph
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the graph retention policy: keeps one snapshot per course "
+        "(removing per-generation graphs saved before versioning) and drops "
+        "deltas older than GRAPH_DELTA_RETENTION versions."
+    )
+
+    def handle(self, *args, **options):
+        courses = Graph.objects.distinct('course')
+        removed_graphs = 0
+        for course in courses:
+            latest = Graph.objects(course=course).order_by('-created_at').only('id', 'version').first()
+            if latest is None:
+                continue
+            before = Graph.objects(course=course).count()
+            graph_store.compact(course, latest.version, keep_graph_id=latest.id)
+            removed_graphs += before - 1
+        self.stdout.write(f"Compacted {len(courses)} course graphs, removed {removed_graphs} superseded snapshots")
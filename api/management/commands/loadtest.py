@@ -0,0 +1,205 @@
+import io
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+SAMPLE_SYLLABUS = "\n".join(
+    ["Course: Load Test 101", "Weekly Schedule"]
+    + [f"Week {i}: Topic {i} - core ideas and practice" for i in range(1, 15)]
+    + ["Assessment: Midterm (Week 7, 30%), Final (Week 15, 50%), Quizzes (20%)"]
+)
+
+# Endpoint -> relative weight in the request mix
+DEFAULT_MIX = {
+    'check_auth': 20,
+    'get_dashboard_data': 20,
+    'get_results': 10,
+    'get_task_details': 10,
+    'complete_task': 10,
+    'set_thinking_type': 5,
+    'login': 5,
+    'job_status': 10,
+    'job_stream': 5,
+    'metrics': 2, # 403 unless the target runs with DEBUG or the students are staff
+    'upload_course': 5,
+    'generate_tasks': 5,
+}
+
+
+def failed(res):
+    """
+    True for a 5xx or an error the views report in the body: most of them
+    answer {'status': 'error'} with HTTP 200.
+    """
+    if res.status_code >= 500:
+        return True
+    if 'application/json' not in res.headers.get('Content-Type', ''):
+        return False
+    try:
+        body = res.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and body.get('status') == 'error'
+
+
+class VirtualStudent:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.username = f"load_{uuid.uuid4().hex[:10]}"
+        self.password = uuid.uuid4().hex
+        self.task_ids = []
+        self.job_ids = []
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f"{self.base_url}/api/{path}/"
+
+    def setup(self):
+        self.session.post(self.url('register'), json={'username': self.username, 'password': self.password, 'major': 'Load'})
+        self.upload_course()
+
+    def upload_course(self):
+        files = {'file': (f"{uuid.uuid4().hex[:6]}.txt", io.BytesIO(SAMPLE_SYLLABUS.encode('utf-8')))}
+        res = self.session.post(self.url('upload_course'), files=files)
+        self._remember_job(res)
+        return res
+
+    def generate_tasks(self):
+        res = self.session.post(self.url('generate_tasks'), json={'count': 3, 'no_cache': False})
+        self._remember_job(res)
+        return res
+
+    def _remember_job(self, res):
+        try:
+            job_id = res.json().get('job_id')
+        except ValueError:
+            return
+        if job_id:
+            with self.lock:
+                self.job_ids = (self.job_ids + [job_id])[-10:]
+
+    def job_stream(self):
+        """
+        Reads the stream to its end, so the connection is held as long as a
+        browser would hold it. Returns False if the request failed.
+        """
+        with self.lock:
+            job_id = self.job_ids[-1] if self.job_ids else ''
+        res = self.session.get(self.url('job_stream'), params={'id': job_id}, stream=True)
+        with res:
+            if 'text/event-stream' not in res.headers.get('Content-Type', ''):
+                res.content # an error answered as JSON before the stream started
+                return not failed(res)
+            for line in res.iter_lines(decode_unicode=True):
+                if line == 'event: error':
+                    return False
+        return True
+
+    def get_dashboard_data(self):
+        res = self.session.get(self.url('get_dashboard_data'))
+        try:
+            tasks = res.json().get('tasks', [])
+            with self.lock:
+                self.task_ids = [t['id'] for t in tasks]
+        except ValueError:
+            pass
+        return res
+
+    def call(self, endpoint):
+        if endpoint == 'upload_course':
+            return self.upload_course()
+        if endpoint == 'generate_tasks':
+            return self.generate_tasks()
+        if endpoint == 'get_dashboard_data':
+            return self.get_dashboard_data()
+        if endpoint == 'login':
+            return self.session.post(self.url('login'), json={'username': self.username, 'password': self.password})
+        if endpoint == 'set_thinking_type':
+            return self.session.post(self.url('set_thinking_type'), json={'thinking_type': 'convergent'})
+        if endpoint in ('get_task_details', 'complete_task'):
+            with self.lock:
+                task_id = self.task_ids[0] if self.task_ids else ''
+            if endpoint == 'get_task_details':
+                return self.session.get(self.url('get_task_details'), params={'id': task_id})
+            return self.session.post(self.url('complete_task'), json={'task_id': task_id, 'status': 'completed'})
+        if endpoint == 'job_status':
+            with self.lock:
+                job_id = self.job_ids[-1] if self.job_ids else ''
+            return self.session.get(self.url('job_status'), params={'id': job_id})
+        return self.session.get(self.url(endpoint))
+
+
+class Command(BaseCommand):
+    help = "Drives the API endpoints at a target RPS and reports throughput and latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--rps', type=float, default=20.0)
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds")
+        parser.add_argument('--students', type=int, default=10)
+        parser.add_argument('--workers', type=int, default=64)
+        parser.add_argument('--only', nargs='*', default=None, help="Restrict the mix to these endpoints")
+
+    def handle(self, *args, **options):
+        mix = {k: v for k, v in DEFAULT_MIX.items() if not options['only'] or k in options['only']}
+        schedule = [name for name, weight in mix.items() for _ in range(weight)]
+
+        self.stdout.write(f"Setting up {options['students']} students...")
+        students = [VirtualStudent(options['base_url']) for _ in range(options['students'])]
+        for student in students:
+            student.setup()
+            student.get_dashboard_data()
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+
+        def fire(i):
+            endpoint = schedule[i % len(schedule)]
+            student = students[i % len(students)]
+            started = time.perf_counter()
+            try:
+                if endpoint == 'job_stream':
+                    ok = student.job_stream()
+                else:
+                    ok = not failed(student.call(endpoint))
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies[endpoint].append(elapsed)
+                if not ok:
+                    errors[endpoint] += 1
+
+        total = int(options['rps'] * options['duration'])
+        self.stdout.write(f"Sending {total} requests at {options['rps']} rps...")
+        # Open-loop: requests are scheduled on the clock, not after the previous one returns
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for i in range(total):
+                delay = t0 + i / options['rps'] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(fire, i)
+        wall = time.perf_counter() - t0
+
+        def pct(samples, p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        self.stdout.write(f"\n{'endpoint':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for endpoint in sorted(latencies):
+            samples = sorted(latencies[endpoint])
+            self.stdout.write(
+                f"{endpoint:<20}{len(samples):>7}{errors[endpoint]:>8}"
+                f"{pct(samples, 0.50):>10.1f}{pct(samples, 0.95):>10.1f}{pct(samples, 0.99):>10.1f}"
+                f"{statistics.mean(samples):>10.1f}"
+            )
+        done = sum(len(v) for v in latencies.values())
+        self.stdout.write(f"\nThroughput: {done / wall:.1f} req/s over {wall:.1f}s ({sum(errors.values())} errors)")
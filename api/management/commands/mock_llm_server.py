@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from api.llm_recorder import load_fixtures
+from api.mock_llm import MockLLMServer
+
+
+class Command(BaseCommand):
+    help = "Runs a deterministic OpenAI-compatible stand-in for the Ark endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', default='lognormal:800:0.4',
+                            help="fixed:MS | uniform:MIN:MAX | normal:MEAN:STD | lognormal:MEDIAN:SIGMA")
+        parser.add_argument('--token-delay-ms', type=float, default=5.0, help="Delay between streamed chunks")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 500")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+        parser.add_argument('--fixtures', nargs='*', default=[], help="Recorded JSONL files or directories to replay")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        fixtures = load_fixtures(options['fixtures'])
+        server = MockLLMServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            token_delay_ms=options['token_delay_ms'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            fixtures=fixtures,
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f"Mock LLM listening on http://{options['host']}:{options['port']}/api/v3 "
+            f"({len(fixtures)} recorded responses)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {server.counters}")
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from api import study_stats
+from api.models import Student, StudyStats, Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds StudyStats rows and Student.carrots from completed tasks. "
+        "Run once for task history from before incremental statistics; "
+        "afterwards every status change keeps them up to date."
+    )
+
+    def handle(self, *args, **options):
+        rows = {}
+        carrots = {}
+        completed = Task._get_collection().find(
+            {'status': 'completed'}, {'owner': 1, 'course': 1, 'completed_at': 1, 'date': 1},
+        )
+        for task in completed:
+            owner_id = task.get('owner')
+            if owner_id is None:
+                continue
+            # Tasks completed before completed_at existed count on the day they were generated
+            day = study_stats.day_of(task.get('completed_at') or task['date'])
+            row = rows.setdefault((owner_id, day), {'completed_count': 0, 'courses': {}})
+            row['completed_count'] += 1
+            if task.get('course'):
+                course_id = str(task['course'])
+                row['courses'][course_id] = row['courses'].get(course_id, 0) + 1
+            carrots[owner_id] = carrots.get(owner_id, 0) + study_stats.CARROTS_PER_TASK
+
+        StudyStats.objects.delete()
+        if rows:
+            StudyStats._get_collection().bulk_write([
+                UpdateOne({'owner': owner_id, 'date': day}, {'$set': values}, upsert=True)
+                for (owner_id, day), values in rows.items()
+            ], ordered=False)
+        Student._get_collection().update_many({}, {'$set': {'carrots': 0}})
+        if carrots:
+            Student._get_collection().bulk_write([
+                UpdateOne({'_id': owner_id}, {'$set': {'carrots': n}}) for owner_id, n in carrots.items()
+            ], ordered=False)
+        self.stdout.write(f"Rebuilt {len(rows)} daily rows and carrots for {len(carrots)} students")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import pipeline  # noqa: F401  (registers the job handlers)
+from api.jobs import run_forever
+
+
+class Command(BaseCommand):
+    help = "Runs a standalone background job worker pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=5.0, help="Seconds between queue sweeps")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Piggy job worker started")
+        run_forever(poll_interval=options['poll'])
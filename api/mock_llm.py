@@ -0,0 +1,201 @@
+"""
+Deterministic OpenAI-compatible stand-in for the Ark endpoint.
+
+Serves /chat/completions (plain or streamed) with configurable latency,
+error injection and canned or recorded responses, so the upload and
+generation paths can be load-tested without spending Ark quota.
+Point the app at it with ARK_BASE_URL=http://127.0.0.1:<port>/api/v3.
+
+Recorded fixtures (see llm_recorder.py) are replayed when the prompt
+fingerprint matches; anything else gets a canned schema-valid answer.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .llm_recorder import fingerprint
+
+
+class LatencyModel:
+    """
+    Parses specs like "fixed:800", "uniform:200:1500", "normal:800:200"
+    or "lognormal:800:0.5" (milliseconds).
+    """
+
+    def __init__(self, spec):
+        parts = spec.split(':')
+        self.kind = parts[0]
+        self.args = [float(p) for p in parts[1:]]
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            ms = self.args[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(self.args[0], self.args[1])
+        elif self.kind == 'normal':
+            ms = rng.gauss(self.args[0], self.args[1])
+        elif self.kind == 'lognormal':
+            # args: median ms, sigma of the underlying normal
+            ms = self.args[0] * rng.lognormvariate(0, self.args[1])
+        else:
+            raise ValueError(f"Unknown latency distribution '{self.kind}'")
+        return max(0.0, ms) / 1000
+
+
+def canned_response(system_prompt, user_prompt):
+    """
+    Deterministic, schema-valid answer for each prompt type the app sends.
+    """
+    seed = int(fingerprint(system_prompt, user_prompt)[:8], 16)
+    rng = random.Random(seed)
+
+    if 'Curriculum Data Specialist' in system_prompt:
+        weeks = '\n'.join(f"| Week {i} | Topic {rng.randint(1, 99)} |" for i in range(1, 13))
+        return (
+            "# Course Meta: Mock Course\n\n"
+            "# Weekly Schedule\n| Week/Lesson | Topic |\n|---|---|\n" + weeks + "\n\n"
+            "# Assessment Plan\n- Midterm (Week 7, 30%)\n- Final Exam (Week 13, 50%)\n- Quizzes (20%)"
+        )
+
+    if '"tasks"' in system_prompt:
+        match = re.search(r'Generate (\d+) tasks', user_prompt)
+        count = int(match.group(1)) if match else 3
+        return json.dumps({'tasks': [f"Review mock concept {rng.randint(1, 99)} and write a summary" for _ in range(count)]})
+
+    if 'cross_links' in system_prompt:
+        return json.dumps({'cross_links': []})
+
+    if '"nodes"' in system_prompt:
+        nodes = [{'id': 'root', 'label': 'Mock Course Goal', 'shape': 'box', 'color': '#FFD54F', 'level': 0}]
+        edges = []
+        for i in range(1, 5):
+            branch = f"b{i}"
+            nodes.append({'id': branch, 'label': f"Module {i}", 'shape': 'box', 'color': '#FFCC80', 'level': 1})
+            edges.append({'from': 'root', 'to': branch, 'arrows': 'to', 'color': {'color': '#EF5350'}, 'label': 'Strong'})
+            for j in range(1, 3):
+                leaf = f"{branch}_{j}"
+                nodes.append({'id': leaf, 'label': f"Concept {i}.{j}", 'shape': 'ellipse', 'color': '#FFE0B2', 'level': 2})
+                edges.append({'from': branch, 'to': leaf, 'arrows': 'to', 'color': {'color': '#42A5F5'}, 'label': 'Weak'})
+        return "```json\n" + json.dumps({'nodes': nodes, 'edges': edges, 'concepts': [n['label'] for n in nodes[1:]]}) + "\n```"
+
+    return json.dumps({'ok': True})
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency='fixed:0', token_delay_ms=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, fixtures=None, seed=0):
+        super().__init__(address, MockLLMHandler)
+        self.latency = LatencyModel(latency)
+        self.token_delay = token_delay_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.fixtures = fixtures or {}
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.counters = {'requests': 0, 'replayed': 0, 'canned': 0, 'errors': 0, 'rate_limited': 0}
+
+    def count(self, name):
+        with self.rng_lock:
+            self.counters[name] += 1
+
+    def draw(self):
+        with self.rng_lock:
+            return self.rng.random(), self.latency.sample(self.rng)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            return self._send_json(200, self.server.counters)
+        self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': {'message': 'Not found'}})
+
+        server.count('requests')
+        roll, delay = server.draw()
+        time.sleep(delay)
+
+        if roll < server.rate_limit_rate:
+            server.count('rate_limited')
+            return self._send_json(429, {'error': {'message': 'Mock rate limit', 'type': 'rate_limit'}})
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count('errors')
+            return self._send_json(500, {'error': {'message': 'Mock upstream error'}})
+
+        messages = request.get('messages', [])
+        system_prompt = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        user_prompt = next((m['content'] for m in messages if m['role'] == 'user'), '')
+        content = server.fixtures.get(fingerprint(system_prompt, user_prompt))
+        if content is not None:
+            server.count('replayed')
+        else:
+            server.count('canned')
+            content = canned_response(system_prompt, user_prompt)
+
+        model = request.get('model', 'mock')
+        if request.get('stream'):
+            return self._stream(model, content)
+        self._send_json(200, {
+            'id': 'mock-completion',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': len(system_prompt + user_prompt) // 4, 'completion_tokens': len(content) // 4, 'total_tokens': 0},
+        })
+
+    def _stream(self, model, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        step = 16 # characters per streamed token
+        for i in range(0, len(content), step):
+            write_event(json.dumps({
+                'id': 'mock-completion',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': content[i:i + step]}, 'finish_reason': None}],
+            }))
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+        write_event(json.dumps({
+            'id': 'mock-completion',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }))
+        write_event('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, IntField, ListField, DictField, ReferenceField, DateTimeField, BooleanField
+from mongoengine import Document, StringField, IntField, FloatField, ListField, DictField, ReferenceField, DateTimeField, BooleanField, ObjectIdField
 import datetime
 
 class Student(Document):
@@ -16,32 +16,189 @@ class Course(Document):
     extracted_concepts = ListField(StringField()) # AI-extracted key concepts for cross-linking
     owner = ReferenceField(Student)
     created_at = DateTimeField(default=datetime.datetime.utcnow)
+    # Near-duplicate of an earlier upload (any student) whose refinement was reused
+    duplicate_of = ReferenceField('Course')
+    similarity = FloatField()
+    base_graphs = DictField() # thinking_type -> structure extraction result {nodes, edges, concepts}
+    job = ObjectIdField() # the upload_course job that created it, so a retry does not create another
     
-    meta = {'collection': 'course'}
+    meta = {
+        'collection': 'course',
+        'indexes': [
+            ('owner', '-created_at'), # latest course of a student
+            {'fields': ['job'], 'unique': True, 'sparse': True},
+        ]
+    }
+
+class CourseSignature(Document):
+    # MinHash signature of a course's cleaned text, bucketed for LSH lookup (api/similarity.py)
+    course = ReferenceField(Course, required=True)
+    minhash = ListField(IntField())
+    bands = ListField(StringField()) # "<band>:<hash of its rows>"
+    chars = IntField()
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {
+        'collection': 'course_signature',
+        'indexes': ['bands', 'course'],
+    }
+
+class ConceptIndex(Document):
+    # Per-student BM25 index over courses' extracted_concepts (api/concepts.py),
+    # updated incrementally whenever a course's concepts are written
+    owner = ReferenceField(Student, required=True, unique=True)
+    df = DictField() # token -> number of courses containing it
+    courses = DictField() # course id -> {name, length, tf: {token: n}, concepts: [...]}
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {'collection': 'concept_index'}
 
 class Graph(Document):
+    # Current snapshot of a course's graph; earlier versions live on as GraphDelta records
     course = ReferenceField(Course)
     # Storing vis-network data structure directly
     nodes = ListField(DictField()) 
     edges = ListField(DictField())
     owner = ReferenceField(Student)
+    version = IntField(default=1)
+    layout = StringField() # thinking type the node x/y were computed for (api/layout.py)
     created_at = DateTimeField(default=datetime.datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
     
-    meta = {'collection': 'graph'}
+    meta = {
+        'collection': 'graph',
+        'indexes': [
+            ('course', '-created_at'), # current graph of a course
+        ]
+    }
+
+class GraphDelta(Document):
+    # Changes turning version `version - 1` of a course graph into `version` (api/graph_store.py)
+    course = ReferenceField(Course, required=True)
+    version = IntField(required=True)
+    nodes_upserted = ListField(DictField())
+    nodes_removed = ListField(StringField())
+    edges_upserted = ListField(DictField())
+    edges_removed = ListField(StringField())
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {
+        'collection': 'graph_delta',
+        'indexes': [
+            {'fields': ['course', 'version'], 'unique': True},
+        ]
+    }
+
+class TaskBatch(Document):
+    # The tasks of one generation; counters are kept with $inc on every status change (api/task_store.py)
+    course = ReferenceField(Course, required=True)
+    owner = ReferenceField(Student)
+    total = IntField(default=0)
+    completed = IntField(default=0)
+    skipped = IntField(default=0)
+    job = ObjectIdField() # the generate_tasks job that created it, so a retry does not create another
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {
+        'collection': 'task_batch',
+        'indexes': [
+            ('course', '-created_at'), # latest batch of a course
+            {'fields': ['job'], 'unique': True, 'sparse': True},
+        ]
+    }
 
 class Task(Document):
     content = StringField(required=True)
     status = StringField(default="pending") # pending, completed, skipped
     course = ReferenceField(Course)
+    course_name = StringField() # snapshot of course.name/icon at generation, so details skip the Course read
+    course_icon = StringField()
     owner = ReferenceField(Student)
+    batch = ReferenceField(TaskBatch) # unset on tasks generated before batches
     date = DateTimeField(default=datetime.datetime.utcnow)
     is_completed = BooleanField(default=False)
+    completed_at = DateTimeField() # set while completed; decides which StudyStats day an undo decrements
+    status_change = ObjectIdField() # token of the write that last changed status (api/task_store.py)
     
-    meta = {'collection': 'task'}
+    meta = {
+        'collection': 'task',
+        'indexes': [
+            ('course', '-date'), # latest tasks of a course without a batch
+            'batch', # tasks of a batch (dashboard)
+        ]
+    }
 
 class StudyStats(Document):
+    # One row per student per (UTC) day, upserted with $inc on every task status change (api/study_stats.py)
     owner = ReferenceField(Student)
     date = DateTimeField() # Just the date part usually, but DateTime is fine
     completed_count = IntField(default=0)
+    skipped_count = IntField(default=0)
+    courses = DictField() # course id -> tasks completed that day
+    
+    meta = {
+        'collection': 'study_stats',
+        'indexes': [
+            {'fields': ['owner', '-date'], 'unique': True},
+        ]
+    }
+
+class Job(Document):
+    # Durable background job (upload refinement, task generation...)
+    kind = StringField(required=True) # upload_course, generate_tasks
+    status = StringField(default="queued") # queued, running, succeeded, failed
+    owner = ReferenceField(Student)
+    idempotency_key = StringField() # Same key -> same job, so a double click never runs the LLM twice
+    payload = DictField()
+    result = DictField()
+    error = StringField()
+    stage = StringField() # Name of the stage currently running
+    stages = ListField(DictField()) # [{name, status, started_at, finished_at}]
+    progress = IntField(default=0) # 0-100
+    partial = DictField() # Streamed partial output: {refined: {part: text}, nodes: [...]}
+    checkpoints = DictField() # results of steps that must not run twice across attempts (JobContext.checkpoint)
+    attempts = IntField(default=0)
+    max_attempts = IntField(default=3)
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {
+        'collection': 'job',
+        'indexes': [
+            {'fields': ['idempotency_key'], 'unique': True, 'sparse': True},
+            ('status', 'updated_at'),
+        ]
+    }
+
+class LLMCacheEntry(Document):
+    # Shared tier of the LLM response cache (see llm_cache.py)
+    key = StringField(required=True, unique=True) # sha256 of (model, system prompt, user prompt, parse mode)
+    model = StringField()
+    parse_mode = StringField() # json or text
+    response = StringField() # JSON-encoded parsed response
+    size = IntField(default=0)
+    hits = IntField(default=0)
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    expires_at = DateTimeField() # created_at + LLM_CACHE_TTL, so changing the TTL needs no index rebuild
+    last_hit_at = DateTimeField(default=datetime.datetime.utcnow)
+    
+    meta = {
+        'collection': 'llm_cache',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+            'last_hit_at',
+        ]
+    }
+
+class LLMLease(Document):
+    # Cross-process single-flight lease: whoever holds the key makes the upstream call
+    key = StringField(required=True, unique=True)
+    holder = StringField() # host:pid:thread of the leader
+    expires_at = DateTimeField()
     
-    meta = {'collection': 'study_stats'}
+    meta = {
+        'collection': 'llm_lease',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+        ]
+    }
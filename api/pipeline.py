@@ -0,0 +1,282 @@
+"""
+AI pipelines run by the background job workers (see jobs.py).
+Each function is registered as the handler for one job kind.
+"""
+import copy
+import time
+
+from .models import Course
+from .jobs import register
+from . import dashboard_cache, graph_store, llm_cache, queries, similarity, task_store
+from .stage_graph import Stage, StageGraph
+from .cleaning import dehydrate
+from .concepts import ConceptMatcher, index_course, load_index, related_courses
+from .streaming import JobStreamWriter, sink_scope
+from .ai_service import SYLLABUS_MAX_CHARS, extract_course_structure, generate_smart_tasks, find_cross_connections, refine_syllabus_with_doubao
+
+UPLOAD_STAGES = ['clean', 'match', 'refine', 'save']
+GENERATE_STAGES = ['structure', 'cross_links', 'tasks', 'save']
+
+
+@register('upload_course')
+def run_upload_course(job, ctx):
+    # Partial refined Markdown is relayed to the page through /api/job_stream/
+    writer = JobStreamWriter(job.id)
+    try:
+        with sink_scope(writer):
+            return _upload_course(job, ctx)
+    finally:
+        writer.flush()
+
+
+def _upload_course(job, ctx):
+    payload = job.payload
+    student = job.owner
+    file_name = payload['file_name']
+    # Page numbers, running headers/footers and boilerplate are removed
+    # locally so the refiner gets a smaller prompt
+    with ctx.stage('clean'):
+        slides = (payload.get('extraction') or {}).get('format') == 'pptx'
+        text_content, cleaning_report = dehydrate(payload['text'], slides=slides)
+
+    # Classmates upload near-identical syllabi; reuse an earlier refinement when one matches
+    with ctx.stage('match'):
+        signature = similarity.signature(text_content)
+        match, score = (None, 0.0) if payload.get('no_cache') else similarity.find_similar(signature)
+        if match:
+            print(f"DEBUG: Near-duplicate of course {match.id} (similarity {score:.2f}), reusing its refinement")
+
+    # --- 🚀 Doubao Refinement Pipeline ---
+    with ctx.stage('refine'):
+        if match:
+            refined_content = match.refined_text
+        else:
+            print(f"DEBUG: Starting Doubao refinement for {file_name}")
+            refined_content = refine_syllabus_with_doubao(text_content, use_cache=not payload.get('no_cache'))
+
+    with ctx.stage('save'):
+        # A retried job (e.g. the index update below failed) keeps the course its earlier attempt saved
+        course = queries.job_course(job.id).first()
+        if course is None:
+            course = Course(
+                name=file_name.split('.')[0],
+                outline_text=text_content[:SYLLABUS_MAX_CHARS],
+                refined_text=refined_content,
+                owner=student,
+                icon="dumpling",
+                duplicate_of=match,
+                similarity=score if match else None,
+                job=job.id,
+            )
+            course.save()
+        # Only original, successful refinements are indexed (failures return the raw text)
+        if not match and refined_content != text_content:
+            similarity.index_course(course, signature, len(text_content))
+        # The dashboard shows the latest course
+        dashboard_cache.invalidate(student.username)
+
+    return {
+        'course_id': str(course.id),
+        'duplicate_of': str(match.id) if match else None,
+        'similarity': round(score, 3),
+        'extraction': payload.get('extraction'),
+        'cleaning': cleaning_report,
+    }
+
+
+@register('generate_tasks')
+def run_generate_tasks(job, ctx):
+    # A student explicitly asking to regenerate skips the LLM response cache.
+    # Nodes are streamed to key_info.html while extraction is still running.
+    writer = JobStreamWriter(job.id)
+    try:
+        with llm_cache.bypass(job.payload.get('no_cache')), sink_scope(writer):
+            return _generate_tasks(job, ctx)
+    finally:
+        writer.flush()
+
+
+def _reusable_base_graph(course, thinking_type, no_cache):
+    """
+    The structure extraction of the course this one duplicates, if its
+    refined text (the extraction input) is unchanged.
+    """
+    if no_cache or not course.duplicate_of:
+        return None
+    try:
+        source = course.duplicate_of
+        if source.refined_text != course.refined_text:
+            return None
+        base = source.base_graphs.get(thinking_type or 'divergent')
+    except Exception as e:
+        # Source course was deleted
+        print(f"DEBUG: Duplicate source unavailable: {e}")
+        return None
+    return copy.deepcopy(base) if base else None
+
+
+def _generate_tasks(job, ctx):
+    student = job.owner # read from Mongo with the claimed job, never from the request's cached profile
+    course = Course.objects.get(id=job.payload['course_id'])
+    count = int(job.payload.get('count', 3))
+
+    print(f"DEBUG: Starting task generation for: {course.name}")
+    print(f"DEBUG: Thinking Type: {student.thinking_type}")
+
+    # The student's concept index is read up front so the cross-link stage does no Mongo work
+    index = load_index(student)
+
+    # 1. AI Analysis (Structure Extraction)
+    def structure_stage(inputs):
+        # A near-duplicate upload reuses the base graph its source already extracted
+        base = _reusable_base_graph(course, student.thinking_type, job.payload.get('no_cache'))
+        if base:
+            print(f"DEBUG: Reusing base graph of course {course.duplicate_of.id}")
+            return base
+        # Use refined text if available, otherwise fallback to raw text
+        analysis_source = course.refined_text if course.refined_text else course.outline_text
+        print(f"DEBUG: Using {'REFINED' if course.refined_text else 'RAW'} text for analysis")
+        ai_data = extract_course_structure(analysis_source, student.thinking_type)
+        print(f"DEBUG: AI Data Received: {bool(ai_data)}")
+        return ai_data
+
+    # 2. Cross-Course Connections (needs only the extracted concepts)
+    def cross_links_stage(inputs):
+        ai_data = inputs['structure']
+        if not ai_data:
+            return []
+        # Identical concepts link directly; only the top related courses go to the LLM
+        direct_links, others_data = related_courses(index, course.id, ai_data.get('concepts', []))
+        print(f"DEBUG: {len(direct_links)} direct cross links, checking {len(others_data)} related courses")
+        cross_links = list(direct_links)
+        if others_data:
+            seen = {(l['from_concept'], l['to_course'], l['to_concept']) for l in direct_links}
+            for link in find_cross_connections(course.name, ai_data.get('concepts', []), others_data):
+                if (link.get('from_concept'), link.get('to_course'), link.get('to_concept')) not in seen:
+                    cross_links.append(link)
+        print(f"DEBUG: Found {len(cross_links)} cross links")
+        return cross_links
+
+    # 3. AI Task Generation (needs only the course's own nodes, runs alongside cross-links)
+    def tasks_stage(inputs):
+        ai_data = inputs['structure']
+        if not ai_data:
+            return []
+        print("DEBUG: Generating smart tasks...")
+        ai_tasks = generate_smart_tasks(course.name, ai_data.get('nodes', []), count)
+        if ai_tasks and 'tasks' in ai_tasks:
+            print(f"DEBUG: Generated {len(ai_tasks['tasks'])} tasks")
+            return ai_tasks['tasks']
+        return []
+
+    graph = StageGraph(
+        [
+            Stage('structure', structure_stage),
+            Stage('cross_links', cross_links_stage, deps=['structure'], fallback=[]),
+            Stage('tasks', tasks_stage, deps=['structure'], fallback=[]),
+        ],
+        on_start=ctx.start_stage,
+        on_finish=ctx.finish_stage,
+    )
+    results, timings = graph.run()
+    print(f"DEBUG: Stage timings: {timings}")
+
+    ai_data = results['structure']
+    cross_links = results['cross_links']
+    tasks_content = results['tasks']
+
+    nodes = []
+    edges = []
+
+    if ai_data:
+        # Use AI Data
+        print("DEBUG: Processing AI Data...")
+        raw_nodes = ai_data.get('nodes', [])
+        raw_edges = ai_data.get('edges', [])
+        concepts = ai_data.get('concepts', [])
+
+        print(f"DEBUG: Found {len(raw_nodes)} nodes and {len(raw_edges)} edges")
+
+        base_graph = copy.deepcopy({'nodes': raw_nodes, 'edges': raw_edges, 'concepts': concepts})
+
+        # Ensure all IDs are strings to prevent Vis.js mismatch
+        for n in raw_nodes:
+            n['id'] = str(n.get('id', ''))
+            nodes.append(n)
+
+        for e in raw_edges:
+            e['from'] = str(e.get('from', ''))
+            e['to'] = str(e.get('to', ''))
+            edges.append(e)
+
+        # Update Course with concepts and keep the structure for near-duplicate uploads
+        course.extracted_concepts = concepts
+        course.base_graphs[student.thinking_type or 'divergent'] = base_graph
+        course.save()
+        try:
+            index_course(course)
+        except Exception as e:
+            print(f"DEBUG: Concept index update failed: {e}")
+
+        # Add cross-links to graph, attached to the best matching local node
+        matcher = ConceptMatcher((n['id'], n.get('label', '')) for n in nodes)
+        for link in cross_links:
+            # Create a special node for the external concept
+            ext_node_id = f"ext_{link['to_course']}_{link['to_concept']}"
+            nodes.append({
+                'id': ext_node_id,
+                'label': f"{link['to_concept']} ({link['to_course']})",
+                'shape': 'diamond', # Different shape for external
+                'color': '#81D4FA', # Blue for external
+                'level': 2, # Default level for hierarchical layout
+                'title': f"From course: {link['to_course']}\nReason: {link.get('reason', '')}"
+            })
+
+            local_node_id = matcher.best(link.get('from_concept', ''))
+
+            if local_node_id:
+                edges.append({
+                    'from': local_node_id,
+                    'to': ext_node_id,
+                    'dashes': True, # Dashed line for cross-link
+                    'label': 'Related',
+                    'title': link.get('reason', 'Cross-course connection')
+                })
+    else:
+        print("DEBUG: AI Data was None, falling back to mock data.")
+
+    # Fallback if AI fails or returns empty
+    if not tasks_content:
+        print("DEBUG: Falling back to mock tasks.")
+        tasks_content = [f"Cook {course.name} - Step {i+1}" for i in range(count)]
+
+    if not nodes:
+        print("DEBUG: Falling back to mock nodes/edges.")
+        nodes = [
+            {'id': '1', 'label': course.name, 'shape': 'box', 'color': '#FFD54F', 'level': 0},
+            {'id': '2', 'label': 'Preparation', 'shape': 'dot', 'color': '#FFAB91', 'level': 1},
+            {'id': '3', 'label': 'Core Ingredients', 'shape': 'dot', 'color': '#FFAB91', 'level': 1},
+        ]
+        edges = [{'from': '1', 'to': '2'}, {'from': '1', 'to': '3'}]
+
+    save_started = time.perf_counter()
+    with ctx.stage('save'):
+        # Save Tasks (one insert_many for the whole generation); keyed on the
+        # job, so a retry after a later failure does not add a second batch
+        batch, tasks_data = task_store.create_tasks(course, student, tasks_content, job_id=job.id)
+
+        # Save Graph as the course's next version (only the delta is recorded), once per job
+        def save_graph():
+            graph = graph_store.save_graph(course, student, nodes, edges, student.thinking_type)
+            return {'id': str(graph.id), 'version': graph.version}
+        graph = ctx.checkpoint('graph', save_graph)
+        dashboard_cache.invalidate(student.username)
+    timings['save'] = {'status': 'done', 'ms': round((time.perf_counter() - save_started) * 1000)}
+
+    return {
+        'graph_id': graph['id'],
+        'graph_version': graph['version'],
+        'batch_id': str(batch.id),
+        'task_ids': tasks_data,
+        'timings': timings,
+    }
@@ -0,0 +1,50 @@
+"""
+Batch resolution of ReferenceFields.
+
+Following `task.course` or `task.owner` on a loaded document costs one
+Mongo query per document and loads the whole referenced document (a
+Course carries its full syllabus text). prefetch() resolves one reference
+field for a list of documents with a single `$in` query, projected to the
+fields the caller needs, much like Django's select_related.
+
+Documents should be loaded with `.no_dereference()`, so reading the
+reference does not already trigger the per-document query.
+"""
+from bson import DBRef, ObjectId
+from mongoengine import Document
+
+
+def _ref_id(value):
+    if isinstance(value, Document):
+        return value.pk
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, ObjectId):
+        return value
+    return None
+
+
+def prefetch(documents, field, only=None):
+    """
+    Resolves `field` on every document in one query and sets the resolved
+    (projected) documents in place. Returns {id: referenced document};
+    references to deleted documents resolve to None.
+    """
+    documents = [doc for doc in documents if doc is not None]
+    if not documents:
+        return {}
+    target = type(documents[0])._fields[field].document_type
+    # _data holds the raw reference; attribute access would dereference it one by one
+    ids = {_ref_id(doc._data.get(field)) for doc in documents}
+    ids.discard(None)
+    if not ids:
+        return {}
+    query = target.objects(id__in=list(ids))
+    if only:
+        query = query.only(*only)
+    resolved = {obj.pk: obj for obj in query}
+    for doc in documents:
+        ref_id = _ref_id(doc._data.get(field))
+        if ref_id is not None:
+            doc._data[field] = resolved.get(ref_id) # set without marking the field changed
+    return resolved
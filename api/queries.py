@@ -0,0 +1,132 @@
+"""
+Hot-path queries, with the projections they need.
+
+Each function returns an unevaluated QuerySet so callers can add
+`.first()`/slices/updates and the query-plan tests in api/tests.py can
+explain exactly the query the endpoint runs. Functions are registered in
+HOT_QUERIES with @hot; every filter + sort here is backed by an index
+declared in the model's meta.
+"""
+from .models import (
+    ConceptIndex, Course, CourseSignature, Graph, GraphDelta, Job, LLMCacheEntry, LLMLease, Student, StudyStats, Task,
+    TaskBatch,
+)
+
+HOT_QUERIES = []
+
+
+def hot(func):
+    HOT_QUERIES.append(func)
+    return func
+
+
+# Course documents carry up to SYLLABUS_MAX_CHARS of outline and refined text;
+# lookups that only need the reference or the label never load them
+COURSE_REF_FIELDS = ('id', 'name', 'icon')
+TASK_LIST_FIELDS = ('id', 'content', 'status', 'is_completed')
+
+
+@hot
+def latest_course(student):
+    return Course.objects(owner=student).order_by('-created_at').only(*COURSE_REF_FIELDS)
+
+
+@hot
+def owned_course(student, course_id):
+    return Course.objects(id=course_id, owner=student).only(*COURSE_REF_FIELDS)
+
+
+@hot
+def current_graph(course):
+    return Graph.objects(course=course).order_by('-created_at')
+
+
+@hot
+def latest_batch(course):
+    return TaskBatch.objects(course=course).order_by('-created_at')
+
+
+@hot
+def batch_tasks(batch, fields=TASK_LIST_FIELDS):
+    return Task.objects(batch=batch).only(*fields)
+
+
+@hot
+def recent_tasks(course, fields=TASK_LIST_FIELDS):
+    return Task.objects(course=course).order_by('-date').only(*fields)
+
+
+@hot
+def job_course(job_id):
+    return Course.objects(job=job_id).only(*COURSE_REF_FIELDS)
+
+
+@hot
+def job_batch(job_id):
+    return TaskBatch.objects(job=job_id)
+
+
+@hot
+def tasks_by_ids(task_ids, fields, owner=None):
+    query = Task.objects(id__in=list(task_ids)).only(*fields).no_dereference()
+    return query.filter(owner=owner) if owner is not None else query
+
+
+@hot
+def student_by_username(username, fields):
+    return Student.objects(username=username).only(*fields)
+
+
+@hot
+def study_day(student, day):
+    return StudyStats.objects(owner=student, date=day).only('completed_count', 'skipped_count')
+
+
+@hot
+def active_study_days(student, since):
+    return StudyStats.objects(owner=student, completed_count__gt=0, date__gte=since).order_by('-date').only('date')
+
+
+@hot
+def graph_deltas(course, since_version, until_version):
+    return GraphDelta.objects(course=course, version__gt=since_version, version__lte=until_version).order_by('version')
+
+
+@hot
+def owned_job(job_id, student):
+    return Job.objects(id=job_id, owner=student)
+
+
+@hot
+def job_by_key(idempotency_key):
+    return Job.objects(idempotency_key=idempotency_key)
+
+
+@hot
+def stale_running_jobs(stale):
+    return Job.objects(status='running', updated_at__lt=stale)
+
+
+@hot
+def concept_index(student):
+    return ConceptIndex.objects(owner=student)
+
+
+@hot
+def signature_candidates(keys, limit):
+    return CourseSignature.objects(bands__in=keys).only('course', 'minhash').limit(limit).no_dereference()
+
+
+@hot
+def llm_cache_entry(key):
+    return LLMCacheEntry.objects(key=key)
+
+
+@hot
+def least_recent_llm_cache_entries(limit):
+    return LLMCacheEntry.objects.order_by('last_hit_at').only('id').limit(limit)
+
+
+@hot
+def live_lease(key, now):
+    return LLMLease.objects(key=key, expires_at__gte=now).only('id')
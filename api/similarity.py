@@ -0,0 +1,107 @@
+"""
+Near-duplicate syllabus detection with MinHash + LSH.
+
+Students in the same class upload nearly identical syllabi (another
+export, another filename, one changed date). Each cleaned upload gets a
+MinHash signature over character shingles; the signature is split into
+bands stored in CourseSignature with a multikey index, so candidates are
+found with one indexed `$in` query and verified by estimated Jaccard
+similarity. A match above SIMILARITY_THRESHOLD lets the upload reuse the
+earlier course's refined Markdown and base graph.
+"""
+import hashlib
+import random
+import re
+import zlib
+
+from django.conf import settings
+
+from . import queries
+from .models import Course, CourseSignature
+
+SIMILARITY_THRESHOLD = getattr(settings, 'SIMILARITY_THRESHOLD', 0.9)
+MINHASH_PERMUTATIONS = getattr(settings, 'MINHASH_PERMUTATIONS', 128)
+LSH_BANDS = getattr(settings, 'LSH_BANDS', 16) # 16 bands x 8 rows: candidates from ~0.7 similarity
+SHINGLE_SIZE = 5 # characters; works for CJK as well as English
+MAX_CANDIDATES = 50
+
+# Fixed seed: signatures are stored, so the permutations must never change.
+# Each permutation XORs the 64-bit shingle hash with a random mask, which
+# lets min() run over map() in C instead of a Python loop per shingle.
+_rng = random.Random(20240601)
+_MASKS = [_rng.getrandbits(64) for _ in range(MINHASH_PERMUTATIONS)]
+_SPACES_RE = re.compile(r'\s+')
+
+
+def _shingles(text):
+    text = _SPACES_RE.sub(' ', text.lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    # Every shingle counts: a cap would ignore the tail, so two long syllabi
+    # differing only after it would look identical. Extraction already caps
+    # the text length, which bounds this.
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def signature(text):
+    hashes = [_hash64(s) for s in _shingles(text)]
+    if not hashes:
+        return []
+    # Shifted to 63 bits so values fit Mongo's signed int64
+    return [(min(map(mask.__xor__, hashes)) >> 1) for mask in _MASKS]
+
+
+def band_keys(sig):
+    if not sig:
+        return []
+    rows = len(sig) // LSH_BANDS
+    return [
+        f"{band}:{zlib.crc32(repr(sig[band * rows:(band + 1) * rows]).encode('ascii')):08x}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate(sig_a, sig_b):
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def find_similar(sig, threshold=None, exclude_course_id=None):
+    """
+    Returns (course, similarity) for the most similar indexed course with
+    refined text at or above the threshold, or (None, best_similarity).
+    """
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    keys = band_keys(sig)
+    if not keys:
+        return None, 0.0
+
+    candidates = queries.signature_candidates(keys, MAX_CANDIDATES)
+    scored = []
+    for candidate in candidates:
+        course_id = candidate.course.id
+        if exclude_course_id and str(course_id) == str(exclude_course_id):
+            continue
+        scored.append((estimate(sig, candidate.minhash), course_id))
+    scored.sort(key=lambda s: s[0], reverse=True)
+
+    best = scored[0][0] if scored else 0.0
+    for similarity, course_id in scored:
+        if similarity < threshold:
+            break
+        course = Course.objects(id=course_id, refined_text__ne=None).first()
+        if course:
+            return course, similarity
+    return None, best
+
+
+def index_course(course, sig, chars=None):
+    if not sig:
+        return
+    CourseSignature.objects(course=course).delete()
+    CourseSignature(course=course, minhash=sig, bands=band_keys(sig), chars=chars).save()
@@ -0,0 +1,125 @@
+"""
+Single-flight coalescing of identical in-flight LLM calls.
+
+Within a process, concurrent callers with the same key share one call.
+Across processes, the leader holds a lease document in Mongo; other
+processes wait for the result to show up in the shared LLM cache instead
+of calling upstream themselves.
+"""
+import copy
+import datetime
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from . import queries
+from .models import LLMLease
+
+LLM_LEASE_SECONDS = getattr(settings, 'LLM_LEASE_SECONDS', 180)
+LLM_LEASE_POLL = getattr(settings, 'LLM_LEASE_POLL', 0.5) # seconds between shared-cache checks
+
+_flights = {}
+_lock = threading.Lock()
+_stats = {'leaders': 0, 'local_waiters': 0, 'remote_waiters': 0}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+def _holder():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _acquire_lease(key):
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=LLM_LEASE_SECONDS)
+    # Take over a lease whose holder died before the TTL monitor removed it
+    LLMLease.objects(key=key, expires_at__lt=now).delete()
+    try:
+        LLMLease(key=key, holder=_holder(), expires_at=expires_at).save()
+        return True
+    except NotUniqueError:
+        return False
+
+
+def _release_lease(key):
+    try:
+        LLMLease.objects(key=key, holder=_holder()).delete()
+    except Exception as e:
+        print(f"Lease release failed: {e}")
+
+
+def _lease_alive(key):
+    return queries.live_lease(key, datetime.datetime.utcnow()).first() is not None
+
+
+def do(key, producer, lookup):
+    """
+    Returns producer() for the key, running it at most once across all
+    concurrent callers. lookup() reads the shared cache and returns
+    (hit, value); it is how waiters in other processes receive the result.
+    """
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+            _stats['leaders'] += 1
+        else:
+            _stats['local_waiters'] += 1
+
+    if not leader:
+        flight.done.wait()
+        return copy.deepcopy(flight.value)
+
+    try:
+        flight.value = _lead(key, producer, lookup)
+        # Waiters copy flight.value after we return, so the caller gets its own copy
+        return copy.deepcopy(flight.value)
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _lead(key, producer, lookup):
+    try:
+        acquired = _acquire_lease(key)
+    except Exception as e:
+        print(f"Lease unavailable, calling upstream directly: {e}")
+        return producer()
+
+    while not acquired:
+        # Another process is calling upstream; wait for its result in the shared cache
+        with _lock:
+            _stats['remote_waiters'] += 1
+        while _lease_alive(key):
+            time.sleep(LLM_LEASE_POLL)
+            hit, value = lookup()
+            if hit:
+                return value
+        hit, value = lookup()
+        if hit:
+            return value
+        # Leader failed (failures are never cached) or died: try to lead ourselves
+        acquired = _acquire_lease(key)
+
+    try:
+        return producer()
+    finally:
+        _release_lease(key)
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result['in_flight'] = len(_flights)
+    return result
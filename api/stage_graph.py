@@ -0,0 +1,120 @@
+"""
+Runs pipeline stages as a dependency graph.
+
+Each stage declares the stages it depends on; stages whose dependencies are
+satisfied run concurrently on a shared thread pool, each bounded by its own
+deadline. A stage that fails or misses its deadline yields its fallback
+value so downstream stages (and the existing mock fallbacks) still run.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+STAGE_WORKERS = getattr(settings, 'STAGE_WORKERS', 8)
+STAGE_DEADLINES = getattr(settings, 'STAGE_DEADLINES', {}) # name -> seconds
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix='piggy-stage')
+        return _executor
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), deadline=None, fallback=None):
+        """
+        func receives a dict {dep_name: dep_result} and returns the stage result.
+        """
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.deadline = deadline if deadline is not None else STAGE_DEADLINES.get(name)
+        self.fallback = fallback
+
+
+class StageGraph:
+    def __init__(self, stages, on_start=None, on_finish=None):
+        """
+        on_start(name) / on_finish(name, status) are progress hooks,
+        e.g. JobContext.start_stage / JobContext.finish_stage.
+        """
+        self.stages = {s.name: s for s in stages}
+        self.on_start = on_start
+        self.on_finish = on_finish
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    def run(self):
+        """
+        Returns (results, timings). timings maps stage name to
+        {'status', 'ms'} where status is done, failed, timeout or skipped.
+        """
+        results = {}
+        timings = {}
+        pending = dict(self.stages)
+        running = {} # future -> (stage, started_at)
+        executor = _get_executor()
+        t0 = time.perf_counter()
+
+        while pending or running:
+            for name in [n for n, s in pending.items() if all(d in results for d in s.deps)]:
+                stage = pending.pop(name)
+                if self.on_start:
+                    self.on_start(name)
+                inputs = {d: results[d] for d in stage.deps}
+                # Carry context vars (e.g. the LLM cache bypass flag) into the worker thread
+                ctx = contextvars.copy_context()
+                future = executor.submit(ctx.run, stage.func, inputs)
+                running[future] = (stage, time.perf_counter())
+
+            if not running:
+                # Remaining stages have deps that can never be satisfied
+                for name in list(pending):
+                    results[name] = pending.pop(name).fallback
+                    timings[name] = {'status': 'skipped', 'ms': 0}
+                break
+
+            now = time.perf_counter()
+            wait_for = [
+                started + stage.deadline - now
+                for stage, started in running.values() if stage.deadline
+            ]
+            done, _ = wait(list(running), timeout=max(0.0, min(wait_for)) if wait_for else None, return_when=FIRST_COMPLETED)
+
+            now = time.perf_counter()
+            for future in list(running):
+                stage, started = running[future]
+                elapsed_ms = round((now - started) * 1000)
+                if future in done:
+                    del running[future]
+                    try:
+                        results[stage.name] = future.result()
+                        status = 'done'
+                    except Exception as e:
+                        print(f"Stage '{stage.name}' failed: {e}")
+                        results[stage.name] = stage.fallback
+                        status = 'failed'
+                elif stage.deadline and now - started >= stage.deadline:
+                    # Abandon the call; its thread finishes in the background
+                    del running[future]
+                    print(f"Stage '{stage.name}' missed its {stage.deadline}s deadline")
+                    results[stage.name] = stage.fallback
+                    status = 'timeout'
+                else:
+                    continue
+                timings[stage.name] = {'status': status, 'ms': elapsed_ms}
+                if self.on_finish:
+                    self.on_finish(stage.name, status)
+
+        timings['total'] = {'status': 'done', 'ms': round((time.perf_counter() - t0) * 1000)}
+        return results, timings
@@ -0,0 +1,153 @@
+"""
+Streaming progress for LLM calls.
+
+Job handlers install a sink with `sink_scope(...)`; ai_service forwards
+streamed partial output to the current sink. JobStreamWriter persists the
+partial output on the Job document (throttled) so the SSE endpoint can relay
+it to the browser from any process.
+"""
+import contextvars
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from .models import Job
+
+_sink = contextvars.ContextVar('llm_stream_sink', default=None)
+
+
+@contextmanager
+def sink_scope(sink):
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def current_sink():
+    return _sink.get()
+
+
+class IncrementalNodeParser:
+    """
+    Pulls complete node objects out of a partially received
+    `{"nodes": [{...}, {...}, ...` JSON document as it streams in.
+    """
+
+    def __init__(self):
+        self.pos = 0 # next unread index in the text
+        self.in_nodes = False
+        self.done = False
+
+    def feed(self, text):
+        """
+        Called with the full text received so far; returns newly completed nodes.
+        """
+        nodes = []
+        if self.done:
+            return nodes
+        if not self.in_nodes:
+            key = text.find('"nodes"', self.pos)
+            if key == -1:
+                return nodes
+            bracket = text.find('[', key)
+            if bracket == -1:
+                return nodes
+            self.in_nodes = True
+            self.pos = bracket + 1
+
+        while True:
+            start = self.pos
+            while start < len(text) and text[start] in ' \t\r\n,':
+                start += 1
+            if start >= len(text):
+                return nodes
+            if text[start] == ']':
+                self.done = True
+                return nodes
+            if text[start] != '{':
+                # Not a node object; give up on incremental parsing
+                self.done = True
+                return nodes
+            end = self._object_end(text, start)
+            if end == -1:
+                return nodes
+            try:
+                nodes.append(json.loads(text[start:end]))
+            except ValueError:
+                pass
+            self.pos = end
+
+    @staticmethod
+    def _object_end(text, start):
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        return -1
+
+
+class JobStreamWriter:
+    """
+    Sink that writes partial refined Markdown and streamed nodes onto the
+    Job document at most every `interval` seconds.
+    """
+
+    def __init__(self, job_id, interval=0.5):
+        self.job_id = job_id
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.refined = {} # part index -> text so far
+        self.nodes = []
+        self.dirty = False
+        self.last_flush = 0.0
+
+    def refined_delta(self, part, text):
+        with self.lock:
+            self.refined[part] = text
+            self.dirty = True
+        self._maybe_flush()
+
+    def add_nodes(self, nodes):
+        if not nodes:
+            return
+        with self.lock:
+            self.nodes.extend(nodes)
+            self.dirty = True
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            partial = {
+                # Keyed by the real part number: parallel parts finish out of order
+                'refined': {str(part): text for part, text in self.refined.items()},
+                'nodes': list(self.nodes),
+            }
+            self.dirty = False
+            self.last_flush = time.monotonic()
+        Job.objects(id=self.job_id).update(set__partial=partial, set__updated_at=datetime.datetime.utcnow())
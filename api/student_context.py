@@ -0,0 +1,87 @@
+"""
+Per-request student resolution.
+
+Views identify the student by the Django user's username, and most pages
+call check_auth on load. StudentMiddleware resolves the small student
+profile ({'id', 'thinking_type'}) at most once per request, and only when
+a view asks for it. The profile comes from the `students` cache, and
+Mongo is read only on a miss. Writers call invalidate() after saving, so
+the next request in any process reloads it. The default backend is a
+file cache shared by every process on the host. Job workers never use the
+profile: they load the student from Mongo with the job.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+from . import queries
+from .models import Student
+
+STUDENT_CACHE_TTL = getattr(settings, 'STUDENT_CACHE_TTL', 600) # seconds
+
+
+def _cache():
+    return caches['students'] if 'students' in settings.CACHES else caches['default']
+
+
+def _key(username):
+    return f"student:{username}"
+
+
+def remember(student):
+    profile = {'id': str(student.id), 'thinking_type': student.thinking_type}
+    _cache().set(_key(student.username), profile, STUDENT_CACHE_TTL)
+    return profile
+
+
+def load_profile(username):
+    """
+    Returns {'id', 'thinking_type'} for the student, or {} if there is none.
+    """
+    profile = _cache().get(_key(username))
+    if profile is None:
+        student = queries.student_by_username(username, ('id', 'username', 'thinking_type')).first()
+        if student is None:
+            return {} # not cached, so a student created later is picked up
+        profile = remember(student)
+    return profile
+
+
+def invalidate(username):
+    """Call after saving a profile field to Mongo; the next request reloads it."""
+    _cache().delete(_key(username))
+
+
+def current_student(request):
+    """
+    A Student built from the request's cached profile, for filters and
+    references; only id, username and thinking_type are real (other fields
+    hold their defaults, so read e.g. carrots from Mongo). Raises
+    Student.DoesNotExist like Student.objects.get() would.
+    """
+    profile = request.student_profile
+    if not profile:
+        raise Student.DoesNotExist(f"No student for {request.user.username}")
+    return Student._from_son(
+        {'_id': ObjectId(profile['id']), 'username': request.user.username, 'thinking_type': profile['thinking_type']}
+    )
+
+
+class StudentMiddleware:
+    """Sets request.student_profile, resolved lazily on first use."""
+    sync_capable = True
+    async_capable = True # keeps async views (job_stream) off a worker thread under ASGI
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.student_profile = SimpleLazyObject(
+            lambda: load_profile(request.user.username) if request.user.is_authenticated else {}
+        )
+        # In async mode get_response returns a coroutine, which the handler awaits
+        return self.get_response(request)
@@ -0,0 +1,126 @@
+"""
+Incrementally maintained study statistics.
+
+Every task status transition updates, in the same request and with one
+bulk write per collection:
+  - Student.carrots: +1 when a task is completed, -1 when that is undone
+  - StudyStats: an upserted row per student per UTC day with $inc'd
+    completed/skipped counts and per-course completions
+
+Results and profile pages read these pre-aggregated rows (today's row,
+a bounded streak walk, an aggregation over the rows for weekly and
+per-course totals), never the Task collection, so they cost the same for
+a student with ten tasks or ten thousand.
+"""
+import datetime
+
+from pymongo import UpdateOne
+
+from . import queries
+from .models import Course, Student, StudyStats
+
+CARROTS_PER_TASK = 1
+STREAK_MAX_DAYS = 366
+
+
+def day_of(moment):
+    return datetime.datetime(moment.year, moment.month, moment.day)
+
+
+def record(transitions, now=None):
+    """
+    transitions: [(owner_id, course_id, old_status, new_status, completed_at)]
+    where completed_at is when the task was completed before this change
+    (so undoing decrements the day the completion was counted on).
+    """
+    now = now or datetime.datetime.utcnow()
+    today = day_of(now)
+    carrots = {}
+    rows = {}
+    for owner_id, course_id, old_status, new_status, completed_at in transitions:
+        if owner_id is None:
+            continue
+        if old_status == 'completed':
+            day = day_of(completed_at) if completed_at else today
+            inc = rows.setdefault((owner_id, day), {})
+            inc['completed_count'] = inc.get('completed_count', 0) - 1
+            if course_id:
+                inc[f"courses.{course_id}"] = inc.get(f"courses.{course_id}", 0) - 1
+            carrots[owner_id] = carrots.get(owner_id, 0) - CARROTS_PER_TASK
+        if new_status == 'completed':
+            inc = rows.setdefault((owner_id, today), {})
+            inc['completed_count'] = inc.get('completed_count', 0) + 1
+            if course_id:
+                inc[f"courses.{course_id}"] = inc.get(f"courses.{course_id}", 0) + 1
+            carrots[owner_id] = carrots.get(owner_id, 0) + CARROTS_PER_TASK
+        # Skips are counted on the day they happen
+        if old_status == 'skipped' or new_status == 'skipped':
+            inc = rows.setdefault((owner_id, today), {})
+            inc['skipped_count'] = inc.get('skipped_count', 0) + (new_status == 'skipped') - (old_status == 'skipped')
+
+    carrot_updates = [UpdateOne({'_id': owner_id}, {'$inc': {'carrots': n}}) for owner_id, n in carrots.items() if n]
+    if carrot_updates:
+        Student._get_collection().bulk_write(carrot_updates, ordered=False)
+    row_updates = [
+        UpdateOne({'owner': owner_id, 'date': day}, {'$inc': inc}, upsert=True)
+        for (owner_id, day), inc in rows.items() if any(inc.values())
+    ]
+    if row_updates:
+        StudyStats._get_collection().bulk_write(row_updates, ordered=False)
+
+
+def today(student, now=None):
+    row = queries.study_day(student, day_of(now or datetime.datetime.utcnow())).first()
+    return {'completed': row.completed_count if row else 0, 'skipped': row.skipped_count if row else 0}
+
+
+def streak(student, now=None):
+    """
+    Consecutive days with a completed task, ending today (or yesterday,
+    so the streak is not lost before today's first task).
+    """
+    day = day_of(now or datetime.datetime.utcnow())
+    dates = [row.date for row in queries.active_study_days(student, day - datetime.timedelta(days=STREAK_MAX_DAYS))]
+    expected = day
+    if dates and dates[0] == day - datetime.timedelta(days=1):
+        expected = dates[0]
+    count = 0
+    for date in dates:
+        if date != expected:
+            break
+        count += 1
+        expected -= datetime.timedelta(days=1)
+    return count
+
+
+def totals(student, days=7, now=None):
+    """
+    Completed/skipped totals over the last `days` days and per-course
+    completions over all time, aggregated from the daily rows.
+    """
+    since = day_of(now or datetime.datetime.utcnow()) - datetime.timedelta(days=days - 1)
+    collection = StudyStats._get_collection()
+    window = list(collection.aggregate([
+        {'$match': {'owner': student.id, 'date': {'$gte': since}}},
+        {'$group': {'_id': None, 'completed': {'$sum': '$completed_count'}, 'skipped': {'$sum': '$skipped_count'}}},
+    ]))
+    per_course = list(collection.aggregate([
+        {'$match': {'owner': student.id}},
+        {'$project': {'courses': {'$objectToArray': {'$ifNull': ['$courses', {}]}}}},
+        {'$unwind': '$courses'},
+        {'$group': {'_id': '$courses.k', 'completed': {'$sum': '$courses.v'}}},
+        {'$sort': {'completed': -1}},
+    ]))
+    names = {
+        str(c.id): c.name
+        for c in Course.objects(id__in=[row['_id'] for row in per_course]).only('name')
+    } if per_course else {}
+    return {
+        'days': days,
+        'completed': window[0]['completed'] if window else 0,
+        'skipped': window[0]['skipped'] if window else 0,
+        'courses': [
+            {'course_id': row['_id'], 'name': names.get(row['_id']), 'completed': row['completed']}
+            for row in per_course if row['completed'] > 0
+        ],
+    }
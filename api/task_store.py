@@ -0,0 +1,171 @@
+"""
+Task persistence in bulk, grouped into batches.
+
+A generation creates one TaskBatch and inserts all of its tasks with one
+insert_many. A study session can report many status changes at once: the
+tasks are read with one `$in` query and written with one bulk_write. Each
+batch keeps `total`/`completed`/`skipped` counters that are updated with
+`$inc` in the same pass (only for writes that won any race with a
+concurrent request), so "is this batch done?" is one indexed read, and
+the number of Mongo round trips does not grow with the number of tasks or
+the task history. Carrots and daily StudyStats rows are updated from the
+same transitions (api/study_stats.py).
+"""
+import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from . import dashboard_cache, prefetch, queries, study_stats
+from .models import Task, TaskBatch
+
+STATUSES = ('pending', 'completed', 'skipped')
+MAX_BATCH_UPDATES = 200
+
+
+def create_tasks(course, owner, contents, job_id=None):
+    """
+    Creates a batch with one pending task per content string.
+    Returns (batch, task ids). With job_id, a retried job gets back the
+    batch an earlier attempt created instead of a second one.
+    """
+    batch = queries.job_batch(job_id).first() if job_id else None
+    if batch is not None:
+        task_ids = [str(task.id) for task in queries.batch_tasks(batch, ('id',))]
+        if len(task_ids) == batch.total:
+            return batch, task_ids
+        # The earlier attempt stopped between saving the batch and inserting its tasks
+        Task.objects(batch=batch).delete()
+        batch.total = len(contents)
+        TaskBatch.objects(id=batch.id).update_one(set__total=batch.total)
+    else:
+        batch = TaskBatch(course=course, owner=owner, total=len(contents), job=job_id)
+        batch.save()
+    tasks = [
+        Task(content=content, course=course, course_name=course.name, course_icon=course.icon,
+             owner=owner, batch=batch, status="pending")
+        for content in contents
+    ]
+    if not tasks:
+        return batch, []
+    return batch, [str(task_id) for task_id in Task.objects.insert(tasks, load_bulk=False)]
+
+
+def batch_state(batch):
+    return {
+        'id': str(batch.id),
+        'total': batch.total,
+        'completed': batch.completed,
+        'skipped': batch.skipped,
+        'done': batch.completed + batch.skipped >= batch.total,
+    }
+
+
+def _legacy_done(course_id):
+    # Tasks generated before batches: the latest five of the course, as the dashboard used to show
+    tasks = queries.recent_tasks(course_id, ('status', 'is_completed'))[:5]
+    return all(t.is_completed or t.status == 'skipped' for t in tasks)
+
+
+def _counter_delta(old_status, new_status):
+    delta = {}
+    for field in ('completed', 'skipped'):
+        change = (new_status == field) - (old_status == field)
+        if change:
+            delta[field] = change
+    return delta
+
+
+def apply_statuses(updates, owner=None):
+    """
+    Applies [{'task_id', 'status'}] in one bulk write. With `owner`, only
+    that student's tasks are touched. Returns (results, batches,
+    legacy_courses): results is [{'task_id', 'outcome'}] with outcome
+    updated, unchanged, not_found or invalid; batches maps each affected
+    batch id to batch_state(); legacy_courses maps the course of any
+    pre-batch task to whether its latest tasks are all done.
+    """
+    results = {}
+    wanted = {}
+    for update in updates[:MAX_BATCH_UPDATES]:
+        task_id = str(update.get('task_id', ''))
+        status = update.get('status', 'completed')
+        if status not in STATUSES or not ObjectId.is_valid(task_id):
+            results[task_id] = 'invalid'
+            continue
+        results.setdefault(task_id, None) # keeps results in request order
+        wanted[task_id] = status # the last change for a task wins
+
+    query = queries.tasks_by_ids(wanted, ('id', 'status', 'course', 'owner', 'batch', 'completed_at'), owner)
+    found = {str(task.id): task for task in query} if wanted else {}
+
+    now = datetime.datetime.utcnow()
+    token = ObjectId() # marks this call's writes, to tell which of them won a race
+    planned = {}
+    operations = []
+    for task_id, status in wanted.items():
+        task = found.get(task_id)
+        if task is None:
+            results[task_id] = 'not_found'
+        elif task.status == status:
+            results[task_id] = 'unchanged'
+        else:
+            # Conditional on the status we read, so a concurrent change (a double
+            # click) makes this write miss instead of applying the transition twice
+            change = {'$set': {'status': status, 'is_completed': status == 'completed', 'status_change': token}}
+            if status == 'completed':
+                change['$set']['completed_at'] = now
+            elif task.status == 'completed':
+                change['$unset'] = {'completed_at': ''}
+            operations.append(UpdateOne({'_id': task.id, 'status': task.status}, change))
+            planned[task_id] = status
+
+    if operations:
+        written = Task._get_collection().bulk_write(operations, ordered=False)
+        applied = set(planned)
+        if written.matched_count < len(operations):
+            applied = {str(row['_id']) for row in Task._get_collection().find(
+                {'_id': {'$in': [found[task_id].id for task_id in planned]}, 'status_change': token}, {'_id': 1},
+            )}
+        increments = {}
+        transitions = []
+        for task_id, status in planned.items():
+            if task_id not in applied:
+                results[task_id] = 'unchanged' # another request made this change first
+                continue
+            task = found[task_id]
+            transitions.append((
+                task.owner.id if task.owner else None,
+                str(task.course.id) if task.course else None,
+                task.status,
+                status,
+                task.completed_at,
+            ))
+            if task.batch:
+                inc = increments.setdefault(task.batch.id, {})
+                for field, n in _counter_delta(task.status, status).items():
+                    inc[field] = inc.get(field, 0) + n
+            results[task_id] = 'updated'
+        counter_updates = [
+            UpdateOne({'_id': batch_id}, {'$inc': inc}) for batch_id, inc in increments.items() if inc
+        ]
+        if counter_updates:
+            TaskBatch._get_collection().bulk_write(counter_updates, ordered=False)
+        study_stats.record(transitions, now)
+
+    changed = [found[task_id] for task_id, outcome in results.items() if outcome == 'updated']
+    for student in prefetch.prefetch(changed, 'owner', only=('username',)).values():
+        dashboard_cache.invalidate(student.username)
+
+    batch_ids = {task.batch.id for task in found.values() if task.batch}
+    batches = {str(b.id): batch_state(b) for b in TaskBatch.objects(id__in=list(batch_ids))} if batch_ids else {}
+    legacy_courses = {
+        str(course_id): _legacy_done(course_id)
+        for course_id in {task.course.id for task in found.values() if task.course and not task.batch}
+    }
+    return [{'task_id': task_id, 'outcome': outcome} for task_id, outcome in results.items()], batches, legacy_courses
+
+
+def all_done(batches, legacy_courses):
+    states = [state['done'] for state in batches.values()] + list(legacy_courses.values())
+    return bool(states) and all(states)
@@ -1,3 +1,899 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import inspect
+import io
+import threading
+from unittest import SkipTest, mock
 
-# Create your tests here.
+import httpx
+from bson import DBRef, ObjectId
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase
+from mongoengine.connection import get_connection
+from openai import RateLimitError
+from pymongo import MongoClient
+
+from . import chunking, cleaning, concepts, dashboard_cache, extraction, governor, graph_query, graph_store, jobs, json_repair, layout, llm_cache, queries, similarity, singleflight, task_store, views
+from .extraction import PAGE_BREAK, extract_text
+from .models import ConceptIndex, Course, Graph, GraphDelta, Job, LLMCacheEntry, Student, Task, TaskBatch
+from .streaming import IncrementalNodeParser
+
+
+class DehydrateTests(SimpleTestCase):
+    def clean(self, text):
+        return cleaning.dehydrate(text)[0]
+
+    def test_keeps_topic_lines_mentioning_notice_words(self):
+        text = '\n'.join([
+            "Week 1: Introduction to intellectual property",
+            "Week 2: Copyright law and fair use",
+            "Week 3: Confidential information and trade secrets",
+            "Week 4: Disclaimer clauses in licences",
+            "Week 5: Why all rights reserved is not the only option",
+        ])
+        self.assertEqual(self.clean(text), text)
+
+    def test_removes_notice_lines(self):
+        text = '\n'.join([
+            "Course outline",
+            "© 2024 University of Somewhere",
+            "Copyright © 2024 Example Press",
+            "All rights reserved.",
+            "Confidential – do not distribute",
+            "Disclaimer: details may change.",
+            "Week 1: Basics",
+        ])
+        self.assertEqual(self.clean(text), "Course outline\nWeek 1: Basics")
+
+    def test_keeps_weight_cells_on_short_pages(self):
+        pages = ["Assessment\nExam\n60", "Coursework\n20", "Participation\n20"]
+        cleaned = self.clean(PAGE_BREAK.join(pages))
+        self.assertEqual(cleaned.split(), "Assessment Exam 60 Coursework 20 Participation 20".split())
+
+    def test_removes_page_number_sequences(self):
+        pages = [f"Topic {chr(65 + n)}\nDetails of topic {n}\n{n + 1}" for n in range(4)]
+        cleaned = self.clean(PAGE_BREAK.join(pages))
+        self.assertNotIn('\n1\n', f"\n{cleaned}\n")
+        self.assertNotRegex(cleaned, r'(?m)^\d+$')
+        self.assertIn("Details of topic 3", cleaned)
+
+    def test_removes_explicit_page_markers_at_edges(self):
+        cleaned = self.clean("Intro\nWeek 1 reading\nPage 1 of 2" + PAGE_BREAK + "Week 2 reading\nPage 2 of 2")
+        self.assertEqual(cleaned, "Intro\nWeek 1 reading\nWeek 2 reading")
+
+    def test_never_grows_the_text(self):
+        text = PAGE_BREAK.join(f"Week {n}\nReading {n}" for n in range(10))
+        cleaned, report = cleaning.dehydrate(text)
+        self.assertLessEqual(report['chars_after'], report['chars_before'])
+        self.assertEqual(cleaned, text.replace(PAGE_BREAK, '\n'))
+
+    def test_repeated_pages_kept_unless_slides(self):
+        text = PAGE_BREAK.join(["Schedule\nWeek 1 lecture", "Schedule\nWeek 1 lecture\nWeek 1 lab"])
+        self.assertEqual(self.clean(text).count('Week 1 lecture'), 2)
+        self.assertEqual(cleaning.dehydrate(text, slides=True)[0], "Schedule\nWeek 1 lecture\nWeek 1 lab")
+
+
+class ExtractionBudgetTests(SimpleTestCase):
+    def pdf(self, pages):
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=200, height=200)
+        data = io.BytesIO()
+        writer.write(data)
+        return SimpleUploadedFile('outline.pdf', data.getvalue())
+
+    def pptx(self, slides):
+        from pptx import Presentation
+        prs = Presentation()
+        for n in range(slides):
+            prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = f"Week {n + 1}"
+        data = io.BytesIO()
+        prs.save(data)
+        return SimpleUploadedFile('slides.pptx', data.getvalue())
+
+    def test_page_cap_marks_pdf_truncated(self):
+        _, report = extract_text(self.pdf(3), max_pages=2)
+        self.assertEqual((report['pages'], report['truncated'], report['truncated_by']), (2, True, ['pages']))
+        _, report = extract_text(self.pdf(2), max_pages=2)
+        self.assertFalse(report['truncated'])
+
+    def test_page_cap_marks_pptx_truncated(self):
+        text, report = extract_text(self.pptx(3), max_pages=2)
+        self.assertEqual((report['pages'], report['truncated_by']), (2, ['pages']))
+        self.assertNotIn("Week 3", text)
+        _, report = extract_text(self.pptx(2), max_pages=2)
+        self.assertFalse(report['truncated'])
+
+    def test_memory_is_measured_one_extraction_at_a_time(self):
+        extract = extraction._extract
+        def locked_extract(*args):
+            self.assertTrue(extraction._trace_lock.locked())
+            return extract(*args)
+        with mock.patch.object(extraction, 'EXTRACT_TRACE_MEMORY', True), \
+                mock.patch.object(extraction, '_extract', locked_extract):
+            _, report = extract_text(SimpleUploadedFile('notes.txt', b'Week 1: Basics'))
+        self.assertIsNotNone(report['peak_memory_kb'])
+        _, report = extract_text(SimpleUploadedFile('notes.txt', b'Week 1: Basics'))
+        self.assertIsNone(report['peak_memory_kb'])
+
+    def test_char_budget_marks_truncated(self):
+        text, report = extract_text(SimpleUploadedFile('notes.txt', b'x' * 50), max_chars=10)
+        self.assertEqual((text, report['truncated_by']), ('x' * 10, ['chars']))
+
+
+class DashboardCacheVariantTests(SimpleTestCase):
+    def get(self, query, build):
+        request = RequestFactory().get('/api/get_dashboard_data/', query)
+        request.user = mock.Mock(is_authenticated=True, username='variant-check')
+        with mock.patch.object(views, '_dashboard_payload', build):
+            return views.get_dashboard_data_view(request)
+
+    def test_every_parameter_the_payload_reads_is_part_of_the_key(self):
+        dashboard_cache.invalidate('variant-check')
+        build = mock.Mock(side_effect=lambda request, params: {'status': 'success', 'params': dict(params)})
+        base = {'graph_detail': 'overview'}
+        first = self.get(base, build)
+        self.assertEqual(self.get(base, build)['ETag'], first['ETag'])
+        for name, value in (('shape', 'box'), ('edge', 'cross'), ('node', 'n1'), ('hops', '2'), ('graph_version', '3')):
+            response = self.get(dict(base, **{name: value}), build)
+            self.assertNotEqual(response['ETag'], first['ETag'], name)
+        self.assertEqual(build.call_count, 6)
+        self.assertTrue(all(set(call.args[1]) == set(views.DASHBOARD_PARAMS) for call in build.call_args_list))
+
+
+class JSONRepairTests(SimpleTestCase):
+    def parse(self, text, **kwargs):
+        return json_repair.parse(text, **kwargs)[0]
+
+    def test_complete_input(self):
+        self.assertEqual(self.parse('{"a": [1, 2], "b": "x\\ny"}'), {'a': [1, 2], 'b': 'x\ny'})
+
+    def test_fenced_input_with_prose(self):
+        text = 'Here you go:\n```json\n{"nodes": [{"id": "1"}]}\n```\nEnjoy!'
+        self.assertEqual(self.parse(text), {'nodes': [{'id': '1'}]})
+
+    def test_trailing_commas(self):
+        value, repairs = json_repair.parse('{"a": [1, 2,], "b": {"c": 3,},}')
+        self.assertEqual(value, {'a': [1, 2], 'b': {'c': 3}})
+        self.assertIn('trailing_comma', repairs)
+
+    def test_raw_control_characters_are_escaped(self):
+        self.assertEqual(self.parse('{"a": "line one\nline two"}'), {'a': 'line one\nline two'})
+
+    def test_truncated_input_needs_allow_partial(self):
+        with self.assertRaises(json_repair.JSONRepairError):
+            json_repair.parse('{"a": [1, 2')
+        self.assertEqual(self.parse('{"a": [1, 2', allow_partial=True), {'a': [1, 2]})
+        self.assertEqual(self.parse('{"a": "hal', allow_partial=True), {'a': 'hal'})
+        self.assertEqual(self.parse('{"a": 1, "b":', allow_partial=True), {'a': 1, 'b': None})
+
+    def test_truncated_inside_a_key(self):
+        self.assertEqual(self.parse('{"a": 1, "na', allow_partial=True), {'a': 1})
+        self.assertEqual(self.parse('{"a": 1, "name"', allow_partial=True), {'a': 1})
+        self.assertEqual(self.parse('[{"na', allow_partial=True), [{}])
+
+    def test_truncated_after_backslash(self):
+        self.assertEqual(self.parse('{"a": "x\\', allow_partial=True), {'a': 'x'})
+        self.assertEqual(self.parse('{"a": "x\\\\', allow_partial=True), {'a': 'x\\'})
+
+    def test_truncated_inside_unicode_escape(self):
+        for cut in ('\\u', '\\u0', '\\u00e'):
+            self.assertEqual(self.parse('{"a": "caf' + cut, allow_partial=True), {'a': 'caf'})
+        self.assertEqual(self.parse('{"a": "caf\\u00e9', allow_partial=True), {'a': 'caf\u00e9'})
+
+    def test_streamed_chunks_split_after_backslash(self):
+        parser = json_repair.TolerantJSONParser()
+        parser.feed('{"a": "x\\')
+        self.assertEqual(parser.finish(allow_partial=True)[0], {'a': 'x'})
+        parser.feed('n\\u00e9"}')
+        value, repairs = parser.finish()
+        self.assertEqual(value, {'a': 'x\n\u00e9'})
+        self.assertNotIn('closed_truncated', repairs)
+
+    def test_every_prefix_of_a_document_parses(self):
+        text = '```json\n{"nodes": [{"id": "1", "label": "Caf\\u00e9 \\"A\\""}], "edges": [], "n": 12.5}\n```'
+        for end in range(text.index('{') + 1, len(text) + 1):
+            json_repair.parse(text[:end], allow_partial=True)
+
+
+class _Query(list):
+    def only(self, *fields):
+        return self
+
+    def first(self):
+        return self[0] if self else None
+
+    def no_dereference(self):
+        return self
+
+    def filter(self, **kwargs):
+        return self
+
+
+class ApplyStatusesTests(SimpleTestCase):
+    def apply(self, matched, applied_ids):
+        task = Task._from_son({
+            '_id': ObjectId(), 'content': 'Step 1', 'status': 'pending',
+            'owner': DBRef('student', ObjectId()),
+        }, _auto_dereference=False)
+        collection = mock.Mock()
+        collection.bulk_write.return_value = mock.Mock(matched_count=matched)
+        collection.find.return_value = [{'_id': task.id}] if applied_ids else []
+        record = mock.Mock()
+        with mock.patch.object(Task, 'objects', lambda **kwargs: _Query([task])), \
+                mock.patch.object(Task, '_get_collection', lambda: collection), \
+                mock.patch.object(TaskBatch, 'objects', lambda **kwargs: []), \
+                mock.patch.object(task_store.prefetch, 'prefetch', lambda *args, **kwargs: {}), \
+                mock.patch.object(task_store.study_stats, 'record', record):
+            results, _, _ = task_store.apply_statuses([{'task_id': str(task.id), 'status': 'completed'}])
+        return results[0]['outcome'], record.call_args[0][0]
+
+    def test_applied_change_is_recorded(self):
+        outcome, transitions = self.apply(matched=1, applied_ids=True)
+        self.assertEqual(outcome, 'updated')
+        self.assertEqual(len(transitions), 1)
+
+    def test_change_lost_to_a_concurrent_request_is_not_recorded(self):
+        outcome, transitions = self.apply(matched=0, applied_ids=False)
+        self.assertEqual(outcome, 'unchanged')
+        self.assertEqual(transitions, [])
+
+
+def _mongo_available():
+    try:
+        hosts = [f"{host}:{port}" for host, port in get_connection().topology_description.server_descriptions()]
+        MongoClient(hosts, serverSelectionTimeoutMS=500).admin.command('ping')
+        return True
+    except Exception:
+        return False
+
+
+def _stages(plan):
+    # Walks inputStage/inputStages (and the SBE queryPlan wrapper) of an explain plan
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+class QueryPlanTests(SimpleTestCase):
+    """
+    Explains every query registered in queries.HOT_QUERIES and fails on a
+    collection scan or an in-memory sort. Needs the configured MongoDB (only
+    the declared indexes are created; no documents are written).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not _mongo_available():
+            raise SkipTest("MongoDB is not available")
+
+    def sample_arguments(self):
+        now = datetime.datetime.utcnow()
+        student = Student(id=ObjectId(), username='plan-check')
+        course = Course(id=ObjectId(), name='plan-check')
+        return {
+            'student': student, 'owner': student, 'username': student.username,
+            'course': course, 'course_id': course.id, 'batch': ObjectId(),
+            'task_ids': [ObjectId()], 'job_id': ObjectId(), 'fields': ('id',),
+            'day': now, 'since': now, 'stale': now, 'now': now, 'since_version': 1, 'until_version': 5,
+            'idempotency_key': 'plan-check', 'key': 'plan-check', 'keys': ['0:00000000'], 'limit': 10,
+        }
+
+    def test_hot_queries_use_indexes(self):
+        samples = self.sample_arguments()
+        for query in queries.HOT_QUERIES:
+            # Arguments are bound by parameter name; a new name needs a sample above
+            arguments = {name: samples[name] for name in inspect.signature(query).parameters}
+            queryset = query(**arguments)
+            queryset._document.ensure_indexes()
+            with self.subTest(query=query.__name__):
+                plan = queryset.explain()
+                stages = set(_stages(plan.get('queryPlanner', {}).get('winningPlan', {})))
+                self.assertNotIn('COLLSCAN', stages)
+                self.assertNotIn('SORT', stages)
+
+
+class JobRetryTests(SimpleTestCase):
+    def test_checkpoint_runs_once_across_attempts(self):
+        job = Job(id=ObjectId(), kind='generate_tasks')
+        produce = mock.Mock(return_value={'id': 'g1', 'version': 2})
+        with mock.patch.object(Job, 'objects') as objects:
+            self.assertEqual(jobs.JobContext(job, ['save']).checkpoint('graph', produce), {'id': 'g1', 'version': 2})
+            objects.return_value.update.assert_called_once_with(set__checkpoints__graph={'id': 'g1', 'version': 2})
+        # The retry claims the job again from Mongo, with the recorded checkpoint
+        retried = Job(id=job.id, kind='generate_tasks', checkpoints={'graph': {'id': 'g1', 'version': 2}})
+        with mock.patch.object(Job, 'objects'):
+            jobs.JobContext(retried, ['save']).checkpoint('graph', produce)
+        self.assertEqual(produce.call_count, 1)
+
+    def test_progress_counts_finished_stages(self):
+        ctx = jobs.JobContext(Job(id=ObjectId(), kind='upload_course'), ['clean', 'refine', 'graph', 'save'])
+        with mock.patch.object(Job, 'objects') as objects:
+            for name in ('graph', 'clean', 'refine'): # parallel stages finish in any order
+                ctx.finish_stage(name)
+        progress = [call.kwargs['max__progress'] for call in objects.return_value.update.call_args_list]
+        self.assertEqual(progress, [25, 50, 75])
+
+    def test_retried_job_reuses_its_task_batch(self):
+        batch = TaskBatch(id=ObjectId(), total=2)
+        saved = [Task(id=ObjectId()), Task(id=ObjectId())]
+        with mock.patch.object(task_store.queries, 'job_batch', lambda job_id: _Query([batch])), \
+                mock.patch.object(task_store.queries, 'batch_tasks', lambda batch, fields: saved), \
+                mock.patch.object(Task, 'objects') as task_objects:
+            result = task_store.create_tasks(Course(name='Bio'), None, ['a', 'b'], job_id=ObjectId())
+        self.assertEqual(result, (batch, [str(task.id) for task in saved]))
+        task_objects.insert.assert_not_called()
+
+
+class IncrementalNodeParserTests(SimpleTestCase):
+    def test_nodes_are_returned_once_complete(self):
+        text = '```json\n{"nodes": [{"id": "1", "label": "a {b}"}, {"id": "2", "label": "say \\"hi\\""}], "edges": []}'
+        parser = IncrementalNodeParser()
+        seen = []
+        for end in range(1, len(text) + 1):
+            seen.extend(parser.feed(text[:end]))
+        self.assertEqual(seen, [{'id': '1', 'label': 'a {b}'}, {'id': '2', 'label': 'say "hi"'}])
+        self.assertTrue(parser.done)
+
+    def test_stops_at_something_other_than_node_objects(self):
+        parser = IncrementalNodeParser()
+        self.assertEqual(parser.feed('{"nodes": ["a", {"id": "1"}]}'), [])
+        self.assertTrue(parser.done)
+
+
+class JobStreamTests(SimpleTestCase):
+    def job(self, **fields):
+        return Job(kind='upload_course', **fields)
+
+    def test_event_sequence(self):
+        sent = {'stage': None, 'refined': {}, 'nodes': 0}
+        polls = [
+            self.job(status='running', stage='refine', progress=50, partial={'refined': {'1': 'Week 2'}}),
+            self.job(status='running', stage='refine', progress=50,
+                     partial={'refined': {'0': 'Week 1', '1': 'Week 2 ok'}, 'nodes': [{'id': 'n1'}]}),
+            self.job(status='succeeded', stage='save', progress=100,
+                     partial={'refined': {'0': 'Week 1', '1': 'Week 2 ok'}, 'nodes': [{'id': 'n1'}]},
+                     result={'course_id': 'c1'}),
+        ]
+        events = []
+        for job in polls:
+            chunks, finished = views._job_events(job, sent)
+            events.extend(chunks)
+        self.assertTrue(finished)
+        self.assertEqual(events, [
+            views._sse('stage', {'stage': 'refine', 'progress': 50, 'status': 'running'}),
+            views._sse('refine', {'part': 1, 'text': 'Week 2'}),
+            views._sse('refine', {'part': 0, 'text': 'Week 1'}),
+            views._sse('refine', {'part': 1, 'text': ' ok'}),
+            views._sse('nodes', {'nodes': [{'id': 'n1'}]}),
+            views._sse('stage', {'stage': 'save', 'progress': 100, 'status': 'succeeded'}),
+            views._sse('done', {'result': {'course_id': 'c1'}}),
+        ])
+
+    def test_wsgi_stream_times_out_so_the_client_polls(self):
+        async def body(response):
+            return [chunk async for chunk in response.streaming_content]
+        request = RequestFactory().get('/api/job_stream/', {'id': str(ObjectId())})
+        running = self.job(status='running', stage='refine', progress=50)
+        with mock.patch.object(views, '_stream_access_error', lambda request, job_id: None), \
+                mock.patch.object(views, '_job_snapshot', lambda job_id: running), \
+                mock.patch.object(views, 'JOB_STREAM_WSGI_TIMEOUT', 0.05), \
+                mock.patch.object(views, 'JOB_STREAM_POLL', 0.01):
+            response = asyncio.run(views.job_stream_view(request))
+            chunks = [chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in asyncio.run(body(response))]
+        self.assertTrue(chunks[0].startswith('event: stage'))
+        self.assertEqual(chunks[-1], views._sse('timeout', {}))
+
+
+class GovernorTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = governor.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        patches = [
+            mock.patch.object(governor, '_breaker', self.breaker),
+            mock.patch.object(governor, '_stages', {}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def fail_with(self, error):
+        def fn(timeout):
+            raise error
+        with self.assertRaises(type(error)):
+            governor.call('test', fn)
+
+    def test_breaker_opens_on_upstream_errors_and_fails_fast(self):
+        self.fail_with(httpx.ReadTimeout('read timed out'))
+        self.fail_with(httpx.RemoteProtocolError('peer closed connection'))
+        self.assertEqual(self.breaker.state, 'open')
+        called = []
+        with self.assertRaises(governor.UpstreamUnavailable):
+            governor.call('test', called.append)
+        self.assertEqual(called, [])
+
+    def test_bad_request_does_not_open_breaker(self):
+        self.fail_with(ValueError('bad prompt'))
+        self.fail_with(ValueError('bad prompt'))
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_allows_one_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 31 # the reset timeout has passed
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, 'half_open')
+        self.assertFalse(self.breaker.allow()) # a second caller waits for the trial
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 31
+        self.assertEqual(governor.call('test', lambda timeout: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 31
+        self.fail_with(httpx.ConnectTimeout('connect timed out'))
+        self.assertEqual(self.breaker.state, 'open')
+
+    def test_rate_limit_halves_concurrency(self):
+        limiter = governor.get_stage('test').limiter
+        start = limiter.limit
+        response = httpx.Response(429, request=httpx.Request('POST', 'https://ark.example/chat'))
+        self.fail_with(RateLimitError('slow down', response=response, body=None))
+        self.assertEqual(limiter.limit, max(limiter.min_limit, start / 2))
+        self.assertEqual(governor.get_stage('test').metrics['rate_limited'], 1)
+        governor.call('test', lambda timeout: 'ok')
+        self.assertGreater(limiter.limit, start / 2) # additive increase after a fast success
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class SimilarityTests(SimpleTestCase):
+    def long_text(self, weeks, topic, seed=7919):
+        return '\n'.join(f"Week {week}: {topic} {week * seed}" for week in range(weeks))
+
+    def test_tail_differences_change_the_signature(self):
+        head = self.long_text(8000, 'Reading and discussion') # past 50k distinct shingles
+        self.assertGreater(len(similarity._shingles(head)), 50000)
+        same = similarity.signature(head + '\nFinal exam')
+        different = similarity.signature(head + '\n' + self.long_text(8000, 'Lab practical', seed=104729))
+        self.assertEqual(similarity.estimate(same, similarity.signature(head + '\nFinal exam')), 1.0)
+        self.assertLess(similarity.estimate(same, different), similarity.SIMILARITY_THRESHOLD)
+
+    def test_near_duplicates_match(self):
+        text = self.long_text(200, 'Reading and discussion')
+        edited = text.replace('Week 3:', 'Week three:')
+        self.assertGreaterEqual(
+            similarity.estimate(similarity.signature(text), similarity.signature(edited)),
+            similarity.SIMILARITY_THRESHOLD,
+        )
+
+
+def _chain_graph(count):
+    nodes = [{'id': f"n{i}", 'label': f"Topic {i}", 'level': min(i, 2)} for i in range(count)]
+    edges = [{'id': f"e{i}", 'from': f"n{i}", 'to': f"n{i + 1}"} for i in range(count - 1)]
+    return Graph(version=1, layout='hierarchical', nodes=nodes, edges=edges)
+
+
+class DashboardGraphParamsTests(SimpleTestCase):
+    def payload(self, **params):
+        graph = _chain_graph(graph_query.GRAPH_OVERVIEW_MIN_NODES + 1)
+        course = Course(id=ObjectId())
+        student = Student(id=ObjectId(), username='params-check', thinking_type='convergent')
+        params = dict({k: '' for k in views.DASHBOARD_PARAMS}, graph_detail='overview', **params)
+        with mock.patch.object(views.student_context, 'current_student', return_value=student), \
+                mock.patch.object(views.queries, 'latest_course', return_value=_Query([course])), \
+                mock.patch.object(views.queries, 'latest_batch', return_value=_Query()), \
+                mock.patch.object(views.queries, 'recent_tasks', return_value=_Query()), \
+                mock.patch.object(views.graph_store, 'current', return_value=graph), \
+                mock.patch.object(views.graph_query, 'load', return_value=graph_query.GraphIndex(graph)):
+            return views._dashboard_payload(None, params)
+
+    def test_expand(self):
+        payload = self.payload(node='n5', hops='2')
+        self.assertEqual(payload['status'], 'success')
+        self.assertEqual([n['id'] for n in payload['graph']['nodes']], ['n3', 'n4', 'n5', 'n6', 'n7'])
+
+    def test_bad_hops_is_an_error_payload(self):
+        payload = self.payload(node='n5', hops='two')
+        self.assertEqual(payload, {'status': 'error', 'message': "hops must be a whole number, not 'two'"})
+
+    def test_unknown_node_is_an_error_payload(self):
+        payload = self.payload(node='gone')
+        self.assertEqual(payload, {'status': 'error', 'message': 'Unknown node gone'})
+
+
+class ThinkingTypeLayoutTests(SimpleTestCase):
+    def test_switching_lays_out_the_latest_graph_once(self):
+        graph = _chain_graph(3)
+        course = Course(id=ObjectId())
+        student = Student(id=ObjectId(), username='layout-check', thinking_type='divergent')
+        request = RequestFactory().post('/api/set_thinking_type/', '{"thinking_type": "convergent"}',
+                                        content_type='application/json')
+        request.user = mock.Mock(is_authenticated=True, username='layout-check')
+        with mock.patch.object(views.student_context, 'current_student', return_value=student), \
+                mock.patch.object(views, 'Student') as students, \
+                mock.patch.object(views.queries, 'latest_course', return_value=_Query([course])), \
+                mock.patch.object(views.graph_store, 'current', return_value=graph), \
+                mock.patch.object(views.graph_store, 'ensure_layout') as ensure_layout:
+            response = views.set_thinking_type_view(request)
+        self.assertEqual(response.status_code, 200)
+        students.objects.return_value.update_one.assert_called_once_with(set__thinking_type='convergent')
+        ensure_layout.assert_called_once_with(course, graph, 'convergent')
+
+
+class LLMCacheExpiryTests(SimpleTestCase):
+    def test_put_sets_a_per_entry_expiry(self):
+        query = mock.Mock()
+        with mock.patch.object(llm_cache.queries, 'llm_cache_entry', return_value=query), \
+                mock.patch.object(llm_cache, '_writes_since_trim', 0):
+            llm_cache.put('expiry-put', {'ok': True})
+        fields = query.update_one.call_args.kwargs
+        self.assertEqual(fields['set__expires_at'] - fields['set__created_at'],
+                         datetime.timedelta(seconds=llm_cache.LLM_CACHE_TTL))
+
+    def test_expired_entry_is_a_miss(self):
+        now = datetime.datetime.utcnow()
+        entry = LLMCacheEntry(key='expiry-get', response='{}', created_at=now, expires_at=now - datetime.timedelta(seconds=1))
+        with mock.patch.object(llm_cache.queries, 'llm_cache_entry', return_value=_Query([entry])):
+            self.assertEqual(llm_cache.get_shared('expiry-get'), (False, None))
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(chunking.split_text("Week 1: Basics", max_tokens=100), ["Week 1: Basics"])
+
+    def test_splits_on_headings_within_budget(self):
+        weeks = [f"Week {n}\n" + f"Reading for week {n}. " * 10 for n in range(1, 9)]
+        text = '\n'.join(weeks)
+        chunks = chunking.split_text(text, max_tokens=150)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunking.estimate_tokens(c) <= 150 for c in chunks))
+        self.assertTrue(all(c.startswith('Week ') for c in chunks))
+        self.assertEqual('\n'.join(chunks).split(), text.split()) # nothing lost or repeated
+
+    def test_oversized_table_keeps_its_header_in_every_piece(self):
+        rows = [f"| {n} | Topic {n} with a longer description |" for n in range(40)]
+        text = '\n'.join(["## Schedule", "| Week | Topic |", "| --- | --- |"] + rows)
+        chunks = chunking.split_text(text, max_tokens=120)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("## Schedule\n| Week | Topic |\n| --- | --- |"))
+        self.assertEqual(sum(c.count('with a longer description') for c in chunks), 40)
+
+    def test_cjk_counts_about_a_token_per_character(self):
+        self.assertEqual(chunking.estimate_tokens('第三周'), 3)
+        self.assertEqual(chunking.estimate_tokens('abcdefgh'), 2)
+
+
+class MergeGraphsTests(SimpleTestCase):
+    def test_same_label_collapses_with_remapped_edges(self):
+        first = {
+            'nodes': [{'id': '1', 'label': 'Course', 'level': 0}, {'id': '2', 'label': 'Sorting', 'level': 2}],
+            'edges': [{'from': '1', 'to': '2'}],
+            'concepts': ['Sorting'],
+        }
+        second = {
+            'nodes': [{'id': '1', 'label': 'Course part 2', 'level': 0}, {'id': '7', 'label': 'sorting', 'level': 1},
+                      {'id': '8', 'label': 'Graphs', 'level': 1}],
+            'edges': [{'from': '1', 'to': '7'}, {'from': '7', 'to': '8'}, {'from': '8', 'to': '8'}, {'from': '8', 'to': '99'}],
+            'concepts': ['SORTING', 'Graphs'],
+        }
+        merged = chunking.merge_graphs([first, None, second])
+        root, sorting, graphs = (chunking.stable_node_id(l) for l in ('Course', 'Sorting', 'Graphs'))
+        self.assertEqual([n['id'] for n in merged['nodes']], [root, sorting, graphs])
+        self.assertEqual(merged['nodes'][1]['level'], 1) # shallowest level wins
+        self.assertEqual([(e['from'], e['to']) for e in merged['edges']], [(root, sorting), (sorting, graphs)])
+        self.assertEqual(merged['concepts'], ['Sorting', 'Graphs'])
+
+    def test_merge_is_deterministic(self):
+        partial = {'nodes': [{'id': 'a', 'label': 'Recursion'}], 'edges': [], 'concepts': []}
+        self.assertEqual(chunking.merge_graphs([partial]), chunking.merge_graphs([dict(partial)]))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.release = mock.patch.object(singleflight, '_release_lease')
+        self.release.start()
+        self.addCleanup(self.release.stop)
+
+    def test_local_followers_share_the_leaders_call(self):
+        started = threading.Event()
+        finish = threading.Event()
+        calls = []
+        def producer():
+            calls.append(1)
+            started.set()
+            finish.wait(5)
+            return {'nodes': []}
+        results = []
+        def caller():
+            results.append(singleflight.do('flight-local', producer, lambda: (False, None)))
+        waiting = singleflight.stats()['local_waiters']
+        with mock.patch.object(singleflight, '_acquire_lease', return_value=True):
+            threads = [threading.Thread(target=caller) for _ in range(4)]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            for _ in range(500): # the followers join the flight before the leader finishes
+                if singleflight.stats()['local_waiters'] - waiting == 3:
+                    break
+                finish.wait(0.01)
+            finish.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'nodes': []}] * 4)
+        self.assertEqual(len({id(r) for r in results}), 4) # every caller gets its own copy
+
+    def test_remote_follower_reads_the_shared_cache(self):
+        lookups = iter([(False, None), (True, {'from': 'cache'})])
+        producer = mock.Mock()
+        with mock.patch.object(singleflight, '_acquire_lease', return_value=False), \
+                mock.patch.object(singleflight, '_lease_alive', return_value=True), \
+                mock.patch.object(singleflight, 'LLM_LEASE_POLL', 0):
+            value = singleflight.do('flight-remote', producer, lambda: next(lookups))
+        self.assertEqual(value, {'from': 'cache'})
+        producer.assert_not_called()
+
+    def test_takes_over_when_the_remote_leader_fails(self):
+        with mock.patch.object(singleflight, '_acquire_lease', side_effect=[False, True]), \
+                mock.patch.object(singleflight, '_lease_alive', return_value=False):
+            value = singleflight.do('flight-takeover', lambda: 'fresh', lambda: (False, None))
+        self.assertEqual(value, 'fresh')
+
+
+class ConceptMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = concepts.ConceptMatcher([
+            ('n1', 'Linear Algebra'),
+            ('n2', 'Linear regression models'),
+            ('n3', 'Graphs'),
+            ('n4', 'Graph traversal algorithms'),
+            ('n5', '线性代数'),
+            ('n6', ''),
+        ])
+
+    def test_tiers_rank_exact_then_prefix_then_containment(self):
+        self.assertEqual(len(self.matcher), 5) # empty labels are skipped
+        self.assertEqual(self.matcher.rank('linear algebra', limit=1), [('n1', concepts.EXACT, 1.0)])
+        self.assertEqual(self.matcher.rank('Graph')[0][:2], ('n3', concepts.PREFIX)) # same token, but not the same label
+        self.assertEqual(self.matcher.rank('Linear regression')[0][:2], ('n2', concepts.PREFIX))
+        self.assertEqual(self.matcher.rank('traversal')[0][:2], ('n4', concepts.CONTAINS))
+
+    def test_best_needs_enough_overlap(self):
+        self.assertEqual(self.matcher.best('Graph traversal algorithms'), 'n4')
+        self.assertEqual(self.matcher.best('LINEAR-ALGEBRA'), 'n1')
+        self.assertEqual(self.matcher.best('代数'), 'n5')
+        self.assertIsNone(self.matcher.best('Linear programming duality theory'))
+        self.assertIsNone(self.matcher.best('traversal', min_tier=concepts.PREFIX))
+        self.assertIsNone(self.matcher.best('Organic chemistry'))
+
+    def test_limit_one_agrees_with_full_ranking(self):
+        for concept in ('linear', 'graph algorithms', 'regression', '线性'):
+            self.assertEqual(self.matcher.rank(concept, limit=1), self.matcher.rank(concept)[:1], concept)
+
+
+class RelatedCoursesTests(SimpleTestCase):
+    def index(self, *courses):
+        entries = {str(c.id): concepts._course_entry(c) for c in courses}
+        df = {}
+        for entry in entries.values():
+            for token in entry['tf']:
+                df[token] = df.get(token, 0) + 1
+        return ConceptIndex(df=df, courses=entries)
+
+    def course(self, name, extracted):
+        return Course(id=ObjectId(), name=name, extracted_concepts=extracted)
+
+    def test_ranks_by_shared_concepts_and_links_identical_ones(self):
+        current = self.course('Machine Learning', ['Linear regression', 'Gradient descent'])
+        stats = self.course('Statistics', ['Linear Regressions', 'Hypothesis testing', 'Regression diagnostics'])
+        calculus = self.course('Calculus', ['Gradient', 'Integrals'])
+        history = self.course('History', ['Roman empire'])
+        index = self.index(current, stats, calculus, history)
+        direct, others = concepts.related_courses(index, current.id, current.extracted_concepts)
+        self.assertEqual(direct, [{
+            'from_concept': 'Linear regression', 'to_course': 'Statistics',
+            'to_concept': 'Linear Regressions', 'reason': "Same concept appears in both courses",
+        }])
+        self.assertEqual(others, [
+            {'name': 'Statistics', 'concepts': ['Regression diagnostics']},
+            {'name': 'Calculus', 'concepts': ['Gradient']},
+        ])
+
+    def test_top_k_and_own_course_excluded(self):
+        current = self.course('A', ['Sorting'])
+        others = [self.course(f"C{n}", ['Sorting algorithms'] + ['Filler'] * n) for n in range(4)]
+        index = self.index(current, *others)
+        _, related = concepts.related_courses(index, current.id, ['Sorting'], top_k=2)
+        self.assertEqual([r['name'] for r in related], ['C0', 'C1']) # shorter documents score higher
+
+    def test_index_course_updates_document_frequencies_incrementally(self):
+        course = self.course('Statistics', ['Regression', 'Sampling'])
+        course.owner = Student(id=ObjectId())
+        existing = ConceptIndex(courses={str(course.id): {'tf': {'regression': 1, 'anova': 1}}})
+        query = mock.MagicMock()
+        query.only.return_value.first.return_value = existing
+        with mock.patch.object(concepts.queries, 'concept_index', return_value=query):
+            concepts.index_course(course)
+        update = query.update_one.call_args.kwargs['__raw__']
+        self.assertEqual(update['$inc'], {'df.sampling': 1, 'df.anova': -1})
+        self.assertEqual(update['$set'][f"courses.{course.id}"]['tf'], {'regression': 1, 'sampling': 1})
+
+
+def _apply_delta(items, upserted, removed):
+    by_id = {item['id']: item for item in items if item['id'] not in removed}
+    by_id.update((item['id'], item) for item in upserted)
+    return by_id
+
+
+class GraphDeltaTests(SimpleTestCase):
+    versions = [
+        ([{'id': 'a', 'label': 'A'}, {'id': 'b', 'label': 'B'}], [{'from': 'a', 'to': 'b'}]),
+        ([{'id': 'a', 'label': 'A'}, {'id': 'b', 'label': 'B', 'color': 'red'}, {'id': 'c', 'label': 'C'}],
+         [{'from': 'a', 'to': 'b'}, {'from': 'b', 'to': 'c'}]),
+        ([{'id': 'a', 'label': 'A'}, {'id': 'c', 'label': 'C'}], [{'from': 'a', 'to': 'c'}]),
+    ]
+
+    def history(self):
+        course = Course(id=ObjectId())
+        snapshots = [graph_store.stabilize(nodes, edges) for nodes, edges in self.versions]
+        deltas = []
+        for version, ((old_nodes, old_edges), (nodes, edges)) in enumerate(zip(snapshots, snapshots[1:]), start=2):
+            nodes_upserted, nodes_removed = graph_store.diff(old_nodes, nodes)
+            edges_upserted, edges_removed = graph_store.diff(old_edges, edges)
+            deltas.append(GraphDelta(
+                course=course, version=version, nodes_upserted=nodes_upserted, nodes_removed=nodes_removed,
+                edges_upserted=edges_upserted, edges_removed=edges_removed,
+            ))
+        nodes, edges = snapshots[-1]
+        graph = Graph(course=course, version=len(snapshots), layout='divergent', nodes=nodes, edges=edges)
+        return course, graph, snapshots, deltas
+
+    def changes(self, since, deltas):
+        course, graph, _, _ = self.history()
+        def graph_deltas(course, since_version, until_version):
+            return [d for d in deltas if since_version < d.version <= until_version]
+        with mock.patch.object(graph_store.queries, 'graph_deltas', graph_deltas):
+            return graph_store.changes_since(course, graph, since)
+
+    def test_diff_round_trips(self):
+        old = [{'id': 'a', 'x': 1}, {'id': 'b'}, {'id': 'c'}]
+        new = [{'id': 'a', 'x': 2}, {'id': 'c'}, {'id': 'd'}]
+        upserted, removed = graph_store.diff(old, new)
+        self.assertEqual(upserted, [{'id': 'a', 'x': 2}, {'id': 'd'}])
+        self.assertEqual(removed, ['b'])
+        self.assertEqual(_apply_delta(old, upserted, removed), {item['id']: item for item in new})
+        self.assertEqual(graph_store.diff(new, new), ([], []))
+
+    def test_deltas_replayed_from_any_version_reach_the_snapshot(self):
+        _, graph, snapshots, deltas = self.history()
+        for since in (1, 2):
+            payload = self.changes(since, deltas)
+            self.assertEqual([d['version'] for d in payload['deltas']], list(range(since + 1, graph.version + 1)))
+            nodes, edges = snapshots[since - 1]
+            for delta in payload['deltas']:
+                nodes = list(_apply_delta(nodes, delta['nodes_upserted'], delta['nodes_removed']).values())
+                edges = list(_apply_delta(edges, delta['edges_upserted'], delta['edges_removed']).values())
+            self.assertEqual(sorted(nodes, key=lambda n: n['id']), sorted(graph.nodes, key=lambda n: n['id']))
+            self.assertEqual(sorted(edges, key=lambda e: e['id']), sorted(graph.edges, key=lambda e: e['id']))
+
+    def test_snapshot_when_deltas_are_missing_or_client_is_current(self):
+        _, graph, _, deltas = self.history()
+        self.assertEqual(self.changes(3, deltas), {'version': 3, 'layout': 'divergent', 'unchanged': True})
+        self.assertIn('nodes', self.changes(1, deltas[1:])) # compacted away: full snapshot
+        self.assertIn('nodes', self.changes(0, deltas))
+        self.assertIn('nodes', self.changes(7, deltas)) # a version from before a reset
+
+
+class LayoutTests(SimpleTestCase):
+    def graph(self, count):
+        nodes = [{'id': f"n{i}", 'label': f"Topic {i}", 'level': 0 if i == 0 else 1 + (i > 3)} for i in range(count)]
+        edges = [{'from': f"n{(i - 1) // 3}", 'to': f"n{i}"} for i in range(1, count)]
+        return nodes, edges
+
+    def test_force_directed_is_deterministic_and_bounded(self):
+        nodes, edges = self.graph(40)
+        first = layout.apply(nodes, edges, 'divergent')
+        self.assertEqual(first, layout.apply(nodes, edges, 'divergent'))
+        limit = layout.SPRING_LENGTH * len(nodes) ** 0.5 * 2
+        points = {(n['x'], n['y']) for n in first}
+        self.assertEqual(len(points), len(nodes)) # no two nodes on top of each other
+        self.assertTrue(all(abs(x) <= limit and abs(y) <= limit for x, y in points))
+        self.assertTrue(all(isinstance(n['x'], int) and isinstance(n['y'], int) for n in first))
+
+    def test_previous_nodes_stay_pinned(self):
+        nodes, edges = self.graph(20)
+        before = layout.apply(nodes, edges, 'divergent')
+        more_nodes, more_edges = self.graph(24)
+        after = layout.apply(more_nodes, more_edges, 'divergent', previous_nodes=before)
+        self.assertEqual(after[:20], before)
+        self.assertTrue(all(abs(n['x']) < 10 ** 5 for n in after[20:]))
+
+    def test_hierarchical_rows_follow_levels(self):
+        nodes, edges = self.graph(10)
+        placed = {n['id']: n for n in layout.apply(nodes, edges, 'convergent')}
+        for node in nodes:
+            self.assertEqual(placed[node['id']]['y'], node['level'] * layout.LEVEL_SEPARATION)
+        self.assertEqual(placed['n0']['x'], 0) # a single root is centred
+        row = sorted(n['x'] for n in placed.values() if n['level'] == 1)
+        self.assertEqual(row, [-layout.NODE_SPACING, 0, layout.NODE_SPACING])
+
+    def test_too_large_graphs_are_left_to_the_client(self):
+        nodes = [{'id': 'a', 'x': 1, 'y': 2}, {'id': 'b'}]
+        with mock.patch.object(layout, 'LAYOUT_MAX_NODES', 1):
+            self.assertEqual(layout.apply(nodes, [], 'divergent'), [{'id': 'a'}, {'id': 'b'}])
+
+
+class GraphQueryTests(SimpleTestCase):
+    def index(self):
+        nodes = [
+            {'id': 'root', 'level': 0, 'shape': 'box'},
+            {'id': 'a', 'level': 1, 'shape': 'dot'},
+            {'id': 'b', 'level': 1, 'shape': 'dot'},
+            {'id': 'a1', 'level': 2, 'shape': 'dot'},
+            {'id': 'a2', 'level': 2, 'shape': 'star'},
+            {'id': 'a11', 'level': 3, 'shape': 'dot'},
+        ]
+        edges = [
+            {'id': 'e1', 'from': 'root', 'to': 'a'},
+            {'id': 'e2', 'from': 'root', 'to': 'b'},
+            {'id': 'e3', 'from': 'a', 'to': 'a1'},
+            {'id': 'e4', 'from': 'a', 'to': 'a2', 'color': 'Red'},
+            {'id': 'e5', 'from': 'a1', 'to': 'a11'},
+            {'id': 'e6', 'from': 'b', 'to': 'a2', 'dashes': True},
+            {'id': 'e7', 'from': 'a', 'to': 'gone'}, # dangling edges are ignored
+        ]
+        return graph_query.GraphIndex(Graph(version=4, layout='convergent', nodes=nodes, edges=edges))
+
+    def ids(self, items):
+        return [item['id'] for item in items]
+
+    def test_convergent_overview_is_the_top_levels(self):
+        nodes, edges = graph_query.overview(self.index(), 'convergent')
+        self.assertEqual(self.ids(nodes), ['root', 'a', 'b'])
+        self.assertEqual(self.ids(edges), ['e1', 'e2'])
+        self.assertEqual({n['id']: n['hidden_neighbours'] for n in nodes}, {'root': 0, 'a': 2, 'b': 1})
+
+    def test_divergent_overview_is_the_hubs(self):
+        with mock.patch.object(graph_query, 'GRAPH_OVERVIEW_HUBS', 2):
+            nodes, _ = graph_query.overview(self.index(), 'divergent')
+        # 'a' has the most edges and root wins the tie for second; returned in graph order
+        self.assertEqual(self.ids(nodes), ['root', 'a'])
+
+    def test_expand_hops_and_border_edges(self):
+        index = self.index()
+        nodes, edges = graph_query.expand(index, 'a1', hops=1)
+        self.assertEqual(self.ids(nodes), ['a', 'a1', 'a11'])
+        self.assertEqual(sorted(self.ids(edges)), ['e1', 'e3', 'e4', 'e5']) # edges leaving the set too
+        nodes, _ = graph_query.expand(index, 'a1', hops=2)
+        self.assertEqual(self.ids(nodes), ['root', 'a', 'a1', 'a2', 'a11'])
+        nodes, _ = graph_query.expand(index, 'a11', hops=99) # capped at MAX_HOPS
+        self.assertNotIn('b', self.ids(nodes))
+
+    def test_expand_filters(self):
+        index = self.index()
+        nodes, _ = graph_query.expand(index, 'a', hops=1, shapes={'dot'})
+        self.assertEqual(self.ids(nodes), ['a', 'a1'])
+        nodes, edges = graph_query.expand(index, 'b', hops=1, edge_classes={'cross'})
+        self.assertEqual((self.ids(nodes), self.ids(edges)), (['b', 'a2'], ['e6']))
+        nodes, _ = graph_query.expand(index, 'a', hops=1, edge_classes={'red'})
+        self.assertEqual(self.ids(nodes), ['a', 'a2'])
+
+    def test_expand_rejects_unknown_nodes_and_bad_hops(self):
+        with self.assertRaises(KeyError):
+            graph_query.expand(self.index(), 'gone')
+        with self.assertRaises(ValueError):
+            graph_query.expand(self.index(), 'a', hops='x')
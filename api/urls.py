@@ -9,8 +9,15 @@ urlpatterns = [
     path('upload_course/', views.upload_course_view, name='upload_course'),
     path('set_thinking_type/', views.set_thinking_type_view, name='set_thinking_type'),
     path('generate_tasks/', views.generate_tasks_view, name='generate_tasks'),
+    path('job_status/', views.job_status_view, name='job_status'),
+    path('job_stream/', views.job_stream_view, name='job_stream'),
     path('get_task_details/', views.get_task_details_view, name='get_task_details'),
     path('get_dashboard_data/', views.get_dashboard_data_view, name='get_dashboard_data'),
+    path('graph_delta/', views.graph_delta_view, name='graph_delta'),
+    path('graph_subgraph/', views.graph_subgraph_view, name='graph_subgraph'),
     path('complete_task/', views.complete_task_view, name='complete_task'),
+    path('complete_tasks/', views.complete_tasks_view, name='complete_tasks'),
     path('get_results/', views.get_results_view, name='get_results'),
+    path('get_stats/', views.get_stats_view, name='get_stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
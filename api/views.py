@@ -1,15 +1,30 @@
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
-from django.http import JsonResponse
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from .models import Student, Course, Graph, Task
+from .models import Student, Task, Job
+import asyncio
 import json
-from pypdf import PdfReader
-from docx import Document as DocxDocument
-from pptx import Presentation
-import io
 import datetime
-from .ai_service import extract_course_structure, generate_smart_tasks, find_cross_connections, refine_syllabus_with_doubao
+from urllib.parse import urlencode
+import time
+from .jobs import enqueue, make_idempotency_key, job_to_dict
+from .pipeline import UPLOAD_STAGES, GENERATE_STAGES
+from .extraction import extract_text, file_digest
+from . import dashboard_cache, extraction, governor, graph_query, graph_store, json_repair, llm_cache, prefetch, queries, singleflight, student_context, study_stats, task_store
+
+JOB_STREAM_TIMEOUT = getattr(settings, 'JOB_STREAM_TIMEOUT', 300) # seconds, under ASGI
+JOB_STREAM_WSGI_TIMEOUT = getattr(settings, 'JOB_STREAM_WSGI_TIMEOUT', 20) # seconds a stream may hold a WSGI worker
+JOB_STREAM_POLL = getattr(settings, 'JOB_STREAM_POLL', 0.5) # seconds
+
+def _wants_fresh(request, params):
+    # Per-request LLM cache bypass: `Cache-Control: no-cache` header or a truthy `no_cache` field
+    if 'no-cache' in request.headers.get('Cache-Control', ''):
+        return True
+    return str(params.get('no_cache', '')).lower() in ('1', 'true', 'yes')
 
 @csrf_exempt
 def upload_course_view(request):
@@ -18,58 +33,32 @@ def upload_course_view(request):
             if 'file' not in request.FILES:
                 return JsonResponse({'status': 'error', 'message': 'No file uploaded'})
             
-            file = request.FILES['file']
-            file_name = file.name
-            file_content = file.read()
-            
-            # Simple parsing logic
-            text_content = ""
-            if file_name.endswith('.pdf'):
-                try:
-                    reader = PdfReader(io.BytesIO(file_content))
-                    for page in reader.pages:
-                        text_content += page.extract_text()
-                except:
-                    text_content = "PDF Parsing Failed"
-            elif file_name.endswith('.docx'):
-                try:
-                    doc = DocxDocument(io.BytesIO(file_content))
-                    for para in doc.paragraphs:
-                        text_content += para.text + "\n"
-                except:
-                    text_content = "Docx Parsing Failed"
-            elif file_name.endswith('.pptx'):
-                try:
-                    prs = Presentation(io.BytesIO(file_content))
-                    for slide in prs.slides:
-                        for shape in slide.shapes:
-                            if hasattr(shape, "text"):
-                                text_content += shape.text + "\n"
-                except Exception as e:
-                    print(f"PPTX Parsing Error: {e}")
-                    text_content = "PPTX Parsing Failed"
-            else:
-                text_content = file_content.decode('utf-8', errors='ignore')
-
             if not request.user.is_authenticated:
                  return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+
+            file = request.FILES['file']
+            file_name = file.name
+            # Streams from the upload (spooled to disk when large) within the page/char budget
+            text_content, extract_report = extract_text(file)
+            file_digest_hex = file_digest(file)
             
-            student = Student.objects.get(username=request.user.username)
-            
-            # --- 🚀 NEW: Doubao Refinement Pipeline ---
-            print(f"DEBUG: Starting Doubao refinement for {file_name}")
-            refined_content = refine_syllabus_with_doubao(text_content)
+            student = student_context.current_student(request)
             
-            course = Course(
-                name=file_name.split('.')[0],
-                outline_text=text_content[:15000], 
-                refined_text=refined_content,
+            # Refinement runs on the job workers; a double-clicked upload of the
+            # same file maps to the same idempotency key and reuses the job.
+            no_cache = _wants_fresh(request, request.POST)
+            idempotency_key = request.headers.get('Idempotency-Key') or make_idempotency_key(
+                'upload_course', student.username, file_name, file_digest_hex, str(no_cache)
+            )
+            job = enqueue(
+                'upload_course',
                 owner=student,
-                icon="dumpling"
+                payload={'file_name': file_name, 'text': text_content, 'no_cache': no_cache, 'extraction': extract_report},
+                stage_names=UPLOAD_STAGES,
+                idempotency_key=idempotency_key,
             )
-            course.save()
             
-            return JsonResponse({'status': 'success', 'course_id': str(course.id)})
+            return JsonResponse({'status': 'success', 'job_id': str(job.id), 'job_status': job.status})
         except Exception as e:
              return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
@@ -84,9 +73,17 @@ def set_thinking_type_view(request):
             if not request.user.is_authenticated:
                  return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
                  
-            student = Student.objects.get(username=request.user.username)
-            student.thinking_type = thinking_type
-            student.save()
+            student = student_context.current_student(request)
+            Student.objects(id=student.id).update_one(set__thinking_type=thinking_type)
+            # Re-lay out the dashboard's graph here, once, so reads never write
+            course = queries.latest_course(student).first()
+            if course:
+                try:
+                    graph_store.ensure_layout(course, graph_store.current(course), thinking_type)
+                except Exception as e:
+                    print(f"Re-layout for {student.username} failed: {e}")
+            student_context.invalidate(student.username)
+            dashboard_cache.invalidate(student.username)
             
             return JsonResponse({'status': 'success'})
         except Exception as e:
@@ -103,140 +100,150 @@ def generate_tasks_view(request):
             if not request.user.is_authenticated:
                  return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
             
-            student = Student.objects.get(username=request.user.username)
+            student = student_context.current_student(request)
             
-            course = Course.objects.filter(owner=student).order_by('-created_at').first()
+            course = queries.latest_course(student).first()
             if not course:
                 return JsonResponse({'status': 'error', 'message': 'No course found'})
             
-            # 1. AI Analysis (Structure Extraction)
-            print(f"DEBUG: Starting task generation for: {course.name}")
-            print(f"DEBUG: Thinking Type: {student.thinking_type}")
-            
-            # Use refined text if available, otherwise fallback to raw text
-            analysis_source = course.refined_text if course.refined_text else course.outline_text
-            print(f"DEBUG: Using {'REFINED' if course.refined_text else 'RAW'} text for analysis")
-            
-            ai_data = extract_course_structure(analysis_source, student.thinking_type)
-            print(f"DEBUG: AI Data Received: {bool(ai_data)}")
-            
-            nodes = []
-            edges = []
-            tasks_content = []
-            
-            if ai_data:
-                # Use AI Data
-                print("DEBUG: Processing AI Data...")
-                raw_nodes = ai_data.get('nodes', [])
-                raw_edges = ai_data.get('edges', [])
-                concepts = ai_data.get('concepts', [])
-                
-                print(f"DEBUG: Found {len(raw_nodes)} nodes and {len(raw_edges)} edges")
-                
-                # Ensure all IDs are strings to prevent Vis.js mismatch
-                for n in raw_nodes:
-                    n['id'] = str(n.get('id', ''))
-                    nodes.append(n)
-                
-                for e in raw_edges:
-                    e['from'] = str(e.get('from', ''))
-                    e['to'] = str(e.get('to', ''))
-                    edges.append(e)
-                
-                # Update Course with concepts
-                course.extracted_concepts = concepts
-                course.save()
-                
-                # 2. Cross-Course Connections
-                # Use mongoengine syntax correctly
-                other_courses = Course.objects.filter(owner=student, id__ne=course.id)
-                others_data = [{'name': c.name, 'concepts': c.extracted_concepts} for c in other_courses if c.extracted_concepts]
-                
-                if others_data:
-                    print(f"DEBUG: Checking cross-connections with {len(others_data)} other courses")
-                    cross_links = find_cross_connections(course.name, concepts, others_data)
-                    print(f"DEBUG: Found {len(cross_links)} cross links")
-                    
-                    # Add cross-links to graph
-                    for link in cross_links:
-                        # Create a special node for the external concept
-                        ext_node_id = f"ext_{link['to_course']}_{link['to_concept']}"
-                        nodes.append({
-                            'id': ext_node_id,
-                            'label': f"{link['to_concept']} ({link['to_course']})",
-                            'shape': 'diamond', # Different shape for external
-                            'color': '#81D4FA', # Blue for external
-                            'level': 2, # Default level for hierarchical layout
-                            'title': f"From course: {link['to_course']}\nReason: {link.get('reason', '')}"
-                        })
-                        
-                        # Find local node to connect to (fuzzy match)
-                        local_node_id = None
-                        for n in nodes:
-                            if n['label'].lower() in link['from_concept'].lower() or link['from_concept'].lower() in n['label'].lower():
-                                local_node_id = n['id']
-                                break
-                        
-                        if local_node_id:
-                            edges.append({
-                                'from': local_node_id,
-                                'to': ext_node_id,
-                                'dashes': True, # Dashed line for cross-link
-                                'label': 'Related',
-                                'title': link.get('reason', 'Cross-course connection')
-                            })
-
-                # 3. AI Task Generation
-                print("DEBUG: Generating smart tasks...")
-                ai_tasks = generate_smart_tasks(course.name, nodes, count)
-                if ai_tasks and 'tasks' in ai_tasks:
-                    tasks_content = ai_tasks['tasks']
-                    print(f"DEBUG: Generated {len(tasks_content)} tasks")
-            else:
-                print("DEBUG: AI Data was None, falling back to mock data.")
-            
-            # Fallback if AI fails or returns empty
-            if not tasks_content:
-                print("DEBUG: Falling back to mock tasks.")
-                tasks_content = [f"Cook {course.name} - Step {i+1}" for i in range(count)]
-            
-            if not nodes:
-                print("DEBUG: Falling back to mock nodes/edges.")
-                nodes = [
-                    {'id': '1', 'label': course.name, 'shape': 'box', 'color': '#FFD54F', 'level': 0},
-                    {'id': '2', 'label': 'Preparation', 'shape': 'dot', 'color': '#FFAB91', 'level': 1},
-                    {'id': '3', 'label': 'Core Ingredients', 'shape': 'dot', 'color': '#FFAB91', 'level': 1},
-                ]
-                edges = [{'from': '1', 'to': '2'}, {'from': '1', 'to': '3'}]
-
-            # Save Tasks
-            tasks_data = []
-            for i, content in enumerate(tasks_content):
-                task = Task(
-                    content=content,
-                    course=course,
-                    owner=student,
-                    status="pending"
-                )
-                task.save()
-                tasks_data.append(str(task.id))
-                
-            # Save Graph
-            graph = Graph(
-                course=course,
-                nodes=nodes,
-                edges=edges,
-                owner=student
+            # Structure extraction, cross-links and task generation run on the job workers
+            no_cache = _wants_fresh(request, data)
+            idempotency_key = request.headers.get('Idempotency-Key') or make_idempotency_key(
+                'generate_tasks', student.username, str(course.id), str(count), student.thinking_type or '', str(no_cache)
+            )
+            job = enqueue(
+                'generate_tasks',
+                owner=student,
+                payload={'course_id': str(course.id), 'count': count, 'no_cache': no_cache},
+                stage_names=GENERATE_STAGES,
+                idempotency_key=idempotency_key,
             )
-            graph.save()
+            # The job's save stage invalidates again once the new graph and tasks exist
+            dashboard_cache.invalidate(student.username)
             
-            return JsonResponse({'status': 'success', 'graph_id': str(graph.id), 'task_ids': tasks_data})
+            return JsonResponse({'status': 'success', 'job_id': str(job.id), 'job_status': job.status})
         except Exception as e:
             import traceback
             traceback.print_exc()
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
 
+@csrf_exempt
+def job_status_view(request):
+    if not request.user.is_authenticated:
+         return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+    
+    job_id = request.GET.get('id')
+    try:
+        student = student_context.current_student(request)
+        job = queries.owned_job(job_id, student).get()
+        return JsonResponse({'status': 'success', 'job': job_to_dict(job)})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _stream_access_error(request, job_id):
+    if not request.user.is_authenticated:
+        return 'Not authenticated'
+    try:
+        student = student_context.current_student(request)
+        queries.owned_job(job_id, student).only('id').get()
+    except Exception as e:
+        return str(e)
+    return None
+
+def _job_snapshot(job_id):
+    return Job.objects(id=job_id).only('status', 'stage', 'progress', 'partial', 'result', 'error').first()
+
+def _job_events(job, sent):
+    """
+    SSE events for one poll of the job, given what was already sent
+    ({'stage', 'refined': {part: chars}, 'nodes'}, updated in place).
+    Returns (events, finished).
+    """
+    if job is None:
+        return [_sse('error', {'message': 'Job not found'})], True
+    events = []
+    if (job.stage, job.progress) != sent['stage']:
+        sent['stage'] = (job.stage, job.progress)
+        events.append(_sse('stage', {'stage': job.stage, 'progress': job.progress, 'status': job.status}))
+
+    partial = job.partial or {}
+    for part, text in sorted(partial.get('refined', {}).items(), key=lambda item: int(item[0])):
+        done = sent['refined'].get(part, 0)
+        if len(text) > done:
+            events.append(_sse('refine', {'part': int(part), 'text': text[done:]}))
+            sent['refined'][part] = len(text)
+
+    nodes = partial.get('nodes', [])
+    if len(nodes) > sent['nodes']:
+        events.append(_sse('nodes', {'nodes': nodes[sent['nodes']:]}))
+        sent['nodes'] = len(nodes)
+
+    if job.status == 'succeeded':
+        events.append(_sse('done', {'result': job.result}))
+        return events, True
+    if job.status == 'failed':
+        events.append(_sse('failed', {'error': job.error}))
+        return events, True
+    return events, False
+
+async def job_stream_view(request):
+    """
+    Server-sent events for a job: stage changes, partial refined Markdown
+    (`refine`, appended text per part), streamed graph nodes (`nodes`) and a
+    final `done` event carrying the job result.
+    Under ASGI the stream waits on the event loop, not a worker thread. Under
+    WSGI every open stream holds a worker, so it ends after
+    JOB_STREAM_WSGI_TIMEOUT with a `timeout` event and app.js polls job_status.
+    """
+    job_id = request.GET.get('id')
+    error = await sync_to_async(_stream_access_error)(request, job_id)
+    if error:
+        return JsonResponse({'status': 'error', 'message': error})
+    timeout = JOB_STREAM_TIMEOUT if isinstance(request, ASGIRequest) else JOB_STREAM_WSGI_TIMEOUT
+
+    async def events():
+        sent = {'stage': None, 'refined': {}, 'nodes': 0}
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = await sync_to_async(_job_snapshot, thread_sensitive=False)(job_id)
+            chunks, finished = _job_events(job, sent)
+            for chunk in chunks:
+                yield chunk
+            if finished:
+                return
+            # Comment line keeps proxies from closing an idle stream
+            yield ": ping\n\n"
+            await asyncio.sleep(JOB_STREAM_POLL)
+        yield _sse('timeout', {})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    """
+    Upstream governor, LLM cache, single-flight, JSON repair, extraction, graph index and dashboard cache counters for this process.
+    """
+    if not (settings.DEBUG or request.user.is_staff):
+        return JsonResponse({'status': 'error', 'message': 'Forbidden'}, status=403)
+    return JsonResponse({
+        'status': 'success',
+        'upstream': governor.metrics(),
+        'llm_cache': llm_cache.stats(),
+        'single_flight': singleflight.stats(),
+        'json_repair': json_repair.stats(),
+        'extraction': extraction.stats(),
+        'graph_index': graph_query.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+    })
+
 
 @csrf_exempt
 def register_view(request):
@@ -258,6 +265,7 @@ def register_view(request):
             # Create Mongo Student
             student = Student(username=username)
             student.save()
+            student_context.remember(student)
             
             # Piggy complaint logic (Simple stub)
             complaint = f"Wow, {major}? Sounds tasty but tough!"
@@ -281,6 +289,7 @@ def login_view(request):
                 login(request, user)
                 try:
                     student = Student.objects.get(username=username)
+                    student_context.remember(student) # logging in refreshes the cached profile
                     return JsonResponse({
                         'status': 'success', 
                         'username': username,
@@ -290,6 +299,7 @@ def login_view(request):
                     # Auto-create if missing (legacy/error recovery)
                     student = Student(username=username)
                     student.save()
+                    student_context.remember(student)
                     return JsonResponse({
                         'status': 'success', 
                         'username': username,
@@ -303,15 +313,12 @@ def login_view(request):
 
 def check_auth_view(request):
     if request.user.is_authenticated:
-        try:
-            student = Student.objects.get(username=request.user.username)
-            return JsonResponse({
-                'is_authenticated': True,
-                'username': request.user.username,
-                'thinking_type': student.thinking_type
-            })
-        except Student.DoesNotExist:
-            return JsonResponse({'is_authenticated': True, 'username': request.user.username, 'thinking_type': None})
+        # From the cached student profile; Mongo is only read on a cache miss
+        return JsonResponse({
+            'is_authenticated': True,
+            'username': request.user.username,
+            'thinking_type': request.student_profile.get('thinking_type')
+        })
     return JsonResponse({'is_authenticated': False})
 
 def logout_view(request):
@@ -322,10 +329,20 @@ def logout_view(request):
 def get_task_details_view(request):
     task_id = request.GET.get('id')
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects(id=task_id).only(
+            'id', 'content', 'status', 'course', 'course_name', 'course_icon').no_dereference().get()
+        course_name, course_icon = task.course_name, task.course_icon
+        if course_name is None and task.course:
+            # Tasks from before the course snapshot: fetch just the label fields
+            course_id = task.course.id
+            course = prefetch.prefetch([task], 'course', only=('name', 'icon')).get(course_id)
+            course_name, course_icon = (course.name, course.icon) if course else (None, None)
         return JsonResponse({
             'status': 'success',
-            'task': {'id': str(task.id), 'content': task.content, 'status': task.status, 'course_name': task.course.name, 'course_icon': task.course.icon}
+            'task': {
+                'id': str(task.id), 'content': task.content, 'status': task.status,
+                'course_name': course_name, 'course_icon': course_icon,
+            }
         })
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)})
@@ -335,58 +352,213 @@ def get_dashboard_data_view(request):
     if not request.user.is_authenticated:
          return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
     
-    student = Student.objects.get(username=request.user.username)
-    course = Course.objects.filter(owner=student).order_by('-created_at').first()
+    # Served from the materialized payload until a write invalidates it (no Mongo query).
+    # The payload only sees DASHBOARD_PARAMS, so the variant covers everything it depends on.
+    params = {k: request.GET.get(k, '') for k in DASHBOARD_PARAMS}
+    variant = urlencode(params)
+    entry = dashboard_cache.get_or_build(request.user.username, variant, lambda: _dashboard_payload(request, params))
+    return dashboard_cache.respond(request, entry)
+
+DASHBOARD_PARAMS = ('graph_course', 'graph_version', 'graph_detail', 'shape', 'edge', 'node', 'hops')
+
+def _dashboard_payload(request, params):
+    student = student_context.current_student(request)
+    course = queries.latest_course(student).first()
     if not course:
-         return JsonResponse({'status': 'error', 'message': 'No course'})
+         return {'status': 'error', 'message': 'No course'}
          
-    graph = Graph.objects.filter(course=course).order_by('-created_at').first()
+    # Laid out for the student's thinking type by save_graph / set_thinking_type
+    graph = graph_store.current(course)
     # Flexible date filter or just take latest batch
-    tasks = Task.objects.filter(course=course).order_by('-date')[:5] # Simple fetch latest 5 for demo
+    # The latest generation's batch; courses generated before batches show their latest 5 tasks
+    batch = queries.latest_batch(course).first()
+    tasks = queries.batch_tasks(batch) if batch else queries.recent_tasks(course)[:5]
     
     tasks_data = [{'id': str(t.id), 'content': t.content, 'status': t.status, 'is_completed': t.is_completed} for t in tasks]
     
-    return JsonResponse({
+    # A client holding an earlier version of this course's graph only gets the changes
+    since = _client_graph_version(params, course)
+    if not since and params['graph_detail'] == 'overview' and graph and len(graph.nodes) > graph_query.GRAPH_OVERVIEW_MIN_NODES:
+        # First paint of a large graph: collapsed overview, expanded on demand via /api/graph_subgraph/
+        try:
+            graph_data = _graph_view_payload(graph_query.load(course), params, student.thinking_type)
+        except (KeyError, ValueError) as e:
+            # A stale `node` or a bad `hops` from the client; not cached (only successes are)
+            return {'status': 'error', 'message': e.args[0]}
+    else:
+        graph_data = graph_store.changes_since(course, graph, since)
+    graph_data['course_id'] = str(course.id)
+    
+    return {
         'status': 'success',
         'thinking_type': student.thinking_type,
-        'graph': {
-            'nodes': graph.nodes if graph else [],
-            'edges': graph.edges if graph else []
-        },
-        'tasks': tasks_data
-    })
+        'graph': graph_data,
+        'tasks': tasks_data,
+        'batch': task_store.batch_state(batch) if batch else None,
+    }
+
+def _client_graph_version(params, course):
+    if params.get('graph_course') != str(course.id):
+        return 0
+    try:
+        return int(params.get('graph_version') or 0)
+    except ValueError:
+        return 0
+
+def graph_delta_view(request):
+    """
+    Changes to a course graph since `since` (a version the client holds):
+    unchanged, a list of deltas to apply in order, or the full snapshot.
+    """
+    if not request.user.is_authenticated:
+         return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+    
+    try:
+        student = student_context.current_student(request)
+        course_id = request.GET.get('course')
+        if course_id:
+            course = queries.owned_course(student, course_id).get()
+        else:
+            course = queries.latest_course(student).first()
+        if not course:
+            return JsonResponse({'status': 'error', 'message': 'No course'})
+        since = int(request.GET.get('since', 0))
+        graph_data = graph_store.changes_since(course, graph_store.current(course), since)
+        graph_data['course_id'] = str(course.id)
+        return JsonResponse({'status': 'success', 'graph': graph_data})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+def _graph_view_payload(index, params, thinking_type):
+    shapes = set(filter(None, params.get('shape', '').split(',')))
+    edge_classes = set(filter(None, params.get('edge', '').lower().split(',')))
+    node_id = params.get('node')
+    if node_id:
+        nodes, edges = graph_query.expand(index, node_id, params.get('hops') or 1, shapes, edge_classes)
+    else:
+        nodes, edges = graph_query.overview(index, thinking_type, shapes, edge_classes)
+    return {
+        'version': index.version,
+        'layout': index.layout,
+        'partial': True,
+        'nodes': nodes,
+        'edges': edges,
+        'total_nodes': len(index.nodes),
+        'total_edges': len(index.edges),
+    }
+
+def graph_subgraph_view(request):
+    """
+    Part of a course graph: the collapsed overview, or with `node` the
+    `hops`-neighbourhood of that node. Optional filters: `shape` (node
+    shapes) and `edge` (edge classes: 'cross' or a colour), comma-separated.
+    """
+    if not request.user.is_authenticated:
+         return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+    
+    try:
+        student = student_context.current_student(request)
+        course_id = request.GET.get('course')
+        if course_id:
+            course = queries.owned_course(student, course_id).get()
+        else:
+            course = queries.latest_course(student).first()
+        index = graph_query.load(course) if course else None
+        if index is None:
+            return JsonResponse({'status': 'error', 'message': 'No graph'})
+        graph_data = _graph_view_payload(index, request.GET, student.thinking_type)
+        graph_data['course_id'] = str(course.id)
+        return JsonResponse({'status': 'success', 'graph': graph_data})
+    except KeyError as e:
+        return JsonResponse({'status': 'error', 'message': e.args[0]}, status=404)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': e.args[0]}, status=400)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
 
 @csrf_exempt
 def complete_task_view(request):
     if request.method == 'POST':
+        if not request.user.is_authenticated:
+             return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
         data = json.loads(request.body)
         task_id = data.get('task_id')
         status = data.get('status', 'completed')
         
         try:
-            task = Task.objects.get(id=task_id)
-            task.status = status
-            task.is_completed = (status == 'completed')
-            task.save()
+            student = student_context.current_student(request)
+            results, batches, legacy_courses = task_store.apply_statuses(
+                [{'task_id': task_id, 'status': status}], owner=student)
+            outcome = results[0]['outcome']
+            if outcome in ('invalid', 'not_found'):
+                return JsonResponse({'status': 'error', 'message': f"Task {task_id}: {outcome}"})
             
-            # Check if all relevant tasks are done
-            # For demo, check the tasks returned in dashboard (latest batch)
-            all_tasks = Task.objects.filter(course=task.course).order_by('-date')[:5]
-            all_done = all([t.is_completed or t.status == 'skipped' for t in all_tasks])
-            
-            return JsonResponse({'status': 'success', 'all_done': all_done})
+            # Check if all relevant tasks are done (the batch counters, no task scan)
+            return JsonResponse({'status': 'success', 'all_done': task_store.all_done(batches, legacy_courses)})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error'})
 
+@csrf_exempt
+def complete_tasks_view(request):
+    """
+    Batch status change: {"updates": [{"task_id", "status"}, ...]} applied in
+    one bulk write. Returns per-task outcomes and whether the batches are done.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    if not request.user.is_authenticated:
+         return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+    
+    try:
+        data = json.loads(request.body)
+        updates = data.get('updates') or []
+        if not isinstance(updates, list) or len(updates) > task_store.MAX_BATCH_UPDATES:
+            return JsonResponse({'status': 'error', 'message': f"updates must be a list of at most {task_store.MAX_BATCH_UPDATES} items"}, status=400)
+        student = student_context.current_student(request)
+        results, batches, legacy_courses = task_store.apply_statuses(updates, owner=student)
+        return JsonResponse({
+            'status': 'success',
+            'results': results,
+            'batches': batches,
+            'all_done': task_store.all_done(batches, legacy_courses),
+        })
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
 @csrf_exempt
 def get_results_view(request):
     if not request.user.is_authenticated:
          return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
-    student = Student.objects.get(username=request.user.username)
+    student = queries.student_by_username(request.user.username, ('id', 'carrots')).get()
     
-    # Simple calculation
-    tasks = Task.objects.filter(owner=student, is_completed=True).order_by('-date')[:5]
-    earned = len(tasks)
+    # Pre-aggregated: today's StudyStats row and the carrot balance, whatever the task history
+    today = study_stats.today(student)
     
-    return JsonResponse({'status': 'success', 'carrots': earned, 'total_carrots': student.carrots + earned})
+    return JsonResponse({
+        'status': 'success',
+        'carrots': today['completed'] * study_stats.CARROTS_PER_TASK,
+        'total_carrots': student.carrots,
+        'streak': study_stats.streak(student),
+    })
+
+def get_stats_view(request):
+    """
+    Profile statistics: carrots, streak, today's and the last `days` days'
+    totals and per-course completions, all from the daily StudyStats rows.
+    """
+    if not request.user.is_authenticated:
+         return JsonResponse({'status': 'error', 'message': 'Not authenticated'})
+    
+    try:
+        student = queries.student_by_username(request.user.username, ('id', 'carrots')).get()
+        days = max(1, min(int(request.GET.get('days', 7)), study_stats.STREAK_MAX_DAYS))
+        return JsonResponse({
+            'status': 'success',
+            'carrots': student.carrots,
+            'streak': study_stats.streak(student),
+            'today': study_stats.today(student),
+            'recent': study_stats.totals(student, days),
+        })
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
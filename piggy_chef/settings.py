@@ -51,6 +51,82 @@ try:
 except Exception as e:
     print(f"MongoDB connection failed: {e}")
 
+# Background jobs (api/jobs.py)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_IDEMPOTENCY_WINDOW = int(os.environ.get('JOB_IDEMPOTENCY_WINDOW', 600)) # seconds
+JOB_STREAM_TIMEOUT = int(os.environ.get('JOB_STREAM_TIMEOUT', 300)) # seconds an SSE stream stays open (ASGI)
+JOB_STREAM_WSGI_TIMEOUT = int(os.environ.get('JOB_STREAM_WSGI_TIMEOUT', 20)) # under WSGI, before clients fall back to polling
+
+# Parallel AI stages (api/stage_graph.py), deadlines in seconds
+STAGE_WORKERS = int(os.environ.get('STAGE_WORKERS', 8))
+STAGE_DEADLINES = {
+    'structure': float(os.environ.get('STAGE_DEADLINE_STRUCTURE', 150)),
+    'cross_links': float(os.environ.get('STAGE_DEADLINE_CROSS_LINKS', 60)),
+    'tasks': float(os.environ.get('STAGE_DEADLINE_TASKS', 60)),
+}
+
+# Long syllabi are split into chunks processed in parallel (api/chunking.py)
+SYLLABUS_MAX_CHARS = int(os.environ.get('SYLLABUS_MAX_CHARS', 200000))
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 3000)) # structure extraction
+REFINE_CHUNK_MAX_TOKENS = int(os.environ.get('REFINE_CHUNK_MAX_TOKENS', 8000))
+CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS', 8))
+
+# Upload text extraction (api/extraction.py)
+EXTRACT_MAX_PAGES = int(os.environ.get('EXTRACT_MAX_PAGES', 300))
+EXTRACT_MAX_CHARS = int(os.environ.get('EXTRACT_MAX_CHARS', SYLLABUS_MAX_CHARS))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 20)) # smaller PDFs are parsed in-process
+SYLLABUS_CLEANING = os.environ.get('SYLLABUS_CLEANING', 'true').lower() in ('1', 'true', 'yes') # local dehydration before refinement (api/cleaning.py)
+EXTRACT_TRACE_MEMORY = os.environ.get('EXTRACT_TRACE_MEMORY', '').lower() in ('1', 'true', 'yes') # profiling only: serializes uploads
+
+# Near-duplicate uploads reuse an earlier refinement and base graph (api/similarity.py)
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.9))
+
+# Cross-link candidates picked from the per-student concept index (api/concepts.py)
+CROSS_LINK_TOP_COURSES = int(os.environ.get('CROSS_LINK_TOP_COURSES', 5))
+CROSS_LINK_TOP_CONCEPTS = int(os.environ.get('CROSS_LINK_TOP_CONCEPTS', 30)) # per course
+
+# Versioned course graphs (api/graph_store.py): deltas kept per course before compaction
+GRAPH_DELTA_RETENTION = int(os.environ.get('GRAPH_DELTA_RETENTION', 10))
+
+# Server-side node coordinates (api/layout.py); larger graphs fall back to client physics
+LAYOUT_MAX_NODES = int(os.environ.get('LAYOUT_MAX_NODES', 1500))
+LAYOUT_ITERATIONS = int(os.environ.get('LAYOUT_ITERATIONS', 300))
+
+# Level-of-detail graph queries (api/graph_query.py)
+GRAPH_OVERVIEW_MIN_NODES = int(os.environ.get('GRAPH_OVERVIEW_MIN_NODES', 150)) # larger graphs first paint as an overview
+GRAPH_OVERVIEW_HUBS = int(os.environ.get('GRAPH_OVERVIEW_HUBS', 12)) # divergent overview size
+GRAPH_INDEX_CACHE_SIZE = int(os.environ.get('GRAPH_INDEX_CACHE_SIZE', 64)) # indexed graph versions per process
+
+# Ark / Doubao client (api/llm_client.py), loaded once per process
+ARK_API_KEY = os.environ.get('ARK_API_KEY', '')
+ARK_BASE_URL = os.environ.get('ARK_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+DOUBAO_ENDPOINT_ID = os.environ.get('DOUBAO_ENDPOINT_ID', 'doubao-seed-1-6-flash-250828')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 120)) # seconds
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 10))
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', 20))
+LLM_MAX_KEEPALIVE = int(os.environ.get('LLM_MAX_KEEPALIVE', 10))
+LLM_RECORD_DIR = os.environ.get('LLM_RECORD_DIR', '') # capture real prompt/response pairs as mock fixtures
+
+# Upstream governor (api/governor.py): per-stage rate/concurrency limits and circuit breaker.
+# Keys: rate, burst, min_concurrency, max_concurrency, initial_concurrency, target_latency, timeout, queue_timeout
+LLM_STAGE_LIMITS = {
+    'refine': {'rate': 2.0, 'burst': 5, 'max_concurrency': 8},
+    'extract': {'rate': 4.0, 'burst': 8, 'max_concurrency': 12},
+    'tasks': {'rate': 4.0, 'burst': 8, 'timeout': 60.0},
+    'cross_links': {'rate': 4.0, 'burst': 8, 'timeout': 60.0},
+}
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_RESET = float(os.environ.get('LLM_BREAKER_RESET', 30)) # seconds
+
+# LLM response cache (api/llm_cache.py)
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1') != '0'
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600)) # seconds
+LLM_CACHE_LOCAL_SIZE = int(os.environ.get('LLM_CACHE_LOCAL_SIZE', 256))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 5000))
+LLM_LEASE_SECONDS = int(os.environ.get('LLM_LEASE_SECONDS', 180)) # single-flight lease (api/singleflight.py)
+
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -58,6 +134,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.student_context.StudentMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +163,26 @@ WSGI_APPLICATION = 'piggy_chef.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Materialized dashboard payloads (api/dashboard_cache.py). The default in-process cache
+# is fine for a single process; point DASHBOARD_CACHE_BACKEND/LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) when job workers run elsewhere.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': os.environ.get('DASHBOARD_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DASHBOARD_CACHE_LOCATION', 'dashboard'),
+    },
+    'students': {
+        # Shared by all worker processes on the host, so invalidation reaches every one of them
+        'BACKEND': os.environ.get('STUDENT_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('STUDENT_CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache' / 'students')),
+    },
+}
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 600)) # seconds
+STUDENT_CACHE_TTL = int(os.environ.get('STUDENT_CACHE_TTL', 600)) # seconds
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
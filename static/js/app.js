@@ -1 +1,43 @@
 console.log("Piggy Chef App Initialized");
+
+// Poll a background job until it finishes.
+// onProgress(job) is called on every poll so pages can show the current stage.
+async function waitForJob(jobId, onProgress, intervalMs = 1500) {
+    while (true) {
+        const res = await fetch(`/api/job_status/?id=${jobId}`);
+        const data = await res.json();
+        if (data.status !== 'success') {
+            throw new Error(data.message || 'Job lookup failed');
+        }
+        const job = data.job;
+        if (onProgress) onProgress(job);
+        if (job.status === 'succeeded') return job.result;
+        if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+// Subscribe to a job's server-sent events (/api/job_stream/).
+// handlers: {stage, refine, nodes} for progress. Resolves with the job result.
+function streamJob(jobId, handlers = {}) {
+    if (!window.EventSource) {
+        return waitForJob(jobId, handlers.stage);
+    }
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/api/job_stream/?id=${jobId}`);
+        const on = (name, fn) => source.addEventListener(name, e => fn(JSON.parse(e.data)));
+
+        on('stage', data => handlers.stage && handlers.stage(data));
+        on('refine', data => handlers.refine && handlers.refine(data));
+        on('nodes', data => handlers.nodes && handlers.nodes(data.nodes));
+        on('done', data => { source.close(); resolve(data.result); });
+        on('failed', data => { source.close(); reject(new Error(data.error || 'Job failed')); });
+        on('timeout', () => { source.close(); waitForJob(jobId, handlers.stage).then(resolve, reject); });
+        source.onerror = () => {
+            // Stream dropped (proxy, network): fall back to polling
+            if (source.readyState === EventSource.CLOSED) return;
+            source.close();
+            waitForJob(jobId, handlers.stage).then(resolve, reject);
+        };
+    });
+}
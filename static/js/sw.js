@@ -1,4 +1,4 @@
-const CACHE_NAME = 'piggy-chef-v1';
+const CACHE_NAME = 'piggy-chef-v3';
 const urlsToCache = [
   '/',
   '/login/',